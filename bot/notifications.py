@@ -0,0 +1,203 @@
+import asyncio
+import logging
+import os
+import time
+from collections import defaultdict, OrderedDict
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, delete, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from telegram import Bot
+from telegram.error import Forbidden, RetryAfter, TelegramError
+from pizzeria_db.database import AsyncSessionLocal
+from order_cache import event_handlers
+from pizzeria_db import models
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "5"))
+# Через сколько секунд забранную, но не разосланную пачку можно забрать снова
+OUTBOX_CLAIM_SECONDS = float(os.getenv("OUTBOX_CLAIM_SECONDS", "300"))
+# Ограничения Telegram: ~30 сообщений в секунду всего и ~1 в секунду в один чат
+TELEGRAM_MESSAGES_PER_SECOND = float(os.getenv("TELEGRAM_MESSAGES_PER_SECOND", "25"))
+TELEGRAM_CHAT_INTERVAL_SECONDS = float(os.getenv("TELEGRAM_CHAT_INTERVAL_SECONDS", "1"))
+KNOWN_SUBSCRIPTIONS_SIZE = 50000
+
+# Будит рассыльщика, когда сервер сообщил о смене статуса
+outbox_wakeup = asyncio.Event()
+event_handlers.append(
+    lambda event: event.get("event") == "status_changed" and outbox_wakeup.set()
+)
+
+
+class RateLimiter:
+    # Общий token bucket на все чаты плюс минимальный интервал между
+    # сообщениями в один чат
+    def __init__(self, per_second: float, chat_interval: float):
+        self.per_second = per_second
+        self.chat_interval = chat_interval
+        self.tokens = per_second
+        self.updated = time.monotonic()
+        self.next_for_chat = {}
+
+    async def wait(self, chat_id: int):
+        delay = self.next_for_chat.get(chat_id, 0) - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.per_second, self.tokens + (now - self.updated) * self.per_second)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                break
+            await asyncio.sleep((1 - self.tokens) / self.per_second)
+        self.next_for_chat[chat_id] = time.monotonic() + self.chat_interval
+        if len(self.next_for_chat) > 10000:
+            now = time.monotonic()
+            self.next_for_chat = {chat: at for chat, at in self.next_for_chat.items() if at > now}
+
+
+# Пары (order_hash, chat_id), уже записанные в БД этим процессом
+known_subscriptions = OrderedDict()
+
+
+def insert_ignoring_duplicates(db: AsyncSession):
+    if db.bind.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(models.OrderSubscription)
+
+
+async def subscribe(chat_id: int, order_hash: str):
+    # Чат, спросивший о заказе, получает все следующие смены его статуса
+    key = (order_hash, chat_id)
+    if key in known_subscriptions:
+        known_subscriptions.move_to_end(key)
+        return
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            insert_ignoring_duplicates(db)
+            .values(order_hash=order_hash, chat_id=chat_id)
+            .on_conflict_do_nothing(index_elements=["order_hash", "chat_id"])
+        )
+        await db.commit()
+    known_subscriptions[key] = True
+    if len(known_subscriptions) > KNOWN_SUBSCRIPTIONS_SIZE:
+        known_subscriptions.popitem(last=False)
+
+
+def status_message(event: models.OrderStatusOutbox) -> str:
+    return f"Заказ {event.order_hash}\nНовый статус: {event.status}"
+
+
+def retry_delay(error: RetryAfter) -> float:
+    # В разных версиях python-telegram-bot retry_after - число или timedelta
+    delay = error.retry_after
+    return delay.total_seconds() if hasattr(delay, "total_seconds") else float(delay)
+
+
+async def send_to_chat(bot: Bot, limiter: RateLimiter, chat_id: int, messages) -> bool:
+    # False - бот заблокирован в чате, подписки чата можно удалить.
+    # RetryAfter - просьба подождать, а не отказ: сообщение повторяется, пока не уйдёт
+    for text in messages:
+        while True:
+            await limiter.wait(chat_id)
+            try:
+                await bot.send_message(chat_id=chat_id, text=text)
+                break
+            except RetryAfter as e:
+                await asyncio.sleep(retry_delay(e))
+            except Forbidden:
+                return False
+            except TelegramError:
+                logger.exception("Failed to notify chat %s", chat_id)
+                break
+    return True
+
+
+async def claim_outbox(db: AsyncSession, now: datetime):
+    # UPDATE ... WHERE id IN (SELECT ... FOR UPDATE SKIP LOCKED): несколько
+    # экземпляров бота забирают разные строки, блокировки живут до commit claim
+    outbox = models.OrderStatusOutbox
+    claimable = (
+        outbox.dispatched_at.is_(None),
+        or_(outbox.claimed_at.is_(None), outbox.claimed_at < now - timedelta(seconds=OUTBOX_CLAIM_SECONDS)),
+    )
+    batch = (
+        select(outbox.id)
+        .where(*claimable)
+        .order_by(outbox.id)
+        .limit(OUTBOX_BATCH_SIZE)
+        .with_for_update(skip_locked=True)
+    )
+    events = (await db.scalars(
+        update(outbox)
+        .where(outbox.id.in_(batch.scalar_subquery()), *claimable)
+        .values(claimed_at=now)
+        .returning(outbox)
+        .execution_options(synchronize_session=False)
+    )).all()
+    return sorted(events, key=lambda event: event.id)
+
+
+async def drain_outbox(bot: Bot, limiter: RateLimiter) -> int:
+    # Пачка забирается и фиксируется короткой транзакцией, рассылка идёт уже без
+    # открытой транзакции и блокировок (при лимитах Telegram это секунды), потом
+    # вторая короткая транзакция отмечает пачку разосланной. Если бот упадёт
+    # посреди рассылки, пачку через OUTBOX_CLAIM_SECONDS разошлют снова
+    async with AsyncSessionLocal() as db:
+        events = await claim_outbox(db, datetime.utcnow())
+        if not events:
+            await db.commit()
+            return 0
+        subscriptions = await db.execute(
+            select(models.OrderSubscription.order_hash, models.OrderSubscription.chat_id)
+            .where(models.OrderSubscription.order_hash.in_({event.order_hash for event in events}))
+        )
+        chats_by_order = defaultdict(list)
+        for order_hash, chat_id in subscriptions:
+            chats_by_order[order_hash].append(chat_id)
+        await db.commit()
+
+    messages_by_chat = defaultdict(list)
+    for event in events:
+        for chat_id in chats_by_order[event.order_hash]:
+            messages_by_chat[chat_id].append(status_message(event))
+
+    # Чаты обслуживаются параллельно, сообщения внутри чата - по порядку
+    chat_ids = list(messages_by_chat)
+    delivered = await asyncio.gather(*(
+        send_to_chat(bot, limiter, chat_id, messages_by_chat[chat_id]) for chat_id in chat_ids
+    ))
+    blocked = [chat_id for chat_id, ok in zip(chat_ids, delivered) if not ok]
+
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(models.OrderStatusOutbox)
+            .where(models.OrderStatusOutbox.id.in_([event.id for event in events]))
+            .values(dispatched_at=datetime.utcnow())
+        )
+        if blocked:
+            await db.execute(
+                delete(models.OrderSubscription)
+                .where(models.OrderSubscription.chat_id.in_(blocked))
+            )
+        await db.commit()
+    return len(events)
+
+
+async def run_dispatcher(bot: Bot):
+    limiter = RateLimiter(TELEGRAM_MESSAGES_PER_SECOND, TELEGRAM_CHAT_INTERVAL_SECONDS)
+    while True:
+        try:
+            while await drain_outbox(bot, limiter) == OUTBOX_BATCH_SIZE:
+                pass
+        except Exception:
+            logger.exception("Failed to dispatch order status notifications")
+        try:
+            await asyncio.wait_for(outbox_wakeup.wait(), OUTBOX_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        outbox_wakeup.clear()
\ No newline at end of file
@@ -0,0 +1,93 @@
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+from pizzeria_db import listen
+
+logger = logging.getLogger(__name__)
+
+ORDER_CACHE_SIZE = int(os.getenv("ORDER_CACHE_SIZE", "10000"))
+ORDER_CACHE_TTL_SECONDS = float(os.getenv("ORDER_CACHE_TTL_SECONDS", "300"))
+
+# Отличает "заказа нет" (тоже кэшируется) от промаха кэша
+NOT_FOUND = object()
+
+# Дополнительные обработчики событий заказов: callback(event: dict)
+event_handlers = []
+
+
+class OrderCache:
+    # LRU с TTL: order_hash -> снимок заказа. Кэш включён, только пока живо
+    # LISTEN-соединение: без push-инвалидации данные могли бы устареть
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.enabled = False
+        # Растёт при каждой инвалидации: снимок, прочитанный до уведомления, не кладём
+        self.epoch = 0
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, order_hash: str):
+        entry = self._entries.get(order_hash) if self.enabled else None
+        if entry is None or entry[0] < time.monotonic():
+            self._entries.pop(order_hash, None)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(order_hash)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, order_hash: str, order_info: Optional[dict], epoch: int):
+        if not self.enabled or epoch != self.epoch:
+            return
+        value = NOT_FOUND if order_info is None else order_info
+        self._entries[order_hash] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(order_hash)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, order_hash: str):
+        self.invalidations += 1
+        self.epoch += 1
+        self._entries.pop(order_hash, None)
+
+    def disable(self):
+        self.enabled = False
+        self.epoch += 1
+        self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+order_cache = OrderCache(ORDER_CACHE_SIZE, ORDER_CACHE_TTL_SECONDS)
+
+
+def on_order_event(event: dict):
+    order_hash = event.get("order_hash")
+    if order_hash is None:
+        logger.warning("Order event without order_hash: %r", event)
+        return
+    order_cache.invalidate(order_hash)
+    for handler in event_handlers:
+        handler(event)
+
+
+async def listen_order_events(database_url: str):
+    # Кэш включён, только пока живо LISTEN-соединение; при обрыве он выключается
+    # и очищается до переподключения
+    async def on_connect(reconnected: bool):
+        order_cache.enabled = True
+
+    await listen.listen_order_events(database_url, on_order_event, on_connect, order_cache.disable)
\ No newline at end of file
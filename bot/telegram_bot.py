@@ -1,3 +1,4 @@
+import asyncio
 import logging
 from typing import Dict
 from telegram import Update
@@ -8,41 +9,66 @@ from telegram.ext import (
     ContextTypes,
     filters
 )
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-import models
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
+from pizzeria_db import models
 from dotenv import load_dotenv
 import os
-from database import SessionLocal, engine
+from pizzeria_db.database import (
+    AsyncSessionLocal, RecentWrites, async_engine, reads_replica, replica_engines, SQLALCHEMY_DATABASE_URL,
+)
+from order_cache import order_cache, listen_order_events, event_handlers, NOT_FOUND
+from notifications import subscribe, run_dispatcher
 
 load_dotenv()
 TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+# Сколько сообщений обрабатывается одновременно
+BOT_CONCURRENT_UPDATES = int(os.getenv("BOT_CONCURRENT_UPDATES", "64"))
 
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO
 )
 logger = logging.getLogger(__name__)
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# Заказы, изменённые в последние секунды, читаются с primary: иначе снимок
+# с отстающей реплики попал бы в кэш уже после инвалидации
+recent_orders = RecentWrites()
+event_handlers.append(lambda event: recent_orders.wrote((event["order_hash"],)))
 
 async def get_order_info(order_hash: str) -> Dict:
-    db = next(get_db())
-    
-    order = db.query(models.Order)\
-             .filter(models.Order.order_hash == order_hash)\
-             .first()
+    # Повторные запросы того же заказа обслуживаются из кэша, который
+    # сбрасывается уведомлениями сервера об изменении заказа
+    cached = order_cache.get(order_hash)
+    if cached is not None:
+        return None if cached is NOT_FOUND else cached
+
+    epoch = order_cache.epoch
+    order_info = await load_order_info(order_hash)
+    order_cache.put(order_hash, order_info, epoch)
+    return order_info
+
+async def find_order(db, order_hash: str):
+    result = await db.scalars(
+        select(models.Order)
+        .options(joinedload(models.Order.items))
+        .where(models.Order.order_hash == order_hash)
+    )
+    return result.unique().first()
+
+async def load_order_info(order_hash: str) -> Dict:
+    # Заказ и его позиции одним запросом с JOIN; сессия закрывается сразу после него.
+    # Заказ, которого нет на реплике, мог быть создан только что - проверяем primary
+    async with recent_orders.sessions_for(order_hash)() as db:
+        order = await find_order(db, order_hash)
+        on_replica = reads_replica(db)
+    if not order and on_replica:
+        async with AsyncSessionLocal() as db:
+            order = await find_order(db, order_hash)
     
     if not order:
         return None
     
-    items = db.query(models.OrderItem)\
-             .filter(models.OrderItem.order_id == order.id)\
-             .all()
+    items = order.items
     
     return {
         "id": order.id,
@@ -76,8 +102,10 @@ async def handle_order_id(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             response = (
                 f"Заказ ID: {order_info['id']}\n"
                 f"Статус: {order_info['status']}\n"
-                f"Товары:\n{items_text}"
+                f"Товары:\n{items_text}\n\n"
+                f"Мы напишем, когда статус заказа изменится."
             )
+            await subscribe(update.effective_chat.id, order_hash)
         else:
             response = "Заказ не найден или у вас нет к нему доступа."
             
@@ -85,8 +113,30 @@ async def handle_order_id(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     except ValueError:
         await update.message.reply_text("Пожалуйста, отправьте корректный ID заказа (число).")
 
+async def startup(application: Application) -> None:
+    application.bot_data["order_events"] = asyncio.create_task(
+        listen_order_events(SQLALCHEMY_DATABASE_URL)
+    )
+    application.bot_data["dispatcher"] = asyncio.create_task(run_dispatcher(application.bot))
+
+async def shutdown(application: Application) -> None:
+    for name in ("order_events", "dispatcher"):
+        task = application.bot_data.get(name)
+        if task is not None:
+            task.cancel()
+    logger.info("Order cache stats: %s", order_cache.stats())
+    logger.info("Read routing stats: %s", recent_orders.stats())
+    await async_engine.dispose()
+    for replica in replica_engines:
+        await replica.dispose()
+
 def main() -> None:
-    application = Application.builder().token(TOKEN).build()
+    application = Application.builder()\
+        .token(TOKEN)\
+        .concurrent_updates(BOT_CONCURRENT_UPDATES)\
+        .post_init(startup)\
+        .post_shutdown(shutdown)\
+        .build()
 
     # Регистрируем обработчики
     application.add_handler(CommandHandler("start", start))
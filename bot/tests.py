@@ -0,0 +1,174 @@
+import asyncio
+from datetime import datetime, timedelta
+import pytest
+from telegram.error import Forbidden, RetryAfter
+from pizzeria_db.database import SessionLocal, async_engine
+from pizzeria_db import models
+from pizzeria_db.migrate import upgrade
+import notifications
+import order_cache
+from order_cache import OrderCache, NOT_FOUND
+from notifications import RateLimiter, drain_outbox
+
+@pytest.fixture(scope="session", autouse=True)
+def schema():
+    upgrade()
+
+@pytest.fixture(scope="function")
+def db():
+    db = SessionLocal()
+    try:
+        db.query(models.OrderStatusOutbox).delete()
+        db.query(models.OrderSubscription).delete()
+        db.commit()
+        yield db
+    finally:
+        db.rollback()
+        db.close()
+
+class FakeBot:
+    # Отвечает RetryAfter на первые retry_after_count отправок, заблокирован в чатах blocked
+    def __init__(self, retry_after_count=0, blocked=()):
+        self.retry_after_count = retry_after_count
+        self.blocked = set(blocked)
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        if chat_id in self.blocked:
+            raise Forbidden("bot was blocked by the user")
+        if self.retry_after_count:
+            self.retry_after_count -= 1
+            raise RetryAfter(0)
+        self.sent.append((chat_id, text))
+
+def drain(bot):
+    async def run():
+        try:
+            return await drain_outbox(bot, RateLimiter(1000, 0))
+        finally:
+            await async_engine.dispose()
+    return asyncio.run(run())
+
+def add_event(db, order_hash, status, **values):
+    event = models.OrderStatusOutbox(
+        order_id=1, order_hash=order_hash, status=status, created_at=datetime.utcnow(), **values
+    )
+    db.add(event)
+    return event
+
+def test_drain_outbox_retries_until_sent_and_marks_dispatched(db):
+    db.add_all([
+        models.OrderSubscription(order_hash="first", chat_id=1),
+        models.OrderSubscription(order_hash="first", chat_id=2),
+        models.OrderSubscription(order_hash="second", chat_id=2),
+    ])
+    add_event(db, "first", "cooking")
+    add_event(db, "second", "ready")
+    db.commit()
+
+    # Подряд несколько RetryAfter: сообщение всё равно уходит, а не теряется
+    bot = FakeBot(retry_after_count=3)
+    assert drain(bot) == 2
+
+    assert sorted(bot.sent) == sorted([
+        (1, "Заказ first\nНовый статус: cooking"),
+        (2, "Заказ first\nНовый статус: cooking"),
+        (2, "Заказ second\nНовый статус: ready"),
+    ])
+    db.expire_all()
+    events = db.query(models.OrderStatusOutbox).all()
+    assert all(event.claimed_at is not None and event.dispatched_at is not None for event in events)
+    assert drain(bot) == 0
+
+def test_drain_outbox_skips_fresh_claims_and_retakes_stale_ones(db):
+    # Свежую отметку держит другой экземпляр бота, просроченная - от упавшего
+    db.add(models.OrderSubscription(order_hash="taken", chat_id=1))
+    db.add(models.OrderSubscription(order_hash="stale", chat_id=1))
+    add_event(db, "taken", "cooking", claimed_at=datetime.utcnow())
+    stale_at = datetime.utcnow() - timedelta(seconds=notifications.OUTBOX_CLAIM_SECONDS + 60)
+    add_event(db, "stale", "cooking", claimed_at=stale_at)
+    db.commit()
+
+    bot = FakeBot()
+    assert drain(bot) == 1
+    assert bot.sent == [(1, "Заказ stale\nНовый статус: cooking")]
+    db.expire_all()
+    taken = db.query(models.OrderStatusOutbox).filter_by(order_hash="taken").one()
+    assert taken.dispatched_at is None
+
+def test_drain_outbox_drops_subscriptions_of_blocked_chats(db):
+    db.add(models.OrderSubscription(order_hash="first", chat_id=1))
+    db.add(models.OrderSubscription(order_hash="first", chat_id=2))
+    add_event(db, "first", "ready")
+    db.commit()
+
+    bot = FakeBot(blocked={2})
+    assert drain(bot) == 1
+    assert bot.sent == [(1, "Заказ first\nНовый статус: ready")]
+    db.expire_all()
+    assert [s.chat_id for s in db.query(models.OrderSubscription).all()] == [1]
+
+def enabled_cache(max_size=10, ttl_seconds=60):
+    cache = OrderCache(max_size, ttl_seconds)
+    cache.enabled = True
+    return cache
+
+def test_order_cache_get_put_and_lru_eviction():
+    cache = enabled_cache(max_size=2)
+    assert cache.get("a") is None
+    cache.put("a", {"id": 1}, cache.epoch)
+    cache.put("missing", None, cache.epoch)
+    assert cache.get("a") == {"id": 1}
+    # Отсутствующий заказ тоже кэшируется
+    assert cache.get("missing") is NOT_FOUND
+    cache.get("a")
+    cache.put("b", {"id": 2}, cache.epoch)
+    assert cache.get("missing") is None
+    assert cache.get("a") == {"id": 1}
+    assert cache.stats()["size"] == 2
+
+def test_order_cache_entries_expire():
+    cache = enabled_cache(ttl_seconds=0)
+    cache.put("a", {"id": 1}, cache.epoch)
+    assert cache.get("a") is None
+    assert cache.stats()["size"] == 0
+
+def test_order_cache_invalidate_rejects_put_with_stale_epoch():
+    cache = enabled_cache()
+    cache.put("a", {"id": 1}, cache.epoch)
+    # Снимок прочитан до уведомления, а положить его пытаются после
+    epoch = cache.epoch
+    cache.invalidate("a")
+    assert cache.get("a") is None
+    cache.put("a", {"id": 1, "status": "old"}, epoch)
+    assert cache.get("a") is None
+    cache.put("a", {"id": 1, "status": "new"}, cache.epoch)
+    assert cache.get("a") == {"id": 1, "status": "new"}
+    assert cache.stats()["invalidations"] == 1
+
+def test_order_cache_disable_clears_and_stops_caching():
+    cache = enabled_cache()
+    cache.put("a", {"id": 1}, cache.epoch)
+    epoch = cache.epoch
+    cache.disable()
+    assert cache.get("a") is None
+    cache.put("a", {"id": 1}, cache.epoch)
+    assert cache.stats()["size"] == 0
+    # После переподключения LISTEN снимок, прочитанный до обрыва, не принимается
+    cache.enabled = True
+    cache.put("a", {"id": 1}, epoch)
+    assert cache.get("a") is None
+
+def test_order_event_invalidates_cache_and_reaches_handlers(monkeypatch):
+    cache = enabled_cache()
+    monkeypatch.setattr(order_cache, "order_cache", cache)
+    received = []
+    monkeypatch.setattr(order_cache, "event_handlers", [received.append])
+    cache.put("a", {"id": 1}, cache.epoch)
+
+    order_cache.on_order_event({"event": "status_changed", "order_hash": "a"})
+    # Событие без order_hash пропускается, а не роняет слушателя
+    order_cache.on_order_event({"event": "status_changed"})
+
+    assert cache.get("a") is None
+    assert received == [{"event": "status_changed", "order_hash": "a"}]
\ No newline at end of file
@@ -1,4 +1,4 @@
-import React, { useState } from 'react';
+import React, { useState, useRef, useEffect } from 'react';
 import axios from 'axios';
 import { useAuth } from '../context/AuthContext';
 import CartItem from './CartItem';
@@ -7,19 +7,28 @@ const Cart = ({ items, totalPrice, onUpdateQuantity, onRemoveItem, onClose }) =>
   const [isLoading, setIsLoading] = useState(false);
   const [orderSuccess, setOrderSuccess] = useState(false);
   const [error, setError] = useState(null);
+  // Один ключ на попытку оформления: повторное нажатие после таймаута не создаст второй заказ
+  const idempotencyKey = useRef(null);
+
+  // Изменённая корзина - это уже другой заказ
+  useEffect(() => {
+    idempotencyKey.current = null;
+  }, [items]);
 
   const handleCheckout = async () => {
     if (!items.length) return;
     
     setIsLoading(true);
     setError(null);
+    if (!idempotencyKey.current) {
+      idempotencyKey.current = crypto.randomUUID();
+    }
     
     try {
       const orderData = {
         items: items.map(item => ({
           pizza_name: item.name,
-          quantity: item.quantity,
-          price: item.price
+          quantity: item.quantity
         }))
       };
 
@@ -29,6 +38,7 @@ const Cart = ({ items, totalPrice, onUpdateQuantity, onRemoveItem, onClose }) =>
       const response = await axios.post(`${process.env.REACT_APP_SERVER_IP}:8000/orders/`, orderData, {
         headers: {
           'Authorization': `Bearer ${token}`,
+          'Idempotency-Key': idempotencyKey.current,
           'access-control-allow-credentials':	true,
           'Access-Control-Allow-Origin': '*',
           'Content-Type': 'application/json'
@@ -36,6 +46,7 @@ const Cart = ({ items, totalPrice, onUpdateQuantity, onRemoveItem, onClose }) =>
       });
 
       if (response.status === 200) {
+        idempotencyKey.current = null;
         setOrderSuccess(true);
         setTimeout(() => {
           items.forEach(item => onRemoveItem(item.id));
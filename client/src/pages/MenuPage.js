@@ -1,16 +1,19 @@
-import React, { useState } from 'react';
+import React, { useState, useEffect } from 'react';
+import axios from 'axios';
 import Header from '../components/Header';
 import MenuItem from '../components/MenuItem';
 import Cart from '../components/Cart';
 import '../styles.css';
 
 const MenuPage = () => {
-  const [menuItems] = useState([
-    { id: 1, name: 'Маргарита', price: 350, description: 'Томатный соус, моцарелла, базилик' },
-    { id: 2, name: 'Пепперони', price: 450, description: 'Томатный соус, моцарелла, пепперони' },
-    { id: 3, name: 'Гавайская', price: 400, description: 'Томатный соус, моцарелла, курица, ананас' },
-    { id: 4, name: 'Четыре сыра', price: 500, description: 'Сливочный соус, моцарелла, пармезан, дор блю, чеддер' },
-  ]);
+  const [menuItems, setMenuItems] = useState([]);
+
+  useEffect(() => {
+    // Браузер сам повторяет запрос с If-None-Match и получает 304, если меню не менялось
+    axios.get(`${process.env.REACT_APP_SERVER_IP}:8000/menu`)
+      .then(response => setMenuItems(response.data))
+      .catch(err => console.error('Не удалось загрузить меню:', err));
+  }, []);
 
   const [cartItems, setCartItems] = useState([]);
   const [isCartOpen, setIsCartOpen] = useState(false);
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import axios from 'axios';
 import { useAuth } from '../context/AuthContext';
 import { Link } from 'react-router-dom';
@@ -9,15 +9,23 @@ const OrdersPage = () => {
   const [orders, setOrders] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
-  const [removingItems, setRemovingItems] = useState({});
+  const [removalNotice, setRemovalNotice] = useState(null);
+  const [hasMore, setHasMore] = useState(false);
+  const [loadingMore, setLoadingMore] = useState(false);
 
-  const fetchOrders = async () => {
+  const requestOrders = (params = {}) => {
+    const token = localStorage.getItem('access_token');
+    return axios.get(`${process.env.REACT_APP_SERVER_IP}:8000/orders/`, {
+      headers: { Authorization: `Bearer ${token}` },
+      params
+    });
+  };
+
+  const fetchOrders = async (afterId = null) => {
     try {
-      const token = localStorage.getItem('access_token');
-      const response = await axios.get(`${process.env.REACT_APP_SERVER_IP}:8000/orders/`, {
-        headers: { Authorization: `Bearer ${token}` }
-      });
-      setOrders(response.data);
+      const response = await requestOrders(afterId ? { after_id: afterId } : {});
+      setOrders(prevOrders => afterId ? [...prevOrders, ...response.data] : response.data);
+      setHasMore(Boolean(response.headers['x-next-cursor']));
     } catch (err) {
       setError(err.response?.data?.detail || 'Не удалось загрузить заказы');
     } finally {
@@ -25,45 +33,155 @@ const OrdersPage = () => {
     }
   };
 
+  // Первая страница заново, уже подгруженные «Показать ещё» заказы остаются
+  const mergeLatest = async () => {
+    try {
+      const response = await requestOrders();
+      const page = response.data;
+      const pageHasMore = Boolean(response.headers['x-next-cursor']);
+      setOrders(prevOrders => {
+        if (!pageHasMore) return page;
+        const oldest = page[page.length - 1].id;
+        return [...page, ...prevOrders.filter(order => order.id < oldest)];
+      });
+      if (!pageHasMore) setHasMore(false);
+    } catch (err) {
+      console.error('Error refreshing orders:', err);
+    }
+  };
+
+  // Один заказ: страница из одного заказа с id меньше orderId + 1
+  const refreshOrder = async (orderId) => {
+    try {
+      const response = await requestOrders({ after_id: orderId + 1, limit: 1 });
+      const fresh = response.data.find(order => order.id === orderId);
+      setOrders(prevOrders => {
+        const rest = prevOrders.filter(order => order.id !== orderId);
+        return fresh ? [...rest, fresh].sort((a, b) => b.id - a.id) : rest;
+      });
+    } catch (err) {
+      console.error('Error refreshing order:', err);
+    }
+  };
+
+  const loadMore = async () => {
+    setLoadingMore(true);
+    await fetchOrders(orders[orders.length - 1].id);
+    setLoadingMore(false);
+  };
+
   useEffect(() => {
     fetchOrders();
   }, []);
 
-  const handleRemoveItem = async (itemId, orderId) => {
-    try {
-      setRemovingItems(prev => ({ ...prev, [itemId]: true }));
+  // Изменения заказов приходят с сервера (SSE) вместо перезагрузки страницы
+  useEffect(() => {
+    let source = null;
+    let reconnectTimer = null;
+    let opened = false;
+
+    const refreshFromEvent = (e) => refreshOrder(JSON.parse(e.data).order_id);
+
+    const connect = () => {
+      // EventSource не передаёт заголовки, поэтому токен идёт в строке запроса
       const token = localStorage.getItem('access_token');
-      
-      await axios.delete(`${process.env.REACT_APP_SERVER_IP}:8000/order-items/${itemId}`, {
-        headers: { Authorization: `Bearer ${token}` }
+      source = new EventSource(
+        `${process.env.REACT_APP_SERVER_IP}:8000/orders/events?token=${encodeURIComponent(token)}`
+      );
+      source.onopen = () => {
+        // После переподключения события за время обрыва потеряны
+        if (opened) mergeLatest();
+        opened = true;
+      };
+      source.addEventListener('status_changed', (e) => {
+        const { order_id, status } = JSON.parse(e.data);
+        setOrders(prevOrders => prevOrders.map(order => (
+          order.id === order_id ? { ...order, status } : order
+        )));
       });
+      source.addEventListener('created', refreshFromEvent);
+      source.addEventListener('item_changed', refreshFromEvent);
+      source.addEventListener('deleted', refreshFromEvent);
+      source.onerror = () => {
+        // Закрытый поток (например, истёк токен) переоткрываем со свежим токеном
+        if (source.readyState === EventSource.CLOSED) {
+          reconnectTimer = setTimeout(connect, 5000);
+        }
+      };
+    };
 
-      setOrders(prevOrders => {
-        return prevOrders.map(order => {
-          if (order.id === orderId) {
-            const updatedItems = order.items.map(item => {
-              if (item.id === itemId) {
-                return { ...item, quantity: item.quantity - 1 };
-              }
-              return item;
-            }).filter(item => item.quantity > 0);
-
-            if (updatedItems.length === 0) return null;
-            return { ...order, items: updatedItems };
-          }
-          return order;
-        }).filter(Boolean);
-      });
+    connect();
+    return () => {
+      clearTimeout(reconnectTimer);
+      if (source) source.close();
+    };
+  }, []);
+
+  // Клики по «Удалить» копятся и уходят одним запросом на /order-items/decrement
+  const pendingRemovals = useRef({});
+  const flushTimer = useRef(null);
+
+  const flushRemovals = async () => {
+    const batch = pendingRemovals.current;
+    pendingRemovals.current = {};
+    flushTimer.current = null;
+    const items = Object.entries(batch).map(([itemId, { quantity }]) => ({
+      item_id: Number(itemId),
+      quantity
+    }));
+    // Заказы, которые показаны без снятых позиций, перечитываются, если удаление не прошло
+    const restore = (itemIds) => {
+      new Set(itemIds.map(itemId => batch[itemId].orderId)).forEach(refreshOrder);
+    };
 
+    try {
+      const token = localStorage.getItem('access_token');
+      const response = await axios.post(`${process.env.REACT_APP_SERVER_IP}:8000/order-items/decrement`, { items }, {
+        headers: { Authorization: `Bearer ${token}` }
+      });
+      // Позиция могла уйти на кухню или исчезнуть раньше: сервер отвечает по каждой отдельно
+      const failed = response.data.results.filter(result => result.message === 'Item not found');
+      if (failed.length > 0) {
+        setRemovalNotice(`Не удалось удалить позиций: ${failed.length}. Заказ уже изменился.`);
+        restore(failed.map(result => result.item_id));
+      } else {
+        setRemovalNotice(null);
+      }
     } catch (err) {
-      setError('Не удалось удалить позицию');
-      console.error('Error removing item:', err);
-      fetchOrders();
-    } finally {
-      setRemovingItems(prev => ({ ...prev, [itemId]: false }));
+      setRemovalNotice('Не удалось удалить позицию');
+      console.error('Error removing items:', err);
+      restore(items.map(item => item.item_id));
     }
   };
 
+  const handleRemoveItem = (itemId, orderId) => {
+    const pending = pendingRemovals.current[itemId];
+    pendingRemovals.current[itemId] = { orderId, quantity: (pending ? pending.quantity : 0) + 1 };
+
+    setOrders(prevOrders => {
+      return prevOrders.map(order => {
+        if (order.id === orderId) {
+          const removed = order.items.find(item => item.id === itemId);
+          const updatedItems = order.items.map(item => {
+            if (item.id === itemId) {
+              return { ...item, quantity: item.quantity - 1 };
+            }
+            return item;
+          }).filter(item => item.quantity > 0);
+
+          if (updatedItems.length === 0) return null;
+          // Сумму считает сервер; локально только вычитаем снятую пиццу до следующей загрузки
+          const total = removed ? order.total - removed.price : order.total;
+          return { ...order, items: updatedItems, total };
+        }
+        return order;
+      }).filter(Boolean);
+    });
+
+    clearTimeout(flushTimer.current);
+    flushTimer.current = setTimeout(flushRemovals, 400);
+  };
+
   if (loading) return <div className="loading">Загрузка...</div>;
   if (error) return <div className="error">{error}</div>;
 
@@ -72,6 +190,7 @@ const OrdersPage = () => {
       <h1>Ваши заказы</h1>
       <p>Вы можете отслеживать свои заказы также в Телеграм по уникальному номеру. @mireapizzabot</p>
       <Link to="/" className="back-link">← Вернуться к меню</Link>
+      {removalNotice && <p className="notice">{removalNotice}</p>}
       
       {orders.length === 0 ? (
         <p className="no-orders">Заказов не найдено</p>
@@ -94,7 +213,7 @@ const OrdersPage = () => {
                 <h3>Позиции:</h3>
                 <ul>
                   {order.items.map(item => (
-                    <li key={item.id} className={`order-item ${removingItems[item.id] ? 'removing' : ''}`}>
+                    <li key={item.id} className="order-item">
                       <div className="item-info">
                         <span>{item.pizza_name}</span>
                         <span>{item.quantity} × {item.price} ₽ = {item.quantity * item.price} ₽</span>
@@ -102,9 +221,8 @@ const OrdersPage = () => {
                       <button 
                         onClick={() => handleRemoveItem(item.id, order.id)}
                         className="remove-item-btn"
-                        disabled={removingItems[item.id]}
                       >
-                        {removingItems[item.id] ? 'Удаление...' : 'Удалить'}
+                        Удалить
                       </button>
                     </li>
                   ))}
@@ -112,10 +230,15 @@ const OrdersPage = () => {
               </div>
               
               <div className="order-total">
-                Итого: {order.items.reduce((sum, item) => sum + (item.price * item.quantity), 0)} ₽
+                Итого: {order.total} ₽
               </div>
             </div>
           ))}
+          {hasMore && (
+            <button className="load-more-btn" onClick={loadMore} disabled={loadingMore}>
+              {loadingMore ? 'Загрузка...' : 'Показать ещё'}
+            </button>
+          )}
         </div>
       )}
     </div>
@@ -0,0 +1,199 @@
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from hashing import PASSWORD_HASH_WORKERS
+
+# Лимиты входа: жетоны в секунду и запас (burst) на IP и на логин.
+# Ведро логина тратится только на неудачные попытки, чтобы перебор
+# по чужому логину не мешал входу по верному паролю сверх burst
+LOGIN_RATE_PER_IP = float(os.getenv("LOGIN_RATE_PER_IP", "0.5"))
+LOGIN_BURST_PER_IP = float(os.getenv("LOGIN_BURST_PER_IP", "20"))
+LOGIN_RATE_PER_USERNAME = float(os.getenv("LOGIN_RATE_PER_USERNAME", "0.1"))
+LOGIN_BURST_PER_USERNAME = float(os.getenv("LOGIN_BURST_PER_USERNAME", "10"))
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+RATE_LIMIT_KEY_LENGTH = 256
+
+# Общий шлюз для запросов с bcrypt: не больше LOGIN_MAX_CONCURRENT одновременно
+# (0 отключает), остальные ждут, пока ожидание не превысит LOGIN_MAX_QUEUE_DELAY_SECONDS
+LOGIN_MAX_CONCURRENT = int(os.getenv("LOGIN_MAX_CONCURRENT", str(2 * PASSWORD_HASH_WORKERS)))
+LOGIN_MAX_QUEUE_DELAY_SECONDS = float(os.getenv("LOGIN_MAX_QUEUE_DELAY_SECONDS", "0.5"))
+# Начальная оценка и сглаживание среднего времени обслуживания
+SERVICE_SECONDS_INITIAL = 0.1
+SERVICE_SECONDS_ALPHA = 0.1
+
+
+class Rejected(Exception):
+    status_code = 429
+
+    def __init__(self, detail: str, retry_after: float):
+        super().__init__(detail)
+        self.retry_after = retry_after
+
+    def headers(self) -> dict:
+        return {"Retry-After": str(max(1, math.ceil(self.retry_after)))}
+
+
+class RateLimited(Rejected):
+    status_code = 429
+
+
+class Overloaded(Rejected):
+    status_code = 503
+
+
+class TokenBucketLimiter:
+    # Ведро на ключ: rate жетонов в секунду, не больше burst. Ключей не больше
+    # max_keys: при переборе случайных логинов вытесняются давно не тронутые
+    # вёдра, а вытесненное ведро равносильно полному - зато память не растёт
+    def __init__(self, rate: float, burst: float, max_keys: int):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+
+    def _tokens(self, key: str, now: float) -> float:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return self.burst
+        tokens, updated = bucket
+        return min(self.burst, tokens + (now - updated) * self.rate)
+
+    def retry_after(self, key: str, now: float) -> float:
+        tokens = self._tokens(key, now)
+        return 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+
+    def take(self, key: str, now: float):
+        self._buckets[key] = (self._tokens(key, now) - 1, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class LoginLimits:
+    def __init__(self, per_ip: TokenBucketLimiter, per_username: TokenBucketLimiter):
+        self.per_ip = per_ip
+        self.per_username = per_username
+        self.rejected = 0
+
+    def check(self, ip: str, username: str):
+        now = time.monotonic()
+        username = username[:RATE_LIMIT_KEY_LENGTH]
+        retry_after = max(self.per_ip.retry_after(ip, now), self.per_username.retry_after(username, now))
+        if retry_after > 0:
+            self.rejected += 1
+            raise RateLimited("Too many login attempts", retry_after)
+        self.per_ip.take(ip, now)
+
+    def failed(self, username: str):
+        self.per_username.take(username[:RATE_LIMIT_KEY_LENGTH], time.monotonic())
+
+    def stats(self):
+        return {
+            "rate_limited_total": self.rejected,
+            "ip_buckets": len(self.per_ip),
+            "username_buckets": len(self.per_username),
+        }
+
+
+class ConcurrencyGate:
+    # Не больше limit запросов одновременно, остальные ждут по очереди (FIFO).
+    # Если по оценке (место в очереди / limit * среднее время обслуживания)
+    # ждать дольше max_delay, запрос сразу получает отказ, а не занимает воркер
+    def __init__(self, limit: int, max_delay: float):
+        self.limit = limit
+        self.max_delay = max_delay
+        self.active = 0
+        self._waiters = deque()
+        self.service_seconds = SERVICE_SECONDS_INITIAL
+        self.admitted = 0
+        self.shed = 0
+        self.timed_out = 0
+        self.max_wait_seconds = 0.0
+
+    def estimated_delay(self) -> float:
+        if self.active < self.limit and not self._waiters:
+            return 0.0
+        return (len(self._waiters) + 1) / self.limit * self.service_seconds
+
+    def _release(self):
+        # Слот переходит первому живому ожидающему, иначе освобождается
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    async def _acquire(self):
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return
+        delay = self.estimated_delay()
+        if delay > self.max_delay:
+            self.shed += 1
+            raise Overloaded("Server is busy, retry later", delay)
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(waiter, self.max_delay)
+        except BaseException as e:
+            # Слот мог быть передан в момент отмены - возвращаем его
+            if waiter.done() and not waiter.cancelled():
+                self._release()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                self.timed_out += 1
+                raise Overloaded("Server is busy, retry later", self.estimated_delay() or self.max_delay)
+            raise
+        self.max_wait_seconds = max(self.max_wait_seconds, time.perf_counter() - started)
+
+    @asynccontextmanager
+    async def slot(self):
+        if self.limit <= 0:
+            yield
+            return
+        await self._acquire()
+        self.admitted += 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.service_seconds += (elapsed - self.service_seconds) * SERVICE_SECONDS_ALPHA
+            self._release()
+
+    def stats(self):
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "waiting": len(self._waiters),
+            "admitted_total": self.admitted,
+            "shed_total": self.shed,
+            "timed_out_total": self.timed_out,
+            "service_seconds_avg": round(self.service_seconds, 6),
+            "wait_seconds_max": round(self.max_wait_seconds, 6),
+        }
+
+
+def default_login_limits() -> LoginLimits:
+    return LoginLimits(
+        TokenBucketLimiter(LOGIN_RATE_PER_IP, LOGIN_BURST_PER_IP, RATE_LIMIT_MAX_KEYS),
+        TokenBucketLimiter(LOGIN_RATE_PER_USERNAME, LOGIN_BURST_PER_USERNAME, RATE_LIMIT_MAX_KEYS),
+    )
+
+
+login_limits = default_login_limits()
+password_gate = ConcurrencyGate(LOGIN_MAX_CONCURRENT, LOGIN_MAX_QUEUE_DELAY_SECONDS)
+
+
+def stats():
+    # login_limits подменяется в тестах, поэтому читается через модуль при каждом вызове
+    return {**login_limits.stats(), **{f"gate_{name}": value for name, value in password_gate.stats().items()}}
\ No newline at end of file
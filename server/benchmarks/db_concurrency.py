@@ -0,0 +1,129 @@
+# Сравнение пропускной способности GET /orders/ с синхронной сессией
+# в async-обработчике (как было) и с AsyncSession (как стало).
+#
+# Запуск из каталога server:
+#   python -m benchmarks.db_concurrency --requests 2000 --concurrency 50
+# Без SQLALCHEMY_DATABASE_URL используется локальный SQLite-файл; показательные
+# цифры получаются на Postgres из docker-compose, где запрос ждёт сеть.
+import argparse
+import asyncio
+import os
+import time
+import uuid
+
+os.environ.setdefault("SQLALCHEMY_DATABASE_URL", "sqlite:///./bench.db")
+
+import httpx
+from fastapi import FastAPI
+from sqlalchemy.orm import selectinload
+
+from pizzeria_db.database import SessionLocal
+from pizzeria_db.migrate import upgrade
+from pizzeria_db import models
+import main
+
+
+def seed(orders: int) -> int:
+    db = SessionLocal()
+    try:
+        user = models.User(
+            username=f"bench_{uuid.uuid4().hex[:8]}",
+            hashed_password="-",
+        )
+        db.add(user)
+        db.flush()
+        for _ in range(orders):
+            order = models.Order(user_id=user.id, order_hash=str(uuid.uuid4()), total_kopecks=125000)
+            order.items = [
+                models.OrderItem(pizza_name="Маргарита", quantity=1, price_kopecks=35000),
+                models.OrderItem(pizza_name="Пепперони", quantity=2, price_kopecks=45000),
+            ]
+            db.add(order)
+        db.commit()
+        return user.id
+    finally:
+        db.close()
+
+
+def build_legacy_app(user_id: int) -> FastAPI:
+    # Прежняя схема: async def, внутри которого блокирующий Session
+    legacy = FastAPI()
+
+    @legacy.get("/orders/")
+    async def read_user_orders():
+        db = SessionLocal()
+        try:
+            orders = db.query(models.Order)\
+                       .options(selectinload(models.Order.items))\
+                       .filter(models.Order.user_id == user_id)\
+                       .order_by(models.Order.id.desc())\
+                       .limit(main.ORDERS_PAGE_SIZE)\
+                       .all()
+            return [
+                {"id": order.id, "items": [item.id for item in order.items]}
+                for order in orders
+            ]
+        finally:
+            db.close()
+
+    return legacy
+
+
+async def drive(app: FastAPI, headers: dict, requests: int, concurrency: int):
+    lag = 0.0
+    running = True
+
+    async def heartbeat():
+        # Максимальная задержка event loop показывает, насколько его блокируют
+        nonlocal lag
+        while running:
+            started = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lag = max(lag, time.perf_counter() - started - 0.001)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        queue = asyncio.Queue()
+        for _ in range(requests):
+            queue.put_nowait(None)
+
+        async def worker():
+            while not queue.empty():
+                queue.get_nowait()
+                response = await client.get("/orders/", headers=headers)
+                response.raise_for_status()
+
+        monitor = asyncio.create_task(heartbeat())
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        running = False
+        await monitor
+
+    return requests / elapsed, lag * 1000
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--orders", type=int, default=50)
+    args = parser.parse_args()
+
+    upgrade()
+    user_id = seed(args.orders)
+    token = main.create_access_token({"sub": str(user_id)})
+    headers = {"Authorization": f"Bearer {token}"}
+
+    for name, app, app_headers in (
+        ("sync Session (before)", build_legacy_app(user_id), {}),
+        ("AsyncSession (after)", main.app, headers),
+    ):
+        rps, lag_ms = asyncio.run(
+            drive(app, app_headers, args.requests, args.concurrency)
+        )
+        print(f"{name:<24} {rps:8.1f} req/s   max event loop lag {lag_ms:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,116 @@
+# Выгрузка заказов для бухгалтерии: время и пик памяти Python (tracemalloc)
+# при чтении курсором пачками (export.export_orders) и при загрузке всех
+# строк запроса разом, как делала бы выдача одним JSON-ответом.
+#
+# Запуск из каталога server:
+#   python -m benchmarks.export --orders 100000 200000
+import argparse
+import asyncio
+import os
+import random
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta
+
+os.environ.setdefault("SQLALCHEMY_DATABASE_URL", "sqlite:///./bench.db")
+
+from sqlalchemy import delete, insert, select
+
+from pizzeria_db.database import AsyncSessionLocal, async_engine, engine
+from pizzeria_db.migrate import upgrade
+from pizzeria_db import models
+from catalog import DEFAULT_MENU
+import export
+
+BATCH = 10_000
+# Выгружаемые заказы лежат в отдельном прошлом периоде, чтобы не смешиваться с другими прогонами
+SINCE = datetime(2001, 1, 1)
+UNTIL = SINCE + timedelta(days=300)
+
+
+def seed(orders: int):
+    rng = random.Random(42)
+    with engine.begin() as connection:
+        old = select(models.Order.id).where(models.Order.created_at < UNTIL)
+        connection.execute(delete(models.OrderItem).where(models.OrderItem.order_id.in_(old)))
+        connection.execute(delete(models.Order).where(models.Order.created_at < UNTIL))
+        user_id = connection.execute(
+            insert(models.User).values(username=f"bench_export_{uuid.uuid4().hex[:8]}", hashed_password="-")
+            .returning(models.User.id)
+        ).scalar_one()
+        for start in range(0, orders, BATCH):
+            rows = connection.execute(
+                insert(models.Order).returning(models.Order.id),
+                [
+                    {
+                        "user_id": user_id,
+                        "order_hash": str(uuid.uuid4()),
+                        "created_at": SINCE + timedelta(seconds=i * 60),
+                        "total_kopecks": 0,
+                    }
+                    for i in range(start, min(start + BATCH, orders))
+                ],
+            ).all()
+            connection.execute(insert(models.OrderItem), [
+                {
+                    "order_id": row.id,
+                    "pizza_name": pizza["name"],
+                    "quantity": rng.randint(1, 3),
+                    "price_kopecks": pizza["price_kopecks"],
+                }
+                for row in rows
+                for pizza in rng.sample(DEFAULT_MENU, 3)
+            ])
+
+
+async def streamed(fmt: str) -> int:
+    # Место в лимите выгрузок берёт обработчик; здесь его роль играет бенчмарк
+    slot = export.try_acquire()
+    size = 0
+    try:
+        async for chunk in export.export_orders(slot, fmt, SINCE, UNTIL):
+            size += len(chunk)
+    finally:
+        slot.release()
+    return size
+
+
+async def loaded(fmt: str) -> int:
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(export.rows_query(SINCE, UNTIL, None).execution_options(yield_per=None))).all()
+    if fmt == export.CSV:
+        body = export.csv_chunk(rows)
+    else:
+        body, _ = export.ndjson_chunk(rows, None)
+    return len(body)
+
+
+async def measure(read, fmt: str):
+    tracemalloc.start()
+    started = time.perf_counter()
+    size = await read(fmt)
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    await async_engine.dispose()
+    return elapsed, peak / 2**20, size / 2**20
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders", type=int, nargs="+", default=[100_000, 200_000])
+    parser.add_argument("--format", choices=[export.NDJSON, export.CSV], default=export.NDJSON)
+    args = parser.parse_args()
+
+    upgrade()
+    print(f"{'orders':>9}{'mode':>10}{'s':>8}{'rows/s':>10}{'peak, MB':>10}{'output, MB':>12}")
+    for orders in args.orders:
+        seed(orders)
+        for name, read in (("stream", streamed), ("load all", loaded)):
+            elapsed, peak, size = asyncio.run(measure(read, args.format))
+            print(f"{orders:>9}{name:>10}{elapsed:>8.2f}{orders * 3 / elapsed:>10.0f}{peak:>10.1f}{size:>12.1f}")
+
+
+if __name__ == "__main__":
+    main_cli()
\ No newline at end of file
@@ -0,0 +1,263 @@
+# Нагрузочный прогон горячих путей API: /token, /menu, GET и POST /orders/,
+# DELETE /order-items/{id}. Засевает N пользователей и M заказов, гоняет
+# каждый сценарий с заданной параллельностью и печатает p50/p95/p99, RPS
+# и число SQL-запросов на запрос. С --baseline сравнивает с сохранённым
+# прогоном и завершается с кодом 1 при регрессии.
+#
+# Запуск из каталога server:
+#   python -m benchmarks.hot_paths --users 50 --orders 2000 --requests 500 --concurrency 20 \
+#       --save-baseline benchmarks/baseline.json
+#   python -m benchmarks.hot_paths --users 50 --orders 2000 --requests 500 --concurrency 20 \
+#       --baseline benchmarks/baseline.json
+# По умолчанию приложение вызывается в процессе через ASGI, так считаются SQL-запросы.
+# С --url запросы идут в запущенный сервер; он должен смотреть в ту же базу
+# (SQLALCHEMY_DATABASE_URL), что и этот скрипт, который её засевает.
+# Базовый прогон имеет смысл только на той же машине и с теми же параметрами.
+# Все запросы идут с одного адреса, поэтому в процессе лимиты входа и шлюз bcrypt
+# отключаются (benchmarks.unlimited).
+# Запущенному серверу для сценария token нужны большие LOGIN_BURST_PER_IP
+# и LOGIN_BURST_PER_USERNAME и LOGIN_MAX_CONCURRENT=0.
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime
+
+os.environ.setdefault("SQLALCHEMY_DATABASE_URL", "sqlite:///./bench.db")
+
+import httpx
+from sqlalchemy import event, insert
+
+from pizzeria_db.database import async_engine, engine
+from pizzeria_db.migrate import upgrade
+from pizzeria_db import models
+from catalog import DEFAULT_MENU
+from hashing import pwd_context
+import main
+from benchmarks.unlimited import disable_login_admission
+
+PASSWORD = "bench-password"
+ITEM_QUANTITY = 1000
+SCENARIOS = ("token", "menu", "orders_get", "orders_post", "order_item_delete")
+METRICS = ("p50_ms", "p95_ms", "p99_ms", "rps", "queries_per_request")
+
+
+def seed(users: int, orders: int) -> dict:
+    # Пользователи и заказы вставляются пачками; у каждой позиции запас
+    # количества, чтобы сценарий удаления только уменьшал его
+    hashed = pwd_context.hash(PASSWORD)
+    run = uuid.uuid4().hex[:8]
+    with engine.begin() as connection:
+        rows = connection.execute(
+            insert(models.User).returning(models.User.id, models.User.username),
+            [{"username": f"bench_{run}_{i}", "hashed_password": hashed} for i in range(users)],
+        ).all()
+        user_ids = [row.id for row in rows]
+        margherita, pepperoni = DEFAULT_MENU[0], DEFAULT_MENU[1]
+        prices = [pizza["price_kopecks"] for pizza in (margherita, pepperoni)]
+        order_ids = connection.execute(
+            insert(models.Order).returning(models.Order.id, models.Order.user_id),
+            [
+                {
+                    "user_id": user_ids[i % users],
+                    "order_hash": str(uuid.uuid4()),
+                    "total_kopecks": sum(prices) * ITEM_QUANTITY,
+                    "created_at": datetime.utcnow(),
+                }
+                for i in range(orders)
+            ],
+        ).all()
+        items = connection.execute(
+            insert(models.OrderItem).returning(models.OrderItem.id, models.OrderItem.order_id),
+            [
+                {
+                    "order_id": order.id,
+                    "pizza_name": pizza["name"],
+                    "quantity": ITEM_QUANTITY,
+                    "price_kopecks": price,
+                }
+                for order in order_ids
+                for pizza, price in ((margherita, prices[0]), (pepperoni, prices[1]))
+            ],
+        ).all()
+    owner = {order.id: order.user_id for order in order_ids}
+    return {
+        "users": [(row.id, row.username) for row in rows],
+        "items": [(item.id, owner[item.order_id]) for item in items],
+    }
+
+
+def auth(user_id: int) -> dict:
+    return {"Authorization": f"Bearer {main.create_access_token({'sub': str(user_id)})}"}
+
+
+def build_requests(scenario: str, data: dict, count: int) -> list:
+    # Заранее готовые (метод, путь, kwargs), чтобы в замер не попадала подготовка
+    users, items = data["users"], data["items"]
+    if scenario == "token":
+        return [
+            ("POST", "/token", {"data": {"username": users[i % len(users)][1], "password": PASSWORD}})
+            for i in range(count)
+        ]
+    if scenario == "menu":
+        return [("GET", "/menu", {}) for _ in range(count)]
+    if scenario == "orders_get":
+        return [("GET", "/orders/", {"headers": auth(users[i % len(users)][0])}) for i in range(count)]
+    if scenario == "orders_post":
+        body = {"items": [
+            {"pizza_name": DEFAULT_MENU[0]["name"], "quantity": 1},
+            {"pizza_name": DEFAULT_MENU[2]["name"], "quantity": 2},
+        ]}
+        return [
+            ("POST", "/orders/", {
+                "json": body,
+                "headers": {**auth(users[i % len(users)][0]), "Idempotency-Key": str(uuid.uuid4())},
+            })
+            for i in range(count)
+        ]
+    if scenario == "order_item_delete":
+        if count > len(items) * (ITEM_QUANTITY - 1):
+            raise SystemExit("Not enough seeded items for order_item_delete, raise --orders")
+        return [
+            ("DELETE", f"/order-items/{items[i % len(items)][0]}", {"headers": auth(items[i % len(items)][1])})
+            for i in range(count)
+        ]
+    raise ValueError(scenario)
+
+
+def percentile(samples: list, p: int) -> float:
+    return statistics.quantiles(samples, n=100, method="inclusive")[p - 1]
+
+
+async def drive(client: httpx.AsyncClient, requests: list, concurrency: int, count_queries: bool) -> dict:
+    statements = 0
+
+    def before_cursor_execute(*args):
+        nonlocal statements
+        statements += 1
+
+    if count_queries:
+        event.listen(async_engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    latencies, failures = [], 0
+    pending = iter(requests)
+
+    async def worker():
+        nonlocal failures
+        for method, path, kwargs in pending:
+            started = time.perf_counter()
+            response = await client.request(method, path, **kwargs)
+            latencies.append(time.perf_counter() - started)
+            failures += response.status_code >= 400
+
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    finally:
+        if count_queries:
+            event.remove(async_engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+
+    latencies_ms = [latency * 1000 for latency in latencies]
+    return {
+        "p50_ms": round(percentile(latencies_ms, 50), 2),
+        "p95_ms": round(percentile(latencies_ms, 95), 2),
+        "p99_ms": round(percentile(latencies_ms, 99), 2),
+        "rps": round(len(requests) / elapsed, 1),
+        "queries_per_request": round(statements / len(requests), 2) if count_queries else None,
+        "failures": failures,
+    }
+
+
+async def run(args, data: dict) -> dict:
+    results = {}
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=60)
+    else:
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench")
+    async with client, main.lifespan(main.app):
+        for scenario in args.scenarios:
+            requests = build_requests(scenario, data, args.concurrency + args.requests)
+            # Прогрев: пул соединений, кэши меню и пользователей
+            await drive(client, requests[:args.concurrency], args.concurrency, False)
+            results[scenario] = await drive(client, requests[args.concurrency:], args.concurrency, not args.url)
+    # Соединения пула привязаны к event loop этого прогона
+    await async_engine.dispose()
+    return results
+
+
+def regressions(results: dict, baseline: dict, tolerance: float) -> list:
+    # Время и RPS сравниваются с допуском, число запросов к БД - строго
+    problems = []
+    for scenario, result in results.items():
+        before = baseline["results"].get(scenario)
+        if before is None:
+            continue
+        for metric in ("p50_ms", "p95_ms", "p99_ms"):
+            if result[metric] > before[metric] * (1 + tolerance):
+                problems.append(f"{scenario}: {metric} {before[metric]} -> {result[metric]}")
+        if result["rps"] < before["rps"] * (1 - tolerance):
+            problems.append(f"{scenario}: rps {before['rps']} -> {result['rps']}")
+        queries, queries_before = result["queries_per_request"], before["queries_per_request"]
+        if queries is not None and queries_before is not None and queries > queries_before + 0.05:
+            problems.append(f"{scenario}: queries_per_request {queries_before} -> {queries}")
+        if result["failures"] > before["failures"]:
+            problems.append(f"{scenario}: failures {before['failures']} -> {result['failures']}")
+    return problems
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--orders", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--url")
+    parser.add_argument("--baseline")
+    parser.add_argument("--save-baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    config = {
+        "database": engine.url.get_backend_name(),
+        "url": args.url,
+        "users": args.users,
+        "orders": args.orders,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+    }
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["config"] != config:
+            raise SystemExit(f"Baseline was recorded with {baseline['config']}, not {config}")
+
+    upgrade()
+    data = seed(args.users, args.orders)
+    disable_login_admission()
+    results = asyncio.run(run(args, data))
+
+    print(f"{'scenario':<20}" + "".join(f"{metric:>21}" for metric in METRICS) + f"{'failures':>10}")
+    for scenario, result in results.items():
+        print(f"{scenario:<20}" + "".join(f"{str(result[metric]):>21}" for metric in METRICS)
+              + f"{result['failures']:>10}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump({"config": config, "results": results}, f, indent=2, ensure_ascii=False)
+    if baseline is not None:
+        problems = regressions(results, baseline, args.tolerance)
+        for problem in problems:
+            print("REGRESSION", problem)
+        if problems:
+            sys.exit(1)
+        print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main_cli()
\ No newline at end of file
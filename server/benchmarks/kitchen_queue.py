@@ -0,0 +1,136 @@
+# Очередь кухни с десятками тысяч открытых заказов: время пересборки
+# очереди при старте и задержка POST /kitchen/claim при нескольких станциях.
+# С --no-heap каждый захват идёт запасным путём (ORDER BY created_at в базе),
+# без кучи в памяти и без учёта размера заказа.
+#
+# Запуск из каталога server:
+#   python -m benchmarks.kitchen_queue --open-orders 50000 --claims 2000 --stations 8
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta
+
+os.environ.setdefault("SQLALCHEMY_DATABASE_URL", "sqlite:///./bench.db")
+
+import httpx
+from sqlalchemy import insert, update
+
+from pizzeria_db.database import async_engine, engine
+from pizzeria_db.migrate import upgrade
+from pizzeria_db import models
+from catalog import DEFAULT_MENU
+import order_status
+import kitchen
+import main
+
+BATCH = 10_000
+
+
+def seed(open_orders: int) -> int:
+    # Прежние открытые заказы закрываются, чтобы очередь состояла только из засеянных
+    rng = random.Random(42)
+    now = datetime.utcnow()
+    with engine.begin() as connection:
+        connection.execute(
+            update(models.Order)
+            .where(models.Order.status == order_status.PREPARING)
+            .values(status=order_status.DELIVERED, station=None, claimed_at=None)
+        )
+        admin_id = connection.execute(
+            insert(models.User).values(username=f"bench_kitchen_{uuid.uuid4().hex[:8]}", hashed_password="-")
+            .returning(models.User.id)
+        ).scalar_one()
+        for start in range(0, open_orders, BATCH):
+            rows = connection.execute(
+                insert(models.Order).returning(models.Order.id),
+                [
+                    {
+                        "user_id": admin_id,
+                        "order_hash": str(uuid.uuid4()),
+                        "created_at": now - timedelta(seconds=rng.randrange(4 * 3600)),
+                    }
+                    for _ in range(start, min(start + BATCH, open_orders))
+                ],
+            ).all()
+            connection.execute(insert(models.OrderItem), [
+                {
+                    "order_id": row.id,
+                    "pizza_name": DEFAULT_MENU[0]["name"],
+                    "quantity": rng.randint(1, 6),
+                    "price_kopecks": DEFAULT_MENU[0]["price_kopecks"],
+                }
+                for row in rows
+            ])
+    return admin_id
+
+
+async def run(args, admin_id: int) -> dict:
+    headers = {"Authorization": f"Bearer {main.create_access_token({'sub': str(admin_id)})}"}
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench")
+    async with client, main.lifespan(main.app):
+        started = time.perf_counter()
+        await kitchen.rebuild()
+        rebuild_ms = (time.perf_counter() - started) * 1000
+
+        latencies, claimed = [], []
+        remaining = args.claims
+
+        async def station(name: str):
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                started = time.perf_counter()
+                response = await client.post("/kitchen/claim", headers=headers, json={"station": name})
+                latencies.append((time.perf_counter() - started) * 1000)
+                response.raise_for_status()
+                claimed.append(response.json()["order_id"])
+
+        await asyncio.gather(*(station(f"station-{i}") for i in range(args.stations)))
+    await async_engine.dispose()
+
+    latencies.sort()
+    quantiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "rebuild_ms": rebuild_ms,
+        "p50": quantiles[49],
+        "p95": quantiles[94],
+        "p99": quantiles[98],
+        "claims": len(claimed),
+        "duplicates": len(claimed) - len(set(claimed)),
+    }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--open-orders", type=int, default=50_000)
+    parser.add_argument("--claims", type=int, default=2000)
+    parser.add_argument("--stations", type=int, default=8)
+    parser.add_argument("--no-heap", action="store_true")
+    args = parser.parse_args()
+    if args.claims > args.open_orders:
+        raise SystemExit("--claims must not exceed --open-orders")
+
+    upgrade()
+    admin_id = seed(args.open_orders)
+    with engine.connect() as connection:
+        main.ADMIN_USERNAMES = {connection.scalar(
+            models.User.__table__.select().with_only_columns(models.User.username)
+            .where(models.User.id == admin_id)
+        )}
+    if args.no_heap:
+        kitchen.KITCHEN_CLAIM_ATTEMPTS = 0
+
+    result = asyncio.run(run(args, admin_id))
+    print(f"open orders {args.open_orders}, stations {args.stations}, "
+          f"claim path {'database only' if args.no_heap else 'heap + SKIP LOCKED'}")
+    print(f"queue rebuild {result['rebuild_ms']:.0f} ms")
+    print(f"claim p50 {result['p50']:.2f} ms, p95 {result['p95']:.2f} ms, p99 {result['p99']:.2f} ms")
+    print(f"claims {result['claims']}, duplicates {result['duplicates']}")
+
+
+if __name__ == "__main__":
+    main_cli()
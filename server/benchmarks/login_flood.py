@@ -0,0 +1,141 @@
+# Наплыв входов (перебор паролей с нескольких адресов) и задержка дешёвых
+# эндпоинтов /menu и GET /orders/ в это время: без ограничений и с лимитами
+# по IP/логину и шлюзом bcrypt из admission.py.
+#
+# Запуск из каталога server:
+#   python -m benchmarks.login_flood --duration 20 --concurrency 100 --ips 20 --customers 5
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import time
+import uuid
+from collections import Counter
+
+os.environ.setdefault("SQLALCHEMY_DATABASE_URL", "sqlite:///./bench.db")
+
+import httpx
+
+from pizzeria_db.database import SessionLocal, async_engine
+from pizzeria_db.migrate import upgrade
+from pizzeria_db import models
+from hashing import pwd_context
+import admission
+import main
+
+PASSWORD = "bench-password"
+
+
+def seed(users: int) -> list:
+    hashed = pwd_context.hash(PASSWORD)
+    db = SessionLocal()
+    try:
+        created = [models.User(username=f"bench_{uuid.uuid4().hex[:8]}", hashed_password=hashed)
+                   for _ in range(users)]
+        db.add_all(created)
+        db.commit()
+        return [(user.id, user.username) for user in created]
+    finally:
+        db.close()
+
+
+def percentile(samples: list, p: int) -> float:
+    return statistics.quantiles(samples, n=100, method="inclusive")[p - 1] * 1000
+
+
+async def flood(users: list, args) -> dict:
+    rng = random.Random(1)
+
+    def client_from(ip: str) -> httpx.AsyncClient:
+        return httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app, client=(ip, 40000)),
+                                 base_url="http://bench")
+
+    attackers = [client_from(f"10.0.0.{i + 1}") for i in range(args.ips)]
+    customers = [client_from(f"10.2.0.{i + 1}") for i in range(args.customers)]
+    probe_client = client_from("10.1.0.1")
+    probe_headers = {"Authorization": f"Bearer {main.create_access_token({'sub': str(users[0][0])})}"}
+    attack_statuses, customer_statuses = Counter(), Counter()
+    samples = {"customer /token": [], "/menu": [], "/orders/": []}
+    deadline = time.perf_counter() + args.duration
+
+    async def attacker(i: int):
+        # Перебор паролей по известным логинам; отказы атакующего не останавливают,
+        # пауза - задержка сети, иначе генератор нагрузки в том же процессе занял бы весь CPU
+        client = attackers[i % args.ips]
+        while time.perf_counter() < deadline:
+            username = users[rng.randrange(len(users))][1]
+            response = await client.post("/token", data={"username": username, "password": uuid.uuid4().hex})
+            attack_statuses[response.status_code] += 1
+            await asyncio.sleep(args.attacker_delay)
+
+    async def customer(i: int):
+        # Настоящий пользователь входит раз в полсекунды со своего адреса
+        client = customers[i]
+        username = users[i % len(users)][1]
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            response = await client.post("/token", data={"username": username, "password": PASSWORD})
+            samples["customer /token"].append(time.perf_counter() - started)
+            customer_statuses[response.status_code] += 1
+            await asyncio.sleep(0.5)
+
+    async def probe(path: str):
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            await probe_client.get(path, headers=probe_headers)
+            samples[path].append(time.perf_counter() - started)
+            await asyncio.sleep(0.01)
+
+    async with main.lifespan(main.app):
+        await asyncio.gather(
+            *(attacker(i) for i in range(args.concurrency)),
+            *(customer(i) for i in range(args.customers)),
+            *(probe(path) for path in ("/menu", "/orders/")),
+        )
+    for client in attackers + customers + [probe_client]:
+        await client.aclose()
+    # Соединения пула привязаны к event loop этого прогона
+    await async_engine.dispose()
+
+    return {
+        "attack": dict(sorted(attack_statuses.items())),
+        "customers": dict(sorted(customer_statuses.items())),
+        "latency": {
+            name: (percentile(values, 50), percentile(values, 99)) for name, values in samples.items()
+        },
+    }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--ips", type=int, default=20)
+    parser.add_argument("--customers", type=int, default=5)
+    parser.add_argument("--attacker-delay", type=float, default=0.5)
+    args = parser.parse_args()
+
+    upgrade()
+    users = seed(max(args.users, args.customers))
+    unlimited = admission.LoginLimits(
+        admission.TokenBucketLimiter(1e9, 1e9, admission.RATE_LIMIT_MAX_KEYS),
+        admission.TokenBucketLimiter(1e9, 1e9, admission.RATE_LIMIT_MAX_KEYS),
+    )
+    cases = [
+        ("no admission control", unlimited, admission.ConcurrencyGate(0, 0)),
+        ("limits + gate", admission.default_login_limits(),
+         admission.ConcurrencyGate(admission.LOGIN_MAX_CONCURRENT, admission.LOGIN_MAX_QUEUE_DELAY_SECONDS)),
+    ]
+    for name, limits, gate in cases:
+        admission.login_limits, admission.password_gate = limits, gate
+        result = asyncio.run(flood(users, args))
+        print(f"{name}: attack {result['attack']}, customers {result['customers']}")
+        print("   " + "   ".join(
+            f"{path} p50 {p50:.1f} ms p99 {p99:.1f} ms" for path, (p50, p99) in result["latency"].items()
+        ))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,116 @@
+# Пропускная способность /token при одновременных входах: bcrypt прямо в
+# event loop (как было) против пула потоков из hashing.py (как стало).
+# Параллельно измеряется задержка дешёвого /menu, которую и блокировал bcrypt.
+# Лимиты входа и шлюз bcrypt отключены: мерится хэширование, а не отказы 429/503.
+#
+# Запуск из каталога server:
+#   python -m benchmarks.login_throughput --logins 200 --concurrency 50
+import argparse
+import asyncio
+import os
+import statistics
+import time
+import uuid
+
+os.environ.setdefault("SQLALCHEMY_DATABASE_URL", "sqlite:///./bench.db")
+
+import httpx
+
+from pizzeria_db.database import SessionLocal, async_engine
+from pizzeria_db.migrate import upgrade
+from pizzeria_db import models
+from hashing import PasswordHasher, pwd_context, PASSWORD_HASH_WORKERS
+import main
+from benchmarks.unlimited import disable_login_admission
+
+PASSWORD = "bench-password"
+
+
+class InlineHasher(PasswordHasher):
+    # Прежнее поведение: хэш считается синхронно в потоке event loop
+    async def _run(self, fn, *args):
+        return fn(*args)
+
+
+def seed(users: int):
+    hashed = pwd_context.hash(PASSWORD)
+    db = SessionLocal()
+    try:
+        names = [f"bench_{uuid.uuid4().hex[:8]}" for _ in range(users)]
+        db.add_all(models.User(username=name, hashed_password=hashed) for name in names)
+        db.commit()
+        return names
+    finally:
+        db.close()
+
+
+async def drive(usernames, logins: int, concurrency: int):
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        pending = list(range(logins))
+        latencies = []
+        menu_latencies = []
+        done = False
+
+        async def worker():
+            while pending:
+                i = pending.pop()
+                started = time.perf_counter()
+                response = await client.post("/token", data={
+                    "username": usernames[i % len(usernames)],
+                    "password": PASSWORD,
+                })
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - started)
+
+        async def probe():
+            # Время от момента, когда запрос должен был уйти, до ответа
+            while not done:
+                started = time.perf_counter()
+                await asyncio.sleep(0.01)
+                await client.get("/menu")
+                menu_latencies.append(time.perf_counter() - started - 0.01)
+
+        prober = asyncio.create_task(probe())
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        done = True
+        await prober
+    # Соединения пула привязаны к event loop этого прогона
+    await async_engine.dispose()
+
+    return {
+        "logins_per_s": logins / elapsed,
+        "login_p50_ms": statistics.median(latencies) * 1000,
+        "menu_max_ms": max(menu_latencies) * 1000,
+    }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--logins", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+
+    upgrade()
+    usernames = seed(args.users)
+    disable_login_admission()
+    pooled = main.hasher
+    for name, hasher in (
+        ("inline bcrypt (before)", InlineHasher(pwd_context, 1)),
+        (f"thread pool x{PASSWORD_HASH_WORKERS} (after)", pooled),
+    ):
+        main.hasher = hasher
+        result = asyncio.run(drive(usernames, args.logins, args.concurrency))
+        print(
+            f"{name:<26} {result['logins_per_s']:7.1f} logins/s   "
+            f"login p50 {result['login_p50_ms']:7.1f} ms   "
+            f"/menu max {result['menu_max_ms']:7.1f} ms"
+        )
+    print("queue stats:", pooled.stats())
+
+
+if __name__ == "__main__":
+    main_cli()
\ No newline at end of file
@@ -0,0 +1,184 @@
+# Простаивающие подписчики /orders/events: сколько памяти сервера занимает
+# одно SSE-соединение при росте их числа и как быстро событие заказа
+# доходит до всех вкладок пользователя, пока открыты остальные соединения.
+#
+# Сервер запускается отдельным процессом uvicorn, RSS читается из /proc (только Linux).
+# Запуск из каталога server:
+#   python -m benchmarks.order_stream --connections 1000 2000 5000 --per-user 5
+# Каждое соединение - файловый дескриптор и у сервера, и у скрипта: ulimit -n
+# должен быть больше самого большого шага.
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+
+os.environ.setdefault("SQLALCHEMY_DATABASE_URL", "sqlite:///./bench.db")
+
+import httpx
+from sqlalchemy import insert
+
+from pizzeria_db.database import engine
+from pizzeria_db.migrate import upgrade
+from pizzeria_db import models
+from catalog import DEFAULT_MENU
+import main
+
+HOST = "127.0.0.1"
+
+
+def seed(users: int) -> list:
+    run = uuid.uuid4().hex[:8]
+    with engine.begin() as connection:
+        rows = connection.execute(
+            insert(models.User).returning(models.User.id),
+            [{"username": f"bench_{run}_{i}", "hashed_password": "-"} for i in range(users)],
+        ).all()
+    return [row.id for row in rows]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind((HOST, 0))
+        return sock.getsockname()[1]
+
+
+def rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    raise RuntimeError("VmRSS not found")
+
+
+class Subscribers:
+    def __init__(self, port: int):
+        self.port = port
+        self.tasks = []
+        self.writers = []
+        # user_id -> [начало, сколько вкладок ещё ждут, Event]
+        self.waiting = {}
+        self.connected_per_user = {}
+
+    async def open(self, user_id: int):
+        reader, writer = await asyncio.open_connection(HOST, self.port)
+        token = main.create_access_token({"sub": str(user_id)})
+        writer.write(f"GET /orders/events?token={token} HTTP/1.1\r\nHost: bench\r\n\r\n".encode())
+        await writer.drain()
+        status_line = await reader.readline()
+        if b" 200 " not in status_line:
+            raise SystemExit(f"Stream rejected: {status_line!r}")
+        while await reader.readline() not in (b"\r\n", b""):
+            pass
+        self.writers.append(writer)
+        self.connected_per_user[user_id] = self.connected_per_user.get(user_id, 0) + 1
+        self.tasks.append(asyncio.create_task(self.watch(reader, user_id)))
+
+    async def watch(self, reader, user_id: int):
+        # Ответ идёт chunked, но каждое событие целиком лежит в одном куске
+        while line := await reader.readline():
+            if b"event: created" not in line:
+                continue
+            waiting = self.waiting.get(user_id)
+            if waiting is None:
+                continue
+            waiting[1] -= 1
+            if waiting[1] == 0:
+                waiting[2].set()
+
+    async def close(self):
+        for writer in self.writers:
+            writer.close()
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+
+async def delivery_latencies(client: httpx.AsyncClient, subscribers: Subscribers, users: list, samples: int) -> list:
+    # От отправки POST /orders/ до получения события всеми вкладками владельца
+    body = {"items": [{"pizza_name": DEFAULT_MENU[0]["name"], "quantity": 1}]}
+    latencies = []
+    for i in range(samples):
+        user_id = users[i * len(users) // samples]
+        done = asyncio.Event()
+        started = time.perf_counter()
+        subscribers.waiting[user_id] = [started, subscribers.connected_per_user[user_id], done]
+        response = await client.post("/orders/", json=body, headers={
+            "Authorization": f"Bearer {main.create_access_token({'sub': str(user_id)})}",
+            "Idempotency-Key": str(uuid.uuid4()),
+        })
+        response.raise_for_status()
+        await asyncio.wait_for(done.wait(), 30)
+        latencies.append((time.perf_counter() - started) * 1000)
+        del subscribers.waiting[user_id]
+    return latencies
+
+
+async def run(args, server: subprocess.Popen, port: int, users: list):
+    async with httpx.AsyncClient(base_url=f"http://{HOST}:{port}", timeout=30) as client:
+        for _ in range(100):
+            try:
+                (await client.get("/menu")).raise_for_status()
+                break
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+        await asyncio.sleep(args.settle)
+        base = rss_mb(server.pid)
+        print(f"idle server RSS {base:.1f} MB")
+        print(f"{'connections':>12}{'RSS, MB':>10}{'KB/subscriber':>15}{'open, s':>9}"
+              f"{'delivery p50, ms':>18}{'p95, ms':>9}")
+
+        subscribers = Subscribers(port)
+        try:
+            for target in args.connections:
+                started = time.perf_counter()
+                pending = list(range(len(subscribers.writers), target))
+                while pending:
+                    batch, pending = pending[:args.batch], pending[args.batch:]
+                    await asyncio.gather(*(subscribers.open(users[i // args.per_user]) for i in batch))
+                opened = time.perf_counter() - started
+                await asyncio.sleep(args.settle)
+                rss = rss_mb(server.pid)
+                latencies = await delivery_latencies(client, subscribers, users[:target // args.per_user],
+                                                     args.samples)
+                p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0]
+                print(f"{target:>12}{rss:>10.1f}{(rss - base) * 1024 / target:>15.1f}{opened:>9.2f}"
+                      f"{statistics.median(latencies):>18.2f}{p95:>9.2f}")
+            metrics = (await client.get("/metrics")).text
+            print("\n".join(line for line in metrics.splitlines() if line.startswith("order_stream_")))
+        finally:
+            await subscribers.close()
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--connections", type=int, nargs="+", default=[1000, 2000, 5000])
+    parser.add_argument("--per-user", type=int, default=5)
+    parser.add_argument("--batch", type=int, default=200)
+    parser.add_argument("--samples", type=int, default=20)
+    parser.add_argument("--settle", type=float, default=1.0)
+    args = parser.parse_args()
+    args.connections.sort()
+    if args.per_user > main.order_stream.ORDER_STREAM_MAX_PER_USER:
+        raise SystemExit(f"--per-user exceeds ORDER_STREAM_MAX_PER_USER={main.order_stream.ORDER_STREAM_MAX_PER_USER}")
+
+    upgrade()
+    users = seed(-(-args.connections[-1] // args.per_user))
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", HOST, "--port", str(port), "--log-level", "warning"],
+        env={**os.environ, "SWEEP_INTERVAL_SECONDS": "0"},
+    )
+    try:
+        asyncio.run(run(args, server, port, users))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main_cli()
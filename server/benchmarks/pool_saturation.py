@@ -0,0 +1,94 @@
+# Поведение пула соединений при насыщении: N задач одновременно берут
+# соединение, выполняют запрос и держат транзакцию hold-ms миллисекунд.
+# Выводит пропускную способность, ожидание соединения и отказы по таймауту.
+#
+# Запуск из каталога server:
+#   DB_POOL_SIZE=5 DB_MAX_OVERFLOW=5 DB_POOL_TIMEOUT=2 \
+#       python -m benchmarks.pool_saturation --concurrency 10 20 40 80
+import argparse
+import asyncio
+import os
+import time
+
+os.environ.setdefault("SQLALCHEMY_DATABASE_URL", "sqlite:///./bench.db")
+
+from sqlalchemy import text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from pizzeria_db.database import AsyncSessionLocal, async_engine, pool_stats
+
+
+async def hold_connection(hold: float) -> bool:
+    try:
+        async with AsyncSessionLocal() as db:
+            await db.execute(text("SELECT 1"))
+            await asyncio.sleep(hold)
+        return True
+    except PoolTimeoutError:
+        return False
+
+
+async def run_level(concurrency: int, tasks: int, hold: float) -> dict:
+    before = pool_stats(async_engine)
+    peak = {"checked_out": 0, "overflow": 0}
+    done = False
+
+    async def sample():
+        while not done:
+            current = pool_stats(async_engine)
+            for key in peak:
+                peak[key] = max(peak[key], current[key])
+            await asyncio.sleep(0.005)
+
+    pending = list(range(tasks))
+    outcomes = []
+
+    async def worker():
+        while pending:
+            pending.pop()
+            outcomes.append(await hold_connection(hold))
+
+    sampler = asyncio.create_task(sample())
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    done = True
+    await sampler
+    after = pool_stats(async_engine)
+
+    checkouts = after["checkouts_total"] - before["checkouts_total"]
+    wait_seconds = after["wait_seconds_total"] - before["wait_seconds_total"]
+    return {
+        "ops_per_s": len(outcomes) / elapsed,
+        "avg_wait_ms": wait_seconds / checkouts * 1000 if checkouts else 0.0,
+        "max_wait_ms": after["wait_seconds_max"] * 1000,
+        "timeouts": outcomes.count(False),
+        **{f"peak_{key}": value for key, value in peak.items()},
+    }
+
+
+async def run(levels, tasks: int, hold: float):
+    stats = pool_stats(async_engine)
+    print(f"pool size {stats['size']}, hold {hold * 1000:.0f} ms, {tasks} checkouts per level")
+    for concurrency in levels:
+        result = await run_level(concurrency, tasks, hold)
+        print(
+            f"concurrency {concurrency:4d}: {result['ops_per_s']:8.1f} ops/s  "
+            f"avg wait {result['avg_wait_ms']:7.1f} ms  max wait {result['max_wait_ms']:7.1f} ms  "
+            f"peak checked out {result['peak_checked_out']:3d}  "
+            f"peak overflow {result['peak_overflow']:3d}  timeouts {result['timeouts']}"
+        )
+    await async_engine.dispose()
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[5, 15, 30, 60])
+    parser.add_argument("--tasks", type=int, default=300)
+    parser.add_argument("--hold-ms", type=float, default=20)
+    args = parser.parse_args()
+    asyncio.run(run(args.concurrency, args.tasks, args.hold_ms / 1000))
+
+
+if __name__ == "__main__":
+    main_cli()
\ No newline at end of file
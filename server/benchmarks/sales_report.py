@@ -0,0 +1,157 @@
+# Отчёты по продажам: разовый запрос по order_items (как делали руками)
+# против почасовых сводок из sales.py на синтетических данных.
+#
+# Запуск из каталога server:
+#   python -m benchmarks.sales_report --items 10000000 --days 90
+# Данные создаются один раз и переиспользуются, пока в базе столько же позиций.
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta
+
+os.environ.setdefault("SQLALCHEMY_DATABASE_URL", "sqlite:///./bench_sales.db")
+
+from sqlalchemy import func, insert, select, text
+
+from pizzeria_db.database import AsyncSessionLocal, async_engine, engine
+from pizzeria_db.migrate import upgrade
+from pizzeria_db import models
+from catalog import DEFAULT_MENU
+import sales
+
+BATCH = 50_000
+MAX_ITEMS_PER_ORDER = 5
+
+
+def seed(items: int, days: int):
+    # Заказы создаются ровно на границе часа, поэтому сводки собираются
+    # простым GROUP BY created_at одинаково для SQLite и Postgres
+    rng = random.Random(42)
+    start = sales.hour_of(datetime.utcnow()) - timedelta(days=days)
+    hours = days * 24
+    with engine.begin() as connection:
+        for table in (models.SalesHourly, models.SalesHourlyPizza, models.OrderItem, models.Order):
+            connection.execute(table.__table__.delete())
+        user_id = connection.execute(
+            insert(models.User).values(username=f"bench_{uuid.uuid4().hex[:8]}", hashed_password="-")
+            .returning(models.User.id)
+        ).scalar_one()
+        order_id = connection.scalar(select(func.coalesce(func.max(models.Order.id), 0)))
+
+    created = 0
+    while created < items:
+        orders, order_items = [], []
+        while len(order_items) < BATCH and created + len(order_items) < items:
+            order_id += 1
+            total = 0
+            for _ in range(rng.randint(1, MAX_ITEMS_PER_ORDER)):
+                pizza = rng.choice(DEFAULT_MENU)
+                quantity = rng.randint(1, 3)
+                price = pizza["price_kopecks"]
+                total += quantity * price
+                order_items.append({
+                    "order_id": order_id, "pizza_name": pizza["name"],
+                    "quantity": quantity, "price_kopecks": price,
+                })
+            orders.append({
+                "id": order_id, "user_id": user_id, "status": "Доставлен",
+                "order_hash": uuid.uuid4().hex, "total_kopecks": total,
+                "created_at": start + timedelta(hours=rng.randrange(hours)),
+            })
+        with engine.begin() as connection:
+            connection.execute(insert(models.Order), orders)
+            connection.execute(insert(models.OrderItem), order_items)
+        created += len(order_items)
+        print(f"\rseeded {created}/{items} items", end="", flush=True)
+    print()
+
+    with engine.begin() as connection:
+        connection.execute(text(
+            "INSERT INTO sales_hourly_pizza (hour, pizza_name, quantity, revenue_kopecks) "
+            "SELECT o.created_at, i.pizza_name, SUM(i.quantity), SUM(i.quantity * i.price_kopecks) "
+            "FROM order_items i JOIN orders o ON o.id = i.order_id GROUP BY o.created_at, i.pizza_name"
+        ))
+        connection.execute(text(
+            "INSERT INTO sales_hourly (hour, orders, revenue_kopecks) "
+            "SELECT created_at, COUNT(*), SUM(total_kopecks) FROM orders GROUP BY created_at"
+        ))
+
+
+async def adhoc_top_pizzas(db, since, until, limit):
+    quantity = func.sum(models.OrderItem.quantity).label("quantity")
+    rows = await db.execute(
+        select(models.OrderItem.pizza_name, quantity,
+               func.sum(models.OrderItem.quantity * models.OrderItem.price_kopecks))
+        .join(models.Order, models.Order.id == models.OrderItem.order_id)
+        .where(models.Order.created_at >= since, models.Order.created_at < until)
+        .group_by(models.OrderItem.pizza_name)
+        .order_by(quantity.desc())
+        .limit(limit)
+    )
+    return rows.all()
+
+
+async def adhoc_revenue_by_hour(db, since, until):
+    # created_at синтетических заказов уже выровнен по часу
+    return (await db.execute(
+        select(models.Order.created_at, func.count(), func.sum(models.Order.total_kopecks))
+        .where(models.Order.created_at >= since, models.Order.created_at < until)
+        .group_by(models.Order.created_at)
+    )).all()
+
+
+async def adhoc_average_basket(db, since, until):
+    return (await db.execute(
+        select(func.count(), func.avg(models.Order.total_kopecks))
+        .where(models.Order.created_at >= since, models.Order.created_at < until)
+    )).one()
+
+
+async def timed(fn, runs: int) -> float:
+    samples = []
+    for _ in range(runs):
+        async with AsyncSessionLocal() as db:
+            started = time.perf_counter()
+            await fn(db)
+            samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+async def run(days: int, runs: int):
+    until = sales.hour_of(datetime.utcnow()) + timedelta(hours=1)
+    since = until - timedelta(days=min(days, 30))
+    cases = [
+        ("top pizzas, 30 days", lambda db: adhoc_top_pizzas(db, since, until, 10),
+         lambda db: sales.top_pizzas(db, since, until, 10)),
+        ("revenue by hour", lambda db: adhoc_revenue_by_hour(db, since, until),
+         lambda db: sales.revenue_by_period(db, since, until, "hour")),
+        ("average basket", lambda db: adhoc_average_basket(db, since, until),
+         lambda db: sales.average_basket(db, since, until)),
+    ]
+    print(f"{'report':<22}{'order_items, ms':>18}{'rollups, ms':>14}")
+    for name, adhoc, rollup in cases:
+        print(f"{name:<22}{await timed(adhoc, runs):>18.1f}{await timed(rollup, runs):>14.1f}")
+    await async_engine.dispose()
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=10_000_000)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    upgrade()
+    with engine.connect() as connection:
+        existing = connection.scalar(select(func.count()).select_from(models.OrderItem))
+    if existing != args.items:
+        seed(args.items, args.days)
+    asyncio.run(run(args.days, args.runs))
+
+
+if __name__ == "__main__":
+    main_cli()
\ No newline at end of file
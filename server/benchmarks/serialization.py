@@ -0,0 +1,88 @@
+# Стоимость сериализации списка заказов в расчёте на один заказ:
+# прежний путь (ORM-объекты -> проверка schemas.OrderWithItems -> JSON pydantic)
+# против словарей из строк БД, которые ORJSONResponse кодирует без проверки.
+# База не нужна: объекты и словари строятся в памяти, замеряется только сериализация.
+#
+# Запуск из каталога server:
+#   python -m benchmarks.serialization --orders 100 --items 3
+import argparse
+import os
+import statistics
+import time
+import uuid
+from typing import List
+
+# Модели импортируют движок; подключения к базе не будет
+os.environ.setdefault("SQLALCHEMY_DATABASE_URL", "sqlite:///./bench.db")
+
+from pydantic import TypeAdapter
+
+from pizzeria_db import models
+from catalog import DEFAULT_MENU
+from responses import ORJSONResponse
+import schemas
+
+
+def build(orders: int, items: int):
+    orm_orders, dict_orders = [], []
+    item_id = 0
+    for order_id in range(1, orders + 1):
+        order = models.Order(
+            id=order_id, user_id=1, status="Принят", order_hash=str(uuid.uuid4()), total_kopecks=0,
+        )
+        row = {
+            "id": order.id, "user_id": order.user_id, "status": order.status,
+            "order_hash": order.order_hash, "total": 0, "items": [],
+        }
+        for i in range(items):
+            item_id += 1
+            pizza = DEFAULT_MENU[i % len(DEFAULT_MENU)]
+            price = pizza["price_kopecks"]
+            order.items.append(models.OrderItem(
+                id=item_id, order_id=order_id, pizza_name=pizza["name"], quantity=2, price_kopecks=price,
+            ))
+            order.total_kopecks += 2 * price
+            row["items"].append({
+                "pizza_name": pizza["name"], "quantity": 2, "id": item_id,
+                "order_id": order_id, "price": models.to_rubles(price),
+            })
+        row["total"] = order.total
+        orm_orders.append(order)
+        dict_orders.append(row)
+    return orm_orders, dict_orders
+
+
+def measure(fn, runs: int) -> float:
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples)
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders", type=int, default=100)
+    parser.add_argument("--items", type=int, default=3)
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args()
+
+    orm_orders, dict_orders = build(args.orders, args.items)
+    adapter = TypeAdapter(List[schemas.OrderWithItems])
+    # Так FastAPI обрабатывает возвращённые объекты при заданном response_model
+    validated = adapter.dump_json(adapter.validate_python(orm_orders, from_attributes=True))
+    fast = ORJSONResponse(dict_orders).body
+    assert adapter.validate_json(validated) == adapter.validate_json(fast)
+
+    cases = [
+        ("orm + pydantic", lambda: adapter.dump_json(adapter.validate_python(orm_orders, from_attributes=True))),
+        ("rows + orjson", lambda: ORJSONResponse(dict_orders).body),
+    ]
+    print(f"{'path':<18}{'us per order':>14}")
+    for name, fn in cases:
+        print(f"{name:<18}{measure(fn, args.runs) / args.orders * 1e6:>14.2f}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,79 @@
+# Время запуска воркеров API: импорт main и старт lifespan, как при запуске
+# uvicorn --workers N. Каждый воркер - отдельный процесс, N воркеров стартуют
+# одновременно. Схема создаётся миграциями заранее, как шагом migrate в
+# docker-compose; --legacy-create-all добавляет прежний create_all при импорте.
+#
+# Запуск из каталога server:
+#   python -m benchmarks.startup_time --runs 10 --workers 4
+#   python -m benchmarks.startup_time --runs 10 --workers 4 --legacy-create-all
+# На Postgres из docker-compose create_all делает по запросу к каталогу на
+# каждую таблицу, поэтому разница там заметнее, чем на локальном SQLite.
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+os.environ.setdefault("SQLALCHEMY_DATABASE_URL", "sqlite:///./bench.db")
+
+from pizzeria_db.migrate import upgrade
+
+BOOT = """
+import time
+started = time.perf_counter()
+import main
+{create_all}
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(main.app):
+    ready = time.perf_counter()
+print(imported - started, ready - started)
+"""
+
+LEGACY_CREATE_ALL = """
+from pizzeria_db.database import engine
+main.models.Base.metadata.create_all(bind=engine)
+"""
+
+
+def boot(workers: int, legacy: bool) -> list:
+    script = BOOT.format(create_all=LEGACY_CREATE_ALL if legacy else "")
+    processes = [
+        subprocess.Popen(
+            [sys.executable, "-c", script],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, env=os.environ.copy(),
+        )
+        for _ in range(workers)
+    ]
+    samples = []
+    for process in processes:
+        output, _ = process.communicate()
+        if process.returncode == 0:
+            imported, ready = output.split()[-2:]
+            samples.append((float(imported), float(ready)))
+    return samples
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--legacy-create-all", action="store_true")
+    args = parser.parse_args()
+
+    upgrade()
+    boot(1, args.legacy_create_all)  # прогрев: файлы .pyc
+    samples, failed = [], 0
+    for _ in range(args.runs):
+        started = boot(args.workers, args.legacy_create_all)
+        failed += args.workers - len(started)
+        samples.extend(started)
+    imports = [sample[0] * 1000 for sample in samples]
+    ready = [sample[1] * 1000 for sample in samples]
+    print(f"import main      median {statistics.median(imports):7.1f} ms   max {max(imports):7.1f} ms")
+    print(f"ready to serve   median {statistics.median(ready):7.1f} ms   max {max(ready):7.1f} ms")
+    print(f"failed workers   {failed}")
+
+
+if __name__ == "__main__":
+    main_cli()
\ No newline at end of file
@@ -0,0 +1,16 @@
+# Бенчмарки гоняют /token в процессе и с одного адреса. Лимиты входа по IP и
+# логину и шлюз bcrypt из admission тогда отвечали бы 429/503, и прогон мерил бы
+# отказы, а не вход (их поведение под нагрузкой - в benchmarks.login_flood)
+import admission
+
+
+def unlimited_login_limits() -> admission.LoginLimits:
+    return admission.LoginLimits(
+        admission.TokenBucketLimiter(1e9, 1e9, admission.RATE_LIMIT_MAX_KEYS),
+        admission.TokenBucketLimiter(1e9, 1e9, admission.RATE_LIMIT_MAX_KEYS),
+    )
+
+
+def disable_login_admission():
+    admission.login_limits = unlimited_login_limits()
+    admission.password_gate = admission.ConcurrencyGate(0, 0)
\ No newline at end of file
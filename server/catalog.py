@@ -0,0 +1,87 @@
+import hashlib
+import json
+import os
+import time
+from typing import List, Optional
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+from pizzeria_db.database import RecentWrites
+from pizzeria_db import models
+
+# Снимок меню перечитывается из БД после изменения пицц в этом процессе
+# или по истечении TTL (если меню правили в обход API)
+MENU_SNAPSHOT_TTL_SECONDS = float(os.getenv("MENU_SNAPSHOT_TTL_SECONDS", "300"))
+MENU_CACHE_CONTROL = os.getenv("MENU_CACHE_CONTROL", "public, max-age=60")
+
+# Меню новой базы: его кладёт миграция 0006, бенчмарки берут отсюда названия и цены
+DEFAULT_MENU = [
+    {"name": "Маргарита", "price_kopecks": 35000, "description": "Томатный соус, моцарелла, базилик"},
+    {"name": "Пепперони", "price_kopecks": 45000, "description": "Томатный соус, моцарелла, пепперони"},
+    {"name": "Гавайская", "price_kopecks": 40000, "description": "Томатный соус, моцарелла, курица, ананас"},
+    {"name": "Четыре сыра", "price_kopecks": 50000, "description": "Сливочный соус, моцарелла, пармезан, дор блю, чеддер"},
+]
+
+
+class MenuSnapshot:
+    # Меню, сериализованное один раз, его строгий ETag и индекс цен для заказов
+    def __init__(self, pizzas: List[models.Pizza]):
+        # Цены в копейках, как у позиций заказа; в ответ меню идут рубли
+        self.prices = {pizza.name: pizza.price_kopecks for pizza in pizzas}
+        self.items = [
+            {"id": pizza.id, "name": pizza.name, "price": pizza.price, "description": pizza.description}
+            for pizza in pizzas
+        ]
+        self.body = json.dumps(self.items, ensure_ascii=False, separators=(",", ":")).encode()
+        self.etag = '"' + hashlib.sha256(self.body).hexdigest()[:32] + '"'
+        self.expires_at = time.monotonic() + MENU_SNAPSHOT_TTL_SECONDS
+
+    def matches(self, if_none_match: Optional[str]) -> bool:
+        if not if_none_match:
+            return False
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or self.etag in tags or f"W/{self.etag}" in tags
+
+    def unknown_items(self, names: List[str]) -> List[str]:
+        return sorted({name for name in names if name not in self.prices})
+
+
+class Catalog:
+    def __init__(self):
+        self._snapshot: Optional[MenuSnapshot] = None
+        # Меню читается с реплики, кроме первых секунд после его правки в этом процессе
+        self._writes = RecentWrites(max_keys=1)
+        # Растёт при каждой инвалидации: снимок, прочитанный до неё, не сохраняем
+        self.epoch = 0
+
+    def invalidate(self):
+        self.epoch += 1
+        self._snapshot = None
+        self._writes.wrote(("menu",))
+
+    async def snapshot(self) -> MenuSnapshot:
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.expires_at < time.monotonic():
+            epoch = self.epoch
+            async with self._writes.sessions_for("menu")() as db:
+                pizzas = await db.scalars(select(models.Pizza).order_by(models.Pizza.id))
+                snapshot = MenuSnapshot(pizzas.all())
+            if epoch == self.epoch:
+                self._snapshot = snapshot
+        return snapshot
+
+
+catalog = Catalog()
+
+
+@event.listens_for(models.Pizza, "after_insert")
+@event.listens_for(models.Pizza, "after_update")
+@event.listens_for(models.Pizza, "after_delete")
+def _invalidate_menu(mapper, connection, target):
+    catalog.invalidate()
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _invalidate_menu_bulk(orm_execute_state):
+    if (orm_execute_state.is_update or orm_execute_state.is_delete) \
+            and orm_execute_state.bind_mapper is models.Pizza.__mapper__:
+        catalog.invalidate()
\ No newline at end of file
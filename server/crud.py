@@ -0,0 +1,209 @@
+from datetime import datetime
+from typing import List, Optional
+from sqlalchemy import select, update, delete, exists, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from pizzeria_db import models
+import order_events
+import order_status
+import sales
+
+
+async def load_user_orders(
+    db: AsyncSession,
+    user_id: int,
+    limit: int,
+    after_id: Optional[int] = None,
+    status: Optional[str] = None,
+) -> List[dict]:
+    # Одна страница заказов (keyset по id) и все их позиции за два запроса.
+    # Строки сразу складываются в словари формы schemas.OrderWithItems,
+    # без ORM-объектов и повторной проверки pydantic
+    query = select(
+        models.Order.id,
+        models.Order.user_id,
+        models.Order.status,
+        models.Order.order_hash,
+        models.Order.total_kopecks,
+    ).where(models.Order.user_id == user_id)
+    if after_id is not None:
+        query = query.where(models.Order.id < after_id)
+    if status is not None:
+        query = query.where(models.Order.status == status)
+    rows = await db.execute(query.order_by(models.Order.id.desc()).limit(limit))
+
+    orders, by_id = [], {}
+    for order_id, owner_id, current_status, order_hash, total_kopecks in rows:
+        order = {
+            "id": order_id,
+            "user_id": owner_id,
+            "status": current_status,
+            "order_hash": order_hash,
+            "total": models.to_rubles(total_kopecks),
+            "items": [],
+        }
+        orders.append(order)
+        by_id[order_id] = order
+    if not orders:
+        return orders
+
+    items = await db.execute(
+        select(
+            models.OrderItem.id,
+            models.OrderItem.order_id,
+            models.OrderItem.pizza_name,
+            models.OrderItem.quantity,
+            models.OrderItem.price_kopecks,
+        )
+        .where(models.OrderItem.order_id.in_(by_id))
+        .order_by(models.OrderItem.order_id, models.OrderItem.id)
+    )
+    for item_id, order_id, pizza_name, quantity, price_kopecks in items:
+        by_id[order_id]["items"].append({
+            "pizza_name": pizza_name,
+            "quantity": quantity,
+            "id": item_id,
+            "order_id": order_id,
+            "price": models.to_rubles(price_kopecks),
+        })
+    return orders
+
+
+# Результаты уменьшения позиции заказа
+QUANTITY_DECREASED = "Quantity decreased"
+ITEM_REMOVED = "Item removed"
+ORDER_DELETED = "Item removed and order deleted as it became empty"
+
+
+async def subtract_from_total(db: AsyncSession, order_id: int, kopecks: int) -> datetime:
+    # Возвращает время создания заказа - по нему уменьшаются сводки продаж
+    return await db.scalar(
+        update(models.Order)
+        .where(models.Order.id == order_id)
+        .values(total_kopecks=models.Order.total_kopecks - kopecks)
+        .returning(models.Order.created_at)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def items_changed(db: AsyncSession, order_id: int):
+    # В событии - сколько пицц осталось в заказе: по нему кухня пересчитывает
+    # место заказа в очереди
+    pizzas = await db.scalar(
+        select(func.coalesce(func.sum(models.OrderItem.quantity), 0))
+        .where(models.OrderItem.order_id == order_id)
+    )
+    await order_events.order_changed(db, order_id, order_events.ORDER_ITEM_CHANGED, details={"pizzas": pizzas})
+
+
+async def decrement_order_item(
+    db: AsyncSession,
+    user_id: int,
+    item_id: int,
+    quantity: int = 1,
+) -> Optional[str]:
+    # Уменьшает количество позиции владельца без чтения строки в Python:
+    # условный UPDATE, иначе DELETE позиции и удаление опустевшего заказа.
+    # Менять можно только заказ, который ещё готовится и не взят кухней.
+    # Сумма заказа и сводки продаж уменьшаются в той же транзакции.
+    # Фиксирует транзакцию вызывающий код. None - позиция не найдена.
+    owned_orders = select(models.Order.id).where(
+        models.Order.user_id == user_id,
+        models.Order.status == order_status.PREPARING,
+        models.Order.station.is_(None),
+    )
+
+    decreased = await db.execute(
+        update(models.OrderItem)
+        .where(
+            models.OrderItem.id == item_id,
+            models.OrderItem.quantity > quantity,
+            models.OrderItem.order_id.in_(owned_orders),
+        )
+        .values(quantity=models.OrderItem.quantity - quantity)
+        .returning(models.OrderItem.order_id, models.OrderItem.pizza_name, models.OrderItem.price_kopecks)
+        .execution_options(synchronize_session=False)
+    )
+    row = decreased.first()
+    if row is not None:
+        kopecks = quantity * row.price_kopecks
+        created_at = await subtract_from_total(db, row.order_id, kopecks)
+        await items_changed(db, row.order_id)
+        await sales.record_sales(db, created_at, [(row.pizza_name, -quantity, -kopecks)])
+        return QUANTITY_DECREASED
+
+    removed = (await db.execute(
+        delete(models.OrderItem)
+        .where(
+            models.OrderItem.id == item_id,
+            models.OrderItem.order_id.in_(owned_orders),
+        )
+        .returning(
+            models.OrderItem.order_id,
+            models.OrderItem.pizza_name,
+            models.OrderItem.quantity,
+            models.OrderItem.price_kopecks,
+        )
+        .execution_options(synchronize_session=False)
+    )).first()
+    if removed is None:
+        return None
+    order_id = removed.order_id
+    kopecks = removed.quantity * removed.price_kopecks
+    created_at = await subtract_from_total(db, order_id, kopecks)
+    # Уведомление до удаления заказа: ниже строка заказа может исчезнуть
+    await items_changed(db, order_id)
+
+    deleted_order = (await db.execute(
+        delete(models.Order)
+        .where(
+            models.Order.id == order_id,
+            ~exists().where(models.OrderItem.order_id == order_id),
+        )
+        .returning(models.Order.id, models.Order.order_hash, models.Order.user_id)
+        .execution_options(synchronize_session=False)
+    )).first()
+    if deleted_order is not None:
+        await order_events.order_changed(
+            db, order_id, order_events.ORDER_DELETED, deleted_order.order_hash, deleted_order.user_id
+        )
+    await sales.record_sales(
+        db, created_at, [(removed.pizza_name, -removed.quantity, -kopecks)],
+        orders=-1 if deleted_order is not None else 0,
+    )
+    return ORDER_DELETED if deleted_order is not None else ITEM_REMOVED
+
+
+class StatusTransitionError(Exception):
+    pass
+
+
+async def change_order_status(db: AsyncSession, order_id: int, status: str):
+    # Переход проверяется в самом UPDATE (status IN допустимых предыдущих),
+    # поэтому два параллельных изменения не проскочат мимо автомата состояний.
+    # Вместе со сменой статуса в outbox пишется задание для бота
+    previous = order_status.previous_statuses(status)
+    changed = (await db.execute(
+        update(models.Order)
+        .where(models.Order.id == order_id, models.Order.status.in_(previous))
+        .values(status=status)
+        .returning(models.Order.id, models.Order.order_hash, models.Order.user_id, models.Order.status)
+        .execution_options(synchronize_session=False)
+    )).first()
+
+    if changed is None:
+        current = await db.scalar(select(models.Order.status).where(models.Order.id == order_id))
+        if current is None:
+            return None
+        raise StatusTransitionError(f"Cannot change order status from {current} to {status}")
+
+    db.add(models.OrderStatusOutbox(
+        order_id=changed.id,
+        order_hash=changed.order_hash,
+        status=changed.status,
+        created_at=datetime.utcnow(),
+    ))
+    await order_events.order_changed(
+        db, changed.id, order_events.ORDER_STATUS_CHANGED, changed.order_hash, changed.user_id,
+        changed.status,
+    )
+    return changed
@@ -0,0 +1,204 @@
+import csv
+import io
+import os
+from datetime import datetime
+from typing import AsyncIterator, Iterable, Optional, Tuple
+import orjson
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from pizzeria_db.database import ReplicaSessionLocal
+from pizzeria_db import models
+from sales import as_utc
+
+# Выгрузка заказов с позициями для бухгалтерии. Строки читаются курсором
+# на стороне сервера (stream + yield_per) пачками по EXPORT_BATCH_ROWS:
+# память процесса не зависит от размера выгрузки.
+# Выгрузка читает с реплики, если она есть, и держит соединение пула и снимок
+# транзакции до конца, поэтому одновременных выгрузок не больше EXPORT_MAX_CONCURRENT
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "5000"))
+EXPORT_MAX_CONCURRENT = int(os.getenv("EXPORT_MAX_CONCURRENT", "2"))
+
+NDJSON = "ndjson"
+CSV = "csv"
+MEDIA_TYPES = {NDJSON: "application/x-ndjson", CSV: "text/csv; charset=utf-8"}
+CSV_COLUMNS = [
+    "order_id", "order_hash", "user_id", "status", "created_at", "total",
+    "item_id", "pizza_name", "quantity", "price",
+]
+
+
+def rubles_text(kopecks: int) -> str:
+    # В CSV суммы пишутся точно, без двоичной дроби float
+    sign = "-" if kopecks < 0 else ""
+    rubles, kopecks = divmod(abs(kopecks), models.KOPECKS_PER_RUBLE)
+    return f"{sign}{rubles}.{kopecks:02d}"
+
+
+class ExportRangeError(Exception):
+    pass
+
+
+def export_range(since: Optional[datetime], until: Optional[datetime]) -> Tuple[Optional[datetime], datetime]:
+    # Точный полуинтервал [since, until): в отличие от отчётов, без округления до
+    # часа, периода по умолчанию и ограничения длины. Без since - с первого заказа,
+    # без until - по момент запроса
+    until = as_utc(until) if until else datetime.utcnow()
+    since = as_utc(since) if since else None
+    if since is not None and since >= until:
+        raise ExportRangeError("since must be earlier than until")
+    return since, until
+
+
+def rows_query(since: Optional[datetime], until: datetime, after_id: Optional[int]):
+    # Заказы по возрастанию id, позиции каждого заказа идут подряд. Продолжение
+    # прерванной выгрузки - тот же запрос с after_id: новые заказы получают
+    # большие id, поэтому уже выгруженное не повторяется и ничего не теряется
+    query = (
+        select(
+            models.Order.id,
+            models.Order.order_hash,
+            models.Order.user_id,
+            models.Order.status,
+            models.Order.created_at,
+            models.Order.total_kopecks,
+            models.OrderItem.id,
+            models.OrderItem.pizza_name,
+            models.OrderItem.quantity,
+            models.OrderItem.price_kopecks,
+        )
+        .outerjoin(models.OrderItem, models.OrderItem.order_id == models.Order.id)
+        .where(models.Order.created_at < until)
+        .order_by(models.Order.id, models.OrderItem.id)
+    )
+    if since is not None:
+        query = query.where(models.Order.created_at >= since)
+    if after_id is not None:
+        query = query.where(models.Order.id > after_id)
+    return query.execution_options(yield_per=EXPORT_BATCH_ROWS)
+
+
+def ndjson_chunk(rows: Iterable[tuple], order: Optional[dict]):
+    # Одна строка NDJSON - заказ целиком с позициями, как в GET /orders/. Заказ на границе пачки
+    # возвращается незаписанным и дописывается со следующей пачкой
+    lines = []
+    for order_id, order_hash, user_id, status, created_at, total_kopecks, item_id, pizza_name, quantity, price_kopecks in rows:
+        if order is None or order["id"] != order_id:
+            if order is not None:
+                lines.append(orjson.dumps(order))
+            order = {
+                "id": order_id,
+                "order_hash": order_hash,
+                "user_id": user_id,
+                "status": status,
+                "created_at": created_at,
+                "total": models.to_rubles(total_kopecks),
+                "items": [],
+            }
+        if item_id is not None:
+            order["items"].append({
+                "id": item_id,
+                "order_id": order_id,
+                "pizza_name": pizza_name,
+                "quantity": quantity,
+                "price": models.to_rubles(price_kopecks),
+            })
+    return b"".join(line + b"\n" for line in lines), order
+
+
+def csv_chunk(rows: Iterable[tuple]) -> bytes:
+    # Строка CSV - позиция заказа; у заказа без позиций колонки позиции пустые
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    for order_id, order_hash, user_id, status, created_at, total_kopecks, item_id, pizza_name, quantity, price_kopecks in rows:
+        writer.writerow((
+            order_id, order_hash, user_id, status, created_at.isoformat(), rubles_text(total_kopecks),
+            item_id, pizza_name, quantity, None if price_kopecks is None else rubles_text(price_kopecks),
+        ))
+    return buffer.getvalue().encode()
+
+
+class ExportStats:
+    def __init__(self):
+        self.active = 0
+        self.started = 0
+        self.completed = 0
+        self.rows = 0
+
+    def stats(self):
+        return {
+            "active": self.active,
+            "started_total": self.started,
+            "completed_total": self.completed,
+            "rows_total": self.rows,
+        }
+
+
+exports = ExportStats()
+
+
+class ExportSlot:
+    # Место в лимите одновременных выгрузок. Освобождается один раз: из генератора
+    # или из ответа, если тот так и не начал читать генератор
+    def __init__(self):
+        self.held = True
+
+    def release(self):
+        if self.held:
+            self.held = False
+            exports.active -= 1
+
+
+def try_acquire() -> Optional[ExportSlot]:
+    # Проверка и захват без await между ними: параллельные запросы не проходят лимит разом
+    if exports.active >= EXPORT_MAX_CONCURRENT:
+        return None
+    exports.active += 1
+    exports.started += 1
+    return ExportSlot()
+
+
+class ExportResponse(StreamingResponse):
+    def __init__(self, content, slot: ExportSlot, **kwargs):
+        super().__init__(content, **kwargs)
+        self.slot = slot
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.slot.release()
+
+
+async def export_orders(
+    slot: ExportSlot,
+    fmt: str,
+    since: Optional[datetime],
+    until: datetime,
+    after_id: Optional[int] = None,
+) -> AsyncIterator[bytes]:
+    # Своя сессия на всё время выгрузки: StreamingResponse читает генератор уже
+    # после выхода из зависимостей
+    try:
+        if fmt == CSV:
+            yield (",".join(CSV_COLUMNS) + "\n").encode()
+        order = None
+        async with ReplicaSessionLocal() as db:
+            result = await db.stream(rows_query(since, until, after_id))
+            async for rows in result.partitions():
+                exports.rows += len(rows)
+                if fmt == CSV:
+                    chunk = csv_chunk(rows)
+                else:
+                    chunk, order = ndjson_chunk(rows, order)
+                if chunk:
+                    yield chunk
+        if order is not None:
+            yield orjson.dumps(order) + b"\n"
+        exports.completed += 1
+    finally:
+        slot.release()
+
+
+def export_filename(fmt: str, since: Optional[datetime], until: datetime) -> str:
+    start = "start" if since is None else f"{since:%Y%m%dT%H%M%S}"
+    return f"orders_{start}_{until:%Y%m%dT%H%M%S}.{fmt}"
\ No newline at end of file
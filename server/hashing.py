@@ -0,0 +1,89 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+from passlib.context import CryptContext
+
+# Стоимость bcrypt и число потоков, в которых считаются хэши
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+# Перехэшировать пароль при входе, если хэш посчитан с другой стоимостью
+PASSWORD_REHASH_ON_LOGIN = os.getenv("PASSWORD_REHASH_ON_LOGIN", "false").lower() in ("1", "true", "yes")
+
+
+class PasswordHasher:
+    # bcrypt отпускает GIL, поэтому пула потоков достаточно, чтобы не блокировать
+    # event loop; размер пула ограничивает число одновременных вычислений,
+    # остальные запросы ждут в очереди пула
+    def __init__(self, context: CryptContext, max_workers: int, rehash_on_login: bool = False):
+        self.context = context
+        self.max_workers = max_workers
+        self.rehash_on_login = rehash_on_login
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bcrypt")
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.hash_seconds = 0.0
+
+    def _timed(self, submitted: float, fn, *args):
+        started = time.perf_counter()
+        waited = started - submitted
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+                self.hash_seconds += time.perf_counter() - started
+
+    async def _run(self, fn, *args):
+        with self._lock:
+            self.queued += 1
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, self._timed, time.perf_counter(), fn, *args
+        )
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.context.hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._run(self.context.verify, password, hashed_password)
+
+    async def verify_and_update(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        # Возвращает (пароль верный, новый хэш или None)
+        if not await self.verify(password, hashed_password):
+            return False, None
+        if self.rehash_on_login and self.context.needs_update(hashed_password):
+            return True, await self.hash(password)
+        return True, None
+
+    def stats(self):
+        with self._lock:
+            completed = self.completed
+            return {
+                "workers": self.max_workers,
+                "queued": self.queued,
+                "running": self.running,
+                "completed_total": completed,
+                "wait_seconds_total": round(self.wait_seconds, 6),
+                "wait_seconds_max": round(self.max_wait_seconds, 6),
+                "hash_seconds_total": round(self.hash_seconds, 6),
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+hasher = PasswordHasher(pwd_context, PASSWORD_HASH_WORKERS, PASSWORD_REHASH_ON_LOGIN)
\ No newline at end of file
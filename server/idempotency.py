@@ -0,0 +1,61 @@
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from pizzeria_db import models
+import schemas
+
+# Сколько хранится ответ на запрос с Idempotency-Key
+IDEMPOTENCY_KEY_TTL_HOURS = float(os.getenv("IDEMPOTENCY_KEY_TTL_HOURS", "24"))
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+
+class IdempotencyConflict(Exception):
+    pass
+
+
+def request_fingerprint(order: schemas.OrderCreate) -> str:
+    # Только поля, влияющие на заказ: price клиента сервер игнорирует, и повтор
+    # с иначе записанной ценой - тот же запрос
+    body = json.dumps(order.model_dump(exclude={"items": {"__all__": {"price"}}}), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+async def find_response(db: AsyncSession, user_id: int, key: str, request_hash: str) -> Optional[dict]:
+    # Сохранённый ответ для повтора или None, если ключ ещё не использовался
+    row = await db.scalar(
+        select(models.IdempotencyKey)
+        .where(models.IdempotencyKey.user_id == user_id, models.IdempotencyKey.key == key)
+    )
+    if row is None:
+        return None
+    if row.expires_at < datetime.utcnow():
+        await db.delete(row)
+        await db.flush()
+        return None
+    if row.request_hash != request_hash:
+        raise IdempotencyConflict("Idempotency-Key was already used for a different request")
+    if row.response is None:
+        raise IdempotencyConflict("A request with this Idempotency-Key is still in progress")
+    return json.loads(row.response)
+
+
+async def reserve(db: AsyncSession, user_id: int, key: str, request_hash: str) -> models.IdempotencyKey:
+    # Уникальный индекс (user_id, key) не пустит второй такой же запрос: в Postgres
+    # параллельная вставка ждёт фиксации первой транзакции и падает с IntegrityError
+    row = models.IdempotencyKey(
+        user_id=user_id,
+        key=key,
+        request_hash=request_hash,
+        expires_at=datetime.utcnow() + timedelta(hours=IDEMPOTENCY_KEY_TTL_HOURS),
+    )
+    db.add(row)
+    await db.flush()
+    return row
+
+
+def store_response(row: models.IdempotencyKey, response: dict):
+    row.response = json.dumps(response, ensure_ascii=False)
\ No newline at end of file
@@ -0,0 +1,342 @@
+import heapq
+import os
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import select, update, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from pizzeria_db.database import AsyncSessionLocal
+from pizzeria_db import models
+import crud
+import order_events
+import order_status
+import order_stream
+
+# Каждая пицца сверх первой отодвигает заказ в очереди на столько секунд:
+# маленькие заказы проходят вперёд, но старый большой заказ всё равно дождётся своего
+KITCHEN_SECONDS_PER_PIZZA = float(os.getenv("KITCHEN_SECONDS_PER_PIZZA", "60"))
+# Сколько верхних билетов claim пробует, прежде чем искать свободный заказ в базе
+KITCHEN_CLAIM_ATTEMPTS = 8
+KITCHEN_BOARD_SNAPSHOT = int(os.getenv("KITCHEN_BOARD_SNAPSHOT", "100"))
+KITCHEN_BOARD_MAX_STREAMS = int(os.getenv("KITCHEN_BOARD_MAX_STREAMS", "20"))
+KITCHEN_BOARD_QUEUE_SIZE = 1000
+
+BOARD = "kitchen"
+EPOCH = datetime(1970, 1, 1)
+
+
+class Ticket:
+    __slots__ = ("order_id", "order_hash", "created_at", "pizzas", "priority", "station", "claimed_at")
+
+    def __init__(
+        self,
+        order_id: int,
+        order_hash: str,
+        created_at: datetime,
+        pizzas: int,
+        station: Optional[str] = None,
+        claimed_at: Optional[datetime] = None,
+    ):
+        self.order_id = order_id
+        self.order_hash = order_hash
+        self.created_at = created_at
+        self.pizzas = pizzas
+        self.station = station
+        self.claimed_at = claimed_at
+        self.priority = self.priority_for(pizzas)
+
+    def priority_for(self, pizzas: int) -> float:
+        # Меньше - раньше; приоритет не меняется со временем, поэтому хватает кучи.
+        # Меняется он только вместе с числом пицц в заказе
+        return (self.created_at - EPOCH).total_seconds() + max(pizzas - 1, 0) * KITCHEN_SECONDS_PER_PIZZA
+
+    @classmethod
+    def from_event(cls, payload: dict) -> "Ticket":
+        claimed_at = payload.get("claimed_at")
+        return cls(
+            payload["order_id"],
+            payload["order_hash"],
+            datetime.fromisoformat(payload["created_at"]),
+            payload["pizzas"],
+            payload.get("station"),
+            datetime.fromisoformat(claimed_at) if claimed_at else None,
+        )
+
+    def as_dict(self) -> dict:
+        return {
+            "order_id": self.order_id,
+            "order_hash": self.order_hash,
+            "created_at": self.created_at.isoformat(),
+            "pizzas": self.pizzas,
+            "station": self.station,
+            "claimed_at": self.claimed_at.isoformat() if self.claimed_at else None,
+        }
+
+
+class KitchenQueue:
+    # Ждущие билеты лежат в куче по priority, взятые в работу - в in_progress.
+    # Удаление ленивое: запись кучи без билета в queued пропускается при pop.
+    # Очередь только подсказывает порядок; кто взял заказ, решает UPDATE в базе
+    def __init__(self):
+        self._heap = []
+        self.queued: Dict[int, Ticket] = {}
+        self.in_progress: Dict[int, Ticket] = {}
+        self.claims = 0
+        self.fallback_claims = 0
+
+    def reset(self, tickets: Iterable[Ticket]):
+        self.queued.clear()
+        self.in_progress.clear()
+        for ticket in tickets:
+            (self.in_progress if ticket.station else self.queued)[ticket.order_id] = ticket
+        self._heap = [(ticket.priority, ticket.order_id) for ticket in self.queued.values()]
+        heapq.heapify(self._heap)
+
+    def push(self, ticket: Ticket):
+        ticket.station = ticket.claimed_at = None
+        self.in_progress.pop(ticket.order_id, None)
+        self.queued[ticket.order_id] = ticket
+        heapq.heappush(self._heap, (ticket.priority, ticket.order_id))
+
+    def resize(self, order_id: int, pizzas: int) -> Optional[Ticket]:
+        # Клиент изменил позиции ждущего заказа: билет встаёт в кучу с новым
+        # приоритетом, прежняя запись кучи отбрасывается при pop по несовпадению priority
+        ticket = self.queued.get(order_id)
+        if ticket is None or ticket.pizzas == pizzas:
+            return None
+        ticket.pizzas = pizzas
+        ticket.priority = ticket.priority_for(pizzas)
+        heapq.heappush(self._heap, (ticket.priority, order_id))
+        self._compact()
+        return ticket
+
+    def pop(self) -> Optional[Ticket]:
+        while self._heap:
+            priority, order_id = heapq.heappop(self._heap)
+            ticket = self.queued.get(order_id)
+            if ticket is not None and ticket.priority == priority:
+                del self.queued[order_id]
+                return ticket
+        return None
+
+    def start(self, ticket: Ticket):
+        self.queued.pop(ticket.order_id, None)
+        self.in_progress[ticket.order_id] = ticket
+        self._compact()
+
+    def discard(self, order_id: int) -> bool:
+        removed = self.queued.pop(order_id, None) or self.in_progress.pop(order_id, None)
+        self._compact()
+        return removed is not None
+
+    def _compact(self):
+        # Записи, ушедшие мимо pop, копятся в куче; пересобираем, когда их большинство
+        if len(self._heap) > 2 * len(self.queued) + 1024:
+            self._heap = [(ticket.priority, ticket.order_id) for ticket in self.queued.values()]
+            heapq.heapify(self._heap)
+
+    def snapshot(self, limit: int) -> dict:
+        queued = heapq.nsmallest(limit, self.queued.values(), key=lambda ticket: ticket.priority)
+        in_progress = sorted(self.in_progress.values(), key=lambda ticket: ticket.claimed_at or ticket.created_at)
+        return {
+            "event": "snapshot",
+            "queued_total": len(self.queued),
+            "queued": [ticket.as_dict() for ticket in queued],
+            "in_progress": [ticket.as_dict() for ticket in in_progress],
+        }
+
+    def stats(self):
+        return {
+            "queued": len(self.queued),
+            "in_progress": len(self.in_progress),
+            "heap_size": len(self._heap),
+            "claims_total": self.claims,
+            "fallback_claims_total": self.fallback_claims,
+        }
+
+
+queue = KitchenQueue()
+# Табло кухни: снимок очереди при подключении, дальше изменения
+board = order_stream.OrderEventBroker(KITCHEN_BOARD_QUEUE_SIZE, KITCHEN_BOARD_MAX_STREAMS)
+
+
+def board_snapshot() -> List[dict]:
+    return [queue.snapshot(KITCHEN_BOARD_SNAPSHOT)]
+
+
+def on_order_event(payload: dict):
+    # Очередь каждого воркера следит за событиями заказов всех воркеров
+    event = payload["event"]
+    if event == order_events.ORDER_CREATED and "created_at" in payload:
+        ticket = Ticket.from_event(payload)
+        queue.push(ticket)
+        board.publish(BOARD, {"event": "queued", **ticket.as_dict()})
+    elif event == order_events.ORDER_RELEASED:
+        ticket = Ticket.from_event(payload)
+        queue.push(ticket)
+        board.publish(BOARD, {"event": "queued", **ticket.as_dict()})
+    elif event == order_events.ORDER_ITEM_CHANGED and "pizzas" in payload:
+        ticket = queue.resize(payload["order_id"], payload["pizzas"])
+        if ticket is not None:
+            board.publish(BOARD, {"event": "queued", **ticket.as_dict()})
+    elif event == order_events.ORDER_CLAIMED:
+        ticket = Ticket.from_event(payload)
+        queue.start(ticket)
+        board.publish(BOARD, {"event": "claimed", **ticket.as_dict()})
+    elif event == order_events.ORDER_DELETED or (
+        event == order_events.ORDER_STATUS_CHANGED and payload.get("status") != order_status.PREPARING
+    ):
+        if queue.discard(payload["order_id"]):
+            board.publish(BOARD, {"event": "removed", "order_id": payload["order_id"], "status": payload.get("status")})
+
+
+async def rebuild():
+    # Очередь в памяти восстанавливается из базы при старте и после обрыва LISTEN
+    pizzas = func.coalesce(func.sum(models.OrderItem.quantity), 0)
+    async with AsyncSessionLocal() as db:
+        rows = await db.execute(
+            select(
+                models.Order.id,
+                models.Order.order_hash,
+                models.Order.created_at,
+                pizzas,
+                models.Order.station,
+                models.Order.claimed_at,
+            )
+            .outerjoin(models.OrderItem, models.OrderItem.order_id == models.Order.id)
+            .where(models.Order.status == order_status.PREPARING)
+            .group_by(models.Order.id)
+        )
+        queue.reset(Ticket(*row) for row in rows)
+    # Табло переподключатся и получат свежий снимок
+    board.close_all()
+
+
+async def claim_order(db: AsyncSession, station: str, order_id: Optional[int] = None):
+    # Один UPDATE с подзапросом SELECT ... FOR UPDATE SKIP LOCKED: строку, которую
+    # прямо сейчас берёт другая станция, пропускаем, а не ждём. SQLite FOR UPDATE
+    # не поддерживает, но пишет последовательно, а условие station IS NULL стоит и в UPDATE
+    waiting = select(models.Order.id).where(
+        models.Order.status == order_status.PREPARING,
+        models.Order.station.is_(None),
+    )
+    if order_id is not None:
+        waiting = waiting.where(models.Order.id == order_id)
+    else:
+        waiting = waiting.order_by(models.Order.created_at)
+    waiting = waiting.limit(1).with_for_update(skip_locked=True).scalar_subquery()
+    return (await db.execute(
+        update(models.Order)
+        .where(models.Order.id == waiting, models.Order.station.is_(None))
+        .values(station=station, claimed_at=datetime.utcnow())
+        .returning(
+            models.Order.id,
+            models.Order.order_hash,
+            models.Order.user_id,
+            models.Order.created_at,
+            models.Order.claimed_at,
+        )
+        .execution_options(synchronize_session=False)
+    )).first()
+
+
+async def is_waiting(db: AsyncSession, order_id: int) -> bool:
+    return await db.scalar(
+        select(models.Order.id).where(
+            models.Order.id == order_id,
+            models.Order.status == order_status.PREPARING,
+            models.Order.station.is_(None),
+        )
+    ) is not None
+
+
+async def start_ticket(db: AsyncSession, claimed, station: str) -> dict:
+    items = (await db.execute(
+        select(models.OrderItem.pizza_name, models.OrderItem.quantity)
+        .where(models.OrderItem.order_id == claimed.id)
+        .order_by(models.OrderItem.id)
+    )).all()
+    ticket = Ticket(
+        claimed.id, claimed.order_hash, claimed.created_at,
+        sum(item.quantity for item in items), station, claimed.claimed_at,
+    )
+    await order_events.order_changed(
+        db, claimed.id, order_events.ORDER_CLAIMED, claimed.order_hash, claimed.user_id,
+        details=ticket.as_dict(),
+    )
+    queue.claims += 1
+    return {
+        **ticket.as_dict(),
+        "items": [{"pizza_name": item.pizza_name, "quantity": item.quantity} for item in items],
+    }
+
+
+async def claim(db: AsyncSession, station: str) -> Optional[dict]:
+    # Кандидаты берутся с вершины кучи. Занятый чужой транзакцией билет
+    # возвращается в очередь, ушедший (взят, отменён, удалён) выбрасывается.
+    # Фиксирует транзакцию вызывающий код; если commit не пройдёт, билет
+    # из этой очереди пропадёт, но его найдёт запасной поиск по базе
+    deferred = []
+    try:
+        for _ in range(KITCHEN_CLAIM_ATTEMPTS):
+            ticket = queue.pop()
+            if ticket is None:
+                break
+            deferred.append(ticket)
+            claimed = await claim_order(db, station, ticket.order_id)
+            if claimed is not None:
+                deferred.pop()
+                return await start_ticket(db, claimed, station)
+            if not await is_waiting(db, ticket.order_id):
+                deferred.pop()
+
+        # Очередь этого воркера пуста или отстала от базы: самый старый свободный заказ
+        claimed = await claim_order(db, station)
+        if claimed is None:
+            return None
+        queue.fallback_claims += 1
+        return await start_ticket(db, claimed, station)
+    finally:
+        for ticket in deferred:
+            queue.push(ticket)
+
+
+async def complete(db: AsyncSession, order_id: int, station: str):
+    # Готовый заказ переводится в "Готов" общим автоматом статусов (outbox для бота, события)
+    owned = await db.scalar(
+        select(models.Order.id)
+        .where(
+            models.Order.id == order_id,
+            models.Order.station == station,
+            models.Order.status == order_status.PREPARING,
+        )
+        .with_for_update()
+    )
+    if owned is None:
+        return None
+    return await crud.change_order_status(db, order_id, order_status.READY)
+
+
+async def release(db: AsyncSession, order_id: int, station: str):
+    released = (await db.execute(
+        update(models.Order)
+        .where(
+            models.Order.id == order_id,
+            models.Order.station == station,
+            models.Order.status == order_status.PREPARING,
+        )
+        .values(station=None, claimed_at=None)
+        .returning(models.Order.id, models.Order.order_hash, models.Order.user_id, models.Order.created_at)
+        .execution_options(synchronize_session=False)
+    )).first()
+    if released is None:
+        return None
+    pizzas = await db.scalar(
+        select(func.coalesce(func.sum(models.OrderItem.quantity), 0))
+        .where(models.OrderItem.order_id == order_id)
+    )
+    ticket = Ticket(released.id, released.order_hash, released.created_at, pizzas)
+    await order_events.order_changed(
+        db, released.id, order_events.ORDER_RELEASED, released.order_hash, released.user_id,
+        details=ticket.as_dict(),
+    )
+    return released
@@ -1,28 +1,80 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.responses import PlainTextResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
 from jose import JWTError, jwt
-from passlib.context import CryptContext
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
 from typing import Optional, List
 from pydantic import BaseModel
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import select, delete, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 import os
+import asyncio
 from dotenv import load_dotenv
-from database import SessionLocal, engine
-import models
+from pizzeria_db.database import (
+    AsyncSessionLocal, async_engine, replica_engines, reads_replica, pool_stats, SQLALCHEMY_DATABASE_URL,
+)
+from pizzeria_db import models
 import schemas
+import crud
+import idempotency
+import order_events
+import order_status
+import order_stream
+import kitchen
+import admission
+import metrics
+import profiling
+import sales
+import export
+import read_routing
+from hashing import hasher
+from user_cache import user_cache
+from catalog import catalog, MENU_CACHE_CONTROL
+from responses import ORJSONResponse
+from maintenance import run_sweeper, SWEEP_INTERVAL_SECONDS
 import uuid
+import hashlib
 
-models.Base.metadata.create_all(bind=engine)
 load_dotenv()
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Начальное меню кладёт миграция 0006 в шаге migrate, а не каждый воркер при старте
+    await kitchen.rebuild()
+    sweeper = None
+    if SWEEP_INTERVAL_SECONDS > 0:
+        sweeper = asyncio.create_task(run_sweeper())
+    listener = asyncio.create_task(
+        order_stream.listen_order_events(SQLALCHEMY_DATABASE_URL, on_reconnect=kitchen.rebuild)
+    )
+    yield
+    listener.cancel()
+    order_stream.broker.close_all()
+    kitchen.board.close_all()
+    if sweeper is not None:
+        sweeper.cancel()
+
+app = FastAPI(lifespan=lifespan)
 
 # Настройки для JWT
 SECRET_KEY = "SuperPizzeria"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 45
 
+# Пользователи с доступом к /admin/*
+ADMIN_USERNAMES = {name.strip() for name in os.getenv("ADMIN_USERNAMES", "").split(",") if name.strip()}
+
+# Постраничная выдача заказов
+ORDERS_PAGE_SIZE = 20
+ORDERS_MAX_PAGE_SIZE = 100
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# Первичные ключи - Integer (int4 в Postgres), большие id заведомо не существуют
+MAX_ID = 2**31 - 1
+
 # Настройки CORS
 allowed_origin = os.getenv("SERVER_IP")
 print(allowed_origin)
@@ -33,7 +85,9 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
+profiling.install(app)
 '''
 app.add_middleware(
     CORSMiddleware,
@@ -47,22 +101,35 @@ app.add_middleware(
     allow_headers=["Content-Type", "Authorization"]
 )
 '''
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+# EventSource не умеет заголовки, поэтому потоку событий токен можно передать в ?token=
+oauth2_scheme_optional = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
-# Функции для работы с паролями и токенами
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+metrics.register("password_hash", hasher.stats)
+metrics.register("user_cache", user_cache.stats)
+metrics.register("db_pool", lambda: pool_stats(async_engine))
+for number, replica in enumerate(replica_engines):
+    metrics.register(f"db_replica_{number}_pool", lambda replica=replica: pool_stats(replica))
+metrics.register("read_routing", read_routing.recent_writers.stats)
+metrics.register("order_stream", order_stream.broker.stats)
+metrics.register("login_admission", admission.stats)
+metrics.register("kitchen", kitchen.queue.stats)
+metrics.register("kitchen_board", kitchen.board.stats)
+metrics.register("order_export", export.exports.stats)
+order_stream.event_handlers.append(kitchen.on_order_event)
+
+# Функции для работы с паролями и токенами (bcrypt считается в пуле потоков)
+async def verify_password(plain_password, hashed_password):
+    with profiling.timed("hash_seconds"):
+        return await hasher.verify_and_update(plain_password, hashed_password)
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+async def get_password_hash(password):
+    with profiling.timed("hash_seconds"):
+        return await hasher.hash(password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -74,59 +141,129 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-def create_refresh_token(user_id: int, expires_delta: Optional[timedelta] = None):
+def hash_refresh_token(refresh_token: str) -> str:
+    # В БД хранится только хэш: утечка таблицы не даёт рабочих токенов
+    return hashlib.sha256(refresh_token.encode()).hexdigest()
+
+def create_refresh_token(db: AsyncSession, user_id: int, expires_delta: Optional[timedelta] = None):
+    # Токен добавляется в транзакцию запроса, фиксирует её вызывающий код
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(days=1)
     
     refresh_token = str(uuid.uuid4())
-    
-    db = SessionLocal()
-    try:
-        db_refresh_token = models.RefreshToken(
-            user_id=user_id,
-            token=refresh_token,
-            expires_at=expire
-        )
-        db.add(db_refresh_token)
-        db.commit()
-        db.refresh(db_refresh_token)
-    finally:
-        db.close()
-    
+    db.add(models.RefreshToken(
+        user_id=user_id,
+        token=hash_refresh_token(refresh_token),
+        expires_at=expire
+    ))
     return refresh_token
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
+def credentials_error():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def decode_user_id(token: str) -> int:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id: str = payload.get("sub")
         if user_id is None:
-            raise credentials_exception
-    except JWTError as e:
+            raise credentials_error()
+        return int(user_id)
+    except (JWTError, ValueError):
+        raise credentials_error()
 
-        raise credentials_exception
-
-    user = db.query(models.User).filter(models.User.id == user_id).first()
+async def get_current_user_id(token: str = Depends(oauth2_scheme)) -> int:
+    # Эндпоинтам, которым нужен только id, достаточно подписанного токена - без запроса к БД
+    return decode_user_id(token)
 
+async def get_current_user(user_id: int = Depends(get_current_user_id), db: AsyncSession = Depends(get_db)):
+    user = user_cache.get(user_id)
     if user is None:
-        raise credentials_exception
+        db_user = await db.get(models.User, user_id)
+        if db_user is None:
+            raise credentials_error()
+        user = user_cache.put(db_user)
     return user
 
-@app.post("/token", response_model=schemas.Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.username == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+async def get_read_db(user_id: int = Depends(get_current_user_id)):
+    # Чтение своих данных идёт на реплику, если пользователь недавно не менял заказы
+    async with read_routing.recent_writers.sessions_for(user_id)() as db:
+        yield db
+
+async def get_current_user_for_read(user_id: int = Depends(get_current_user_id), db: AsyncSession = Depends(get_read_db)):
+    try:
+        return await get_current_user(user_id, db)
+    except HTTPException:
+        if not reads_replica(db):
+            raise
+    # Только что зарегистрированного пользователя реплика может ещё не знать
+    async with AsyncSessionLocal() as primary:
+        return await get_current_user(user_id, primary)
+
+async def get_current_admin(current_user: schemas.User = Depends(get_current_user)):
+    if current_user.username not in ADMIN_USERNAMES:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+    return current_user
+
+async def get_stream_user_id(
+    token: Optional[str] = Query(None),
+    header_token: Optional[str] = Depends(oauth2_scheme_optional),
+) -> int:
+    if header_token is None and token is None:
+        raise credentials_error()
+    return decode_user_id(header_token or token)
+
+async def get_stream_admin(user_id: int = Depends(get_stream_user_id)):
+    # Своя короткая сессия: get_db держала бы соединение всё время потока
+    async with AsyncSessionLocal() as db:
+        user = await get_current_user(user_id, db)
+    return await get_current_admin(user)
+
+def rejected_error(e: admission.Rejected):
+    return HTTPException(status_code=e.status_code, detail=str(e), headers=e.headers())
+
+async def password_hash_slot():
+    # bcrypt и запись токенов не должны занять все воркеры: сверх лимита запросы
+    # ждут недолго или сразу получают 503, а /menu и /orders/ продолжают отвечать
+    try:
+        async with admission.password_gate.slot():
+            yield
+    except admission.Rejected as e:
+        raise rejected_error(e)
+
+async def admit_login(request: Request, form_data: OAuth2PasswordRequestForm = Depends()):
+    # Лимиты по IP и логину проверяются до базы и bcrypt; адрес клиента за прокси
+    # берётся из X-Forwarded-For средствами uvicorn (--proxy-headers)
+    try:
+        admission.login_limits.check(request.client.host if request.client else "", form_data.username)
+    except admission.Rejected as e:
+        raise rejected_error(e)
+
+@app.post("/token", response_model=schemas.Token, dependencies=[Depends(admit_login), Depends(password_hash_slot)])
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
+    user = await db.scalar(
+        select(models.User).where(models.User.username == form_data.username)
+    )
+    # Возвращаем соединение в пул, пока bcrypt считается в другом потоке
+    await db.commit()
+    verified, new_hash = (False, None)
+    if user:
+        verified, new_hash = await verify_password(form_data.password, user.hashed_password)
+    if not verified:
+        admission.login_limits.failed(form_data.username)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if new_hash:
+        # Стоимость bcrypt изменилась - сохраняем пересчитанный хэш
+        user.hashed_password = new_hash
     
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
@@ -134,7 +271,8 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     )
 
     refresh_token_expires = timedelta(days=1)
-    refresh_token = create_refresh_token(user.id, refresh_token_expires)
+    refresh_token = create_refresh_token(db, user.id, refresh_token_expires)
+    await db.commit()
 
     return {
         "access_token": access_token,
@@ -143,24 +281,28 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     }
 
 @app.post("/refresh-token", response_model=schemas.Token)
-async def refresh_access_token(request: schemas.RefreshTokenRequest, db: Session = Depends(get_db)):
-    db_refresh_token = db.query(models.RefreshToken)\
-                         .filter(models.RefreshToken.token == request.refresh_token)\
-                         .first()
-    if not db_refresh_token or db_refresh_token.expires_at < datetime.utcnow():
+async def refresh_access_token(request: schemas.RefreshTokenRequest, db: AsyncSession = Depends(get_db)):
+    # Ротация одной транзакцией: DELETE ... RETURNING гарантирует, что
+    # один и тот же токен обменяют не больше одного раза
+    user_id = await db.scalar(
+        delete(models.RefreshToken)
+        .where(
+            models.RefreshToken.token == hash_refresh_token(request.refresh_token),
+            models.RefreshToken.expires_at >= datetime.utcnow(),
+        )
+        .returning(models.RefreshToken.user_id)
+    )
+    if user_id is None:
+        await db.rollback()
         raise HTTPException(status_code=401, detail="Invalid refresh token")
     
     # Генерируем новые токены
     new_access_token = create_access_token(
-        data={"sub": str(db_refresh_token.user_id)},
+        data={"sub": str(user_id)},
         expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     )
-    # Создаем новый refresh-токен
-    new_refresh_token = create_refresh_token(db_refresh_token.user_id, timedelta(days=1))
-    
-    # Удаляем старый токен
-    db.delete(db_refresh_token)
-    db.commit()
+    new_refresh_token = create_refresh_token(db, user_id, timedelta(days=1))
+    await db.commit()
     
     return {
         "access_token": new_access_token,
@@ -168,13 +310,16 @@ async def refresh_access_token(request: schemas.RefreshTokenRequest, db: Session
         "refresh_token": new_refresh_token
     }
 
-@app.post("/register", response_model=schemas.User)
-async def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = db.query(models.User).filter(models.User.username == user.username).first()
+@app.post("/register", response_model=schemas.User, dependencies=[Depends(password_hash_slot)])
+async def register_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_db)):
+    db_user = await db.scalar(
+        select(models.User).where(models.User.username == user.username)
+    )
     if db_user:
         raise HTTPException(status_code=400, detail="Username already registered")
+    await db.commit()
     
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash(user.password)
     db_user = models.User(
         username=user.username,
         email=user.email,
@@ -182,131 +327,352 @@ async def register_user(user: schemas.UserCreate, db: Session = Depends(get_db))
         hashed_password=hashed_password
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
 @app.get("/users/me/", response_model=schemas.User)
-async def read_users_me(current_user: schemas.User = Depends(get_current_user)):
+async def read_users_me(current_user: schemas.User = Depends(get_current_user_for_read)):
     return current_user
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def read_metrics():
+    return metrics.render()
+
 @app.get("/menu")
-async def get_menu():
-    return [
-        {"id": 1, "name": "Маргарита", "price": 350, "description": "Томатный соус, моцарелла, базилик"},
-        {"id": 2, "name": "Пепперони", "price": 450, "description": "Томатный соус, моцарелла, пепперони"},
-        {"id": 3, "name": "Гавайская", "price": 400, "description": "Томатный соус, моцарелла, курица, ананас"},
-        {"id": 4, "name": "Четыре сыра", "price": 500, "description": "Сливочный соус, моцарелла, пармезан, дор блю, чеддер"},
-    ]
+async def get_menu(if_none_match: Optional[str] = Header(None)):
+    # Меню отдаётся из готового снимка: без запросов к БД и повторной сериализации
+    snapshot = await catalog.snapshot()
+    headers = {"ETag": snapshot.etag, "Cache-Control": MENU_CACHE_CONTROL}
+    if snapshot.matches(if_none_match):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=snapshot.body, media_type="application/json", headers=headers)
+
 
+async def replay_order(db: AsyncSession, user_id: int, key: str, request_hash: str) -> Optional[Response]:
+    try:
+        replay = await idempotency.find_response(db, user_id, key, request_hash)
+    except idempotency.IdempotencyConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if replay is None:
+        return None
+    return ORJSONResponse(replay, headers={"Idempotent-Replayed": "true"})
 
 @app.post("/orders/", response_model=schemas.OrderWithItems)
 async def create_order(
     order: schemas.OrderCreate,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    idempotency_key: Optional[str] = Header(None, max_length=idempotency.IDEMPOTENCY_KEY_MAX_LENGTH),
+    db: AsyncSession = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
 ):
+    # Цены берутся из индекса меню, неизвестные позиции отклоняются разом
+    menu = await catalog.snapshot()
+    if not order.items:
+        raise HTTPException(status_code=400, detail="Order has no items")
+    unknown = menu.unknown_items([item.pizza_name for item in order.items])
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown menu items: {', '.join(unknown)}")
+
+    # Повторная отправка с тем же Idempotency-Key возвращает сохранённый ответ
+    request_hash = idempotency.request_fingerprint(order) if idempotency_key else None
+    if idempotency_key:
+        replay = await replay_order(db, current_user_id, idempotency_key, request_hash)
+        if replay is not None:
+            return replay
+
     try:
+        key_row = None
+        if idempotency_key:
+            key_row = await idempotency.reserve(db, current_user_id, idempotency_key, request_hash)
+
         order_hash = str(uuid.uuid4())
+        item_rows = [
+            {
+                "pizza_name": item.pizza_name,
+                "quantity": item.quantity,
+                "price_kopecks": menu.prices[item.pizza_name],
+            }
+            for item in order.items
+        ]
+        total_kopecks = sum(row["quantity"] * row["price_kopecks"] for row in item_rows)
         db_order = models.Order(
-            user_id=current_user.id,
-            order_hash=order_hash
+            user_id=current_user_id,
+            order_hash=order_hash,
+            total_kopecks=total_kopecks,
         )
         db.add(db_order)
-        db.flush()
-        order_items = []
+        await db.flush()
         
-        # Добавляем товары в заказ
-        for item in order.items:
-            db_item = models.OrderItem(
-                order_id=db_order.id,
-                pizza_name=item.pizza_name,
-                quantity=item.quantity,
-                price=item.price
+        # Добавляем товары в заказ одним INSERT ... VALUES (...), (...)
+        inserted = await db.execute(
+            insert(models.OrderItem)
+            .values([{"order_id": db_order.id, **row} for row in item_rows])
+            .returning(
+                models.OrderItem.id,
+                models.OrderItem.order_id,
+                models.OrderItem.pizza_name,
+                models.OrderItem.quantity,
+                models.OrderItem.price_kopecks,
             )
-            db.add(db_item)
-            order_items.append(db_item)
-        
-        db.commit()
-        db.refresh(db_order)
+        )
+        order_items = [
+            {
+                "id": row.id,
+                "order_id": row.order_id,
+                "pizza_name": row.pizza_name,
+                "quantity": row.quantity,
+                "price": models.to_rubles(row.price_kopecks),
+            }
+            for row in inserted
+        ]
         
-        return {
+        result = {
             "id": db_order.id,
             "user_id": db_order.user_id,
             "status": db_order.status,
             "order_hash": db_order.order_hash,
+            "total": db_order.total,
             "items": order_items
         }
-        
+        if key_row is not None:
+            idempotency.store_response(key_row, result)
+        await order_events.order_changed(
+            db, db_order.id, order_events.ORDER_CREATED, db_order.order_hash, db_order.user_id,
+            details={
+                "created_at": db_order.created_at.isoformat(),
+                "pizzas": sum(row["quantity"] for row in item_rows),
+            },
+        )
+        # Upsert строк часа - последний оператор перед commit: блокировки общих
+        # для всех заказов часа строк держатся как можно меньше
+        await sales.record_sales(
+            db,
+            db_order.created_at,
+            [(row["pizza_name"], row["quantity"], row["quantity"] * row["price_kopecks"]) for row in item_rows],
+            orders=1,
+        )
+        await db.commit()
+        # Ответ собран из RETURNING и меню, повторная проверка моделью не нужна
+        return ORJSONResponse(result)
+
+    except IntegrityError as e:
+        await db.rollback()
+        # Параллельный запрос с тем же ключом успел создать заказ первым
+        if idempotency_key:
+            replay = await replay_order(db, current_user_id, idempotency_key, request_hash)
+            if replay is not None:
+                return replay
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=400, detail=str(e))
 
 
 @app.get("/orders/", response_model=List[schemas.OrderWithItems])
 async def read_user_orders(
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    limit: int = Query(ORDERS_PAGE_SIZE, ge=1, le=ORDERS_MAX_PAGE_SIZE),
+    after_id: Optional[int] = Query(None, ge=1, le=MAX_ID),
+    order_status: Optional[str] = Query(None, alias="status"),
+    db: AsyncSession = Depends(get_read_db),
+    current_user_id: int = Depends(get_current_user_id)
 ):
-    orders = db.query(models.Order)\
-               .filter(models.Order.user_id == current_user.id)\
-               .order_by(models.Order.id.desc())\
-               .all()
-    
-    result = []
-    for order in orders:
-        items = db.query(models.OrderItem)\
-                 .filter(models.OrderItem.order_id == order.id)\
-                 .all()
-        
-        result.append({
-            "id": order.id,
-            "user_id": order.user_id,
-            "status": order.status,
-            "order_hash": order.order_hash,
-            "items": items
-        })
-    
-    return result
+    # Берём на один заказ больше, чтобы узнать, есть ли следующая страница
+    orders = await crud.load_user_orders(db, current_user_id, limit + 1, after_id, order_status)
+    headers = {}
+    if len(orders) > limit:
+        orders = orders[:limit]
+        headers[NEXT_CURSOR_HEADER] = str(orders[-1]["id"])
+    # Словари из строк БД уже в форме schemas.OrderWithItems, response_model - для документации
+    return ORJSONResponse(orders, headers=headers)
+
+@app.get("/orders/events")
+async def stream_order_events(user_id: int = Depends(get_stream_user_id)):
+    # Server-Sent Events по заказам пользователя: created, item_changed, status_changed, deleted.
+    # Токен проверяется при подключении; пропущенное за время обрыва клиент перечитывает из GET /orders/
+    try:
+        return order_stream.open_stream(user_id)
+    except order_stream.TooManySubscribers:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Too many open event streams")
 
 @app.delete("/order-items/{item_id}")
 async def delete_order_item(
     item_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
 ):
     # Удаление/уменьшение количества позиции в заказе с проверкой на пустой заказ
-    db_item = db.query(models.OrderItem)\
-                .join(models.Order)\
-                .filter(models.OrderItem.id == item_id)\
-                .first()
-    
-    if not db_item:
+    if not 0 < item_id <= MAX_ID:
         raise HTTPException(status_code=404, detail="Item not found")
-    
-    order_id = db_item.order_id
-    
-    if db_item.quantity > 1:
-        db_item.quantity -= 1
-        db.commit()
-        db.refresh(db_item)
-        message = "Quantity decreased"
-    else:
-        db.delete(db_item)
-        db.commit()
-        message = "Item removed"
-        
-        # Проверяем, остались ли еще позиции в заказе
-        remaining_items = db.query(models.OrderItem)\
-                          .filter(models.OrderItem.order_id == order_id)\
-                          .count()
-        
-        if remaining_items == 0:
-            # Если позиций не осталось - удаляем весь заказ
-            db.query(models.Order)\
-              .filter(models.Order.id == order_id)\
-              .delete()
-            db.commit()
-            message = "Item removed and order deleted as it became empty"
-    
+
+    message = await crud.decrement_order_item(db, current_user_id, item_id)
+    if message is None:
+        await db.rollback()
+        raise HTTPException(status_code=404, detail="Item not found")
+    await db.commit()
     return {"message": message}
+
+@app.post("/order-items/decrement", response_model=schemas.OrderItemsDecrementResult)
+async def decrement_order_items(
+    request: schemas.OrderItemsDecrement,
+    db: AsyncSession = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
+):
+    # Несколько уменьшений за один запрос и одну транзакцию
+    results = []
+    for item in request.items:
+        message = await crud.decrement_order_item(db, current_user_id, item.item_id, item.quantity)
+        results.append({"item_id": item.item_id, "message": message or "Item not found"})
+    await db.commit()
+    return {"results": results}
+
+@app.post("/admin/orders/{order_id}/status", response_model=schemas.OrderStatus)
+async def update_order_status(
+    order_id: int,
+    request: schemas.OrderStatusUpdate,
+    db: AsyncSession = Depends(get_db),
+    admin: schemas.User = Depends(get_current_admin)
+):
+    if request.status not in order_status.TRANSITIONS:
+        raise HTTPException(status_code=422, detail=f"Unknown status: {request.status}")
+    if not 0 < order_id <= MAX_ID:
+        raise HTTPException(status_code=404, detail="Order not found")
+
+    try:
+        changed = await crud.change_order_status(db, order_id, request.status)
+    except crud.StatusTransitionError as e:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail=str(e))
+    if changed is None:
+        await db.rollback()
+        raise HTTPException(status_code=404, detail="Order not found")
+    await db.commit()
+    return {"id": changed.id, "order_hash": changed.order_hash, "status": changed.status}
+
+@app.post(
+    "/kitchen/claim",
+    response_model=schemas.KitchenTicket,
+    responses={204: {"description": "No orders waiting for the kitchen"}},
+)
+async def claim_kitchen_ticket(
+    request: schemas.KitchenStation,
+    db: AsyncSession = Depends(get_db),
+    admin: schemas.User = Depends(get_current_admin)
+):
+    # Станция берёт следующий заказ: старые раньше, маленькие чуть вперёд
+    ticket = await kitchen.claim(db, request.station)
+    if ticket is None:
+        await db.rollback()
+        return Response(status_code=status.HTTP_204_NO_CONTENT)
+    await db.commit()
+    return ticket
+
+@app.post("/kitchen/tickets/{order_id}/complete", response_model=schemas.OrderStatus)
+async def complete_kitchen_ticket(
+    order_id: int,
+    request: schemas.KitchenStation,
+    db: AsyncSession = Depends(get_db),
+    admin: schemas.User = Depends(get_current_admin)
+):
+    if not 0 < order_id <= MAX_ID:
+        raise HTTPException(status_code=404, detail="Ticket not found")
+    changed = await kitchen.complete(db, order_id, request.station)
+    if changed is None:
+        await db.rollback()
+        raise HTTPException(status_code=404, detail="Ticket is not claimed by this station")
+    await db.commit()
+    return {"id": changed.id, "order_hash": changed.order_hash, "status": changed.status}
+
+@app.post("/kitchen/tickets/{order_id}/release", response_model=schemas.OrderStatus)
+async def release_kitchen_ticket(
+    order_id: int,
+    request: schemas.KitchenStation,
+    db: AsyncSession = Depends(get_db),
+    admin: schemas.User = Depends(get_current_admin)
+):
+    # Заказ возвращается в очередь со своим прежним местом
+    if not 0 < order_id <= MAX_ID:
+        raise HTTPException(status_code=404, detail="Ticket not found")
+    released = await kitchen.release(db, order_id, request.station)
+    if released is None:
+        await db.rollback()
+        raise HTTPException(status_code=404, detail="Ticket is not claimed by this station")
+    await db.commit()
+    return {"id": released.id, "order_hash": released.order_hash, "status": order_status.PREPARING}
+
+@app.get("/kitchen/events")
+async def stream_kitchen_board(admin: schemas.User = Depends(get_stream_admin)):
+    # Табло кухни (SSE): снимок очереди, затем queued, claimed, removed
+    try:
+        return order_stream.open_stream(kitchen.BOARD, source=kitchen.board, initial=kitchen.board_snapshot)
+    except order_stream.TooManySubscribers:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Too many open event streams")
+
+def report_range(since: Optional[datetime], until: Optional[datetime]):
+    try:
+        return sales.report_range(since, until)
+    except sales.ReportRangeError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+@app.get("/admin/reports/top-pizzas", response_model=List[schemas.PizzaSales])
+async def report_top_pizzas(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = Query(10, ge=1, le=100),
+    db: AsyncSession = Depends(get_db),
+    admin: schemas.User = Depends(get_current_admin)
+):
+    since, until = report_range(since, until)
+    return await sales.top_pizzas(db, since, until, limit)
+
+@app.get("/admin/reports/revenue", response_model=List[schemas.SalesPeriod])
+async def report_revenue(
+    period: str = Query("day", pattern="^(hour|day)$"),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_db),
+    admin: schemas.User = Depends(get_current_admin)
+):
+    since, until = report_range(since, until)
+    return await sales.revenue_by_period(db, since, until, period)
+
+@app.get("/admin/reports/average-basket", response_model=schemas.AverageBasket)
+async def report_average_basket(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_db),
+    admin: schemas.User = Depends(get_current_admin)
+):
+    since, until = report_range(since, until)
+    return await sales.average_basket(db, since, until)
+
+@app.get("/admin/export/orders")
+async def export_orders(
+    fmt: str = Query(export.NDJSON, alias="format", pattern="^(ndjson|csv)$"),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    after_id: Optional[int] = Query(None, ge=0, le=MAX_ID),
+    admin: schemas.User = Depends(get_current_admin)
+):
+    # Все заказы с позициями за период потоком. Оборванную выгрузку продолжают
+    # с after_id = id последнего полностью полученного заказа: в NDJSON это
+    # последняя целая строка, в CSV строки последнего заказа надо отбросить
+    try:
+        since, until = export.export_range(since, until)
+    except export.ExportRangeError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    slot = export.try_acquire()
+    if slot is None:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many exports in progress",
+            headers={"Retry-After": "60"},
+        )
+    return export.ExportResponse(
+        export.export_orders(slot, fmt, since, until, after_id),
+        slot,
+        media_type=export.MEDIA_TYPES[fmt],
+        headers={
+            "Content-Disposition": f'attachment; filename="{export.export_filename(fmt, since, until)}"',
+            "X-Accel-Buffering": "no",
+        },
+    )
\ No newline at end of file
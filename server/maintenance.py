@@ -0,0 +1,64 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import delete, select
+from pizzeria_db.database import AsyncSessionLocal
+from pizzeria_db import models
+
+logger = logging.getLogger(__name__)
+
+# Периодическая очистка просроченных строк; 0 отключает фоновую задачу
+SWEEP_INTERVAL_SECONDS = float(os.getenv("SWEEP_INTERVAL_SECONDS", "300"))
+SWEEP_CHUNK_SIZE = int(os.getenv("SWEEP_CHUNK_SIZE", "1000"))
+
+# Таблицы с индексом по expires_at
+EXPIRING_MODELS = (models.RefreshToken, models.IdempotencyKey)
+# Сколько хранить уже разосланные ботом смены статуса
+OUTBOX_RETENTION_SECONDS = float(os.getenv("OUTBOX_RETENTION_SECONDS", "86400"))
+
+
+async def purge_before(model, column, moment: datetime, chunk_size: int = SWEEP_CHUNK_SIZE) -> int:
+    # Удаляем пачками по chunk_size, каждая пачка - отдельная короткая транзакция,
+    # чтобы не держать блокировки на большой таблице. column должна быть с индексом
+    purged = 0
+    while True:
+        async with AsyncSessionLocal() as db:
+            expired_ids = select(model.id)\
+                .where(column < moment)\
+                .limit(chunk_size)\
+                .scalar_subquery()
+            result = await db.execute(delete(model).where(model.id.in_(expired_ids)))
+            await db.commit()
+        purged += result.rowcount
+        if result.rowcount < chunk_size:
+            return purged
+
+
+async def purge_expired(model, chunk_size: int = SWEEP_CHUNK_SIZE) -> int:
+    return await purge_before(model, model.expires_at, datetime.utcnow(), chunk_size)
+
+
+async def purge_dispatched_outbox(chunk_size: int = SWEEP_CHUNK_SIZE) -> int:
+    # Неразосланные строки (dispatched_at IS NULL) под сравнение не попадают
+    moment = datetime.utcnow() - timedelta(seconds=OUTBOX_RETENTION_SECONDS)
+    outbox = models.OrderStatusOutbox
+    return await purge_before(outbox, outbox.dispatched_at, moment, chunk_size)
+
+
+async def run_sweeper(interval: float = SWEEP_INTERVAL_SECONDS):
+    while True:
+        await asyncio.sleep(interval)
+        for model in EXPIRING_MODELS:
+            try:
+                purged = await purge_expired(model)
+                if purged:
+                    logger.info("Purged %s expired rows from %s", purged, model.__tablename__)
+            except Exception:
+                logger.exception("Failed to purge %s", model.__tablename__)
+        try:
+            purged = await purge_dispatched_outbox()
+            if purged:
+                logger.info("Purged %s dispatched rows from %s", purged, models.OrderStatusOutbox.__tablename__)
+        except Exception:
+            logger.exception("Failed to purge %s", models.OrderStatusOutbox.__tablename__)
\ No newline at end of file
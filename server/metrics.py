@@ -0,0 +1,21 @@
+from typing import Callable, Dict
+
+# Источники метрик: префикс -> функция, возвращающая {имя: значение}
+_collectors: Dict[str, Callable[[], Dict[str, float]]] = {}
+
+
+def register(prefix: str, collector: Callable[[], Dict[str, float]]):
+    _collectors[prefix] = collector
+
+
+def unregister(prefix: str):
+    _collectors.pop(prefix, None)
+
+
+def render() -> str:
+    # Текстовый формат Prometheus: по строке "<имя> <значение>" на метрику
+    lines = []
+    for prefix, collector in _collectors.items():
+        for name, value in collector().items():
+            lines.append(f"{prefix}_{name} {value}")
+    return "\n".join(lines) + "\n"
\ No newline at end of file
@@ -0,0 +1,50 @@
+import json
+from typing import Optional
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from pizzeria_db import models
+from pizzeria_db.listen import ORDER_EVENTS_CHANNEL
+
+ORDER_CREATED = "created"
+ORDER_ITEM_CHANGED = "item_changed"
+ORDER_STATUS_CHANGED = "status_changed"
+ORDER_DELETED = "deleted"
+ORDER_CLAIMED = "claimed"
+ORDER_RELEASED = "released"
+
+# Без NOTIFY события копятся в session.info и уходят в order_stream после commit
+PENDING_EVENTS_KEY = "pending_order_events"
+# Владельцы изменённых заказов: после commit их чтения на время идут на primary
+WRITERS_KEY = "order_writers"
+
+
+async def order_changed(
+    db: AsyncSession,
+    order_id: int,
+    event: str,
+    order_hash: Optional[str] = None,
+    user_id: Optional[int] = None,
+    status: Optional[str] = None,
+    details: Optional[dict] = None,
+):
+    # Вызывать до commit: NOTIFY уходит подписчикам только при фиксации транзакции,
+    # а при откате не уходит вовсе
+    if order_hash is None or user_id is None:
+        row = (await db.execute(
+            select(models.Order.order_hash, models.Order.user_id)
+            .where(models.Order.id == order_id)
+        )).first()
+        if row is None:
+            return
+        order_hash, user_id = row
+
+    payload = {"event": event, "order_id": order_id, "order_hash": order_hash, "user_id": user_id}
+    if status is not None:
+        payload["status"] = status
+    if details:
+        payload.update(details)
+    db.info.setdefault(WRITERS_KEY, set()).add(user_id)
+    if db.bind.dialect.name == "postgresql":
+        await db.execute(select(func.pg_notify(ORDER_EVENTS_CHANNEL, json.dumps(payload))))
+    else:
+        db.info.setdefault(PENDING_EVENTS_KEY, []).append(payload)
\ No newline at end of file
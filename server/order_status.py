@@ -0,0 +1,19 @@
+# Статусы заказа и допустимые переходы между ними
+PREPARING = "Готовится"
+READY = "Готов"
+DELIVERING = "Доставляется"
+DELIVERED = "Доставлен"
+CANCELLED = "Отменён"
+
+TRANSITIONS = {
+    PREPARING: {READY, CANCELLED},
+    READY: {DELIVERING, DELIVERED, CANCELLED},
+    DELIVERING: {DELIVERED},
+    DELIVERED: set(),
+    CANCELLED: set(),
+}
+
+
+def previous_statuses(status: str) -> set:
+    # Из каких статусов можно перейти в status
+    return {current for current, targets in TRANSITIONS.items() if status in targets}
\ No newline at end of file
@@ -0,0 +1,193 @@
+import asyncio
+import json
+import logging
+import os
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Set
+from fastapi.responses import StreamingResponse
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from pizzeria_db import listen
+import order_events
+
+logger = logging.getLogger(__name__)
+
+# Очередь подписчика ограничена: отставший клиент отключается,
+# переподключается и перечитывает заказы
+ORDER_STREAM_QUEUE_SIZE = int(os.getenv("ORDER_STREAM_QUEUE_SIZE", "100"))
+ORDER_STREAM_MAX_PER_USER = int(os.getenv("ORDER_STREAM_MAX_PER_USER", "10"))
+ORDER_STREAM_HEARTBEAT_SECONDS = float(os.getenv("ORDER_STREAM_HEARTBEAT_SECONDS", "15"))
+ORDER_STREAM_RETRY_MS = 5000
+
+# Кладётся в очередь вместо события, когда подписчика нужно закрыть
+CLOSED = None
+
+# Дополнительные обработчики событий заказов: callback(payload: dict)
+event_handlers: List[Callable[[dict], None]] = []
+
+
+class TooManySubscribers(Exception):
+    pass
+
+
+class OrderEventBroker:
+    # Подписчик - asyncio.Queue в event loop, а не поток: простаивающее
+    # соединение стоит только очереди и приостановленной корутины ответа.
+    # Ключ подписки - id пользователя или общий канал вроде табло кухни
+    def __init__(self, queue_size: int, max_per_user: int):
+        self.queue_size = queue_size
+        self.max_per_user = max_per_user
+        self._subscribers: Dict[Hashable, Set[asyncio.Queue]] = {}
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    def subscribers_of(self, key: Hashable) -> int:
+        return len(self._subscribers.get(key, ()))
+
+    def subscribe(self, key: Hashable) -> asyncio.Queue:
+        # Проверка лимита и подписка без await между ними: одновременные
+        # подключения одного пользователя не проходят лимит разом
+        queues = self._subscribers.setdefault(key, set())
+        if len(queues) >= self.max_per_user:
+            if not queues:
+                del self._subscribers[key]
+            raise TooManySubscribers(key)
+        queue = asyncio.Queue(self.queue_size)
+        queues.add(queue)
+        return queue
+
+    def unsubscribe(self, key: Hashable, queue: asyncio.Queue):
+        queues = self._subscribers.get(key)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._subscribers[key]
+
+    def publish(self, key: Hashable, payload: dict):
+        self.published += 1
+        for queue in list(self._subscribers.get(key, ())):
+            try:
+                queue.put_nowait(payload)
+                self.delivered += 1
+            except asyncio.QueueFull:
+                # Вместо накопленных событий - сигнал закрыть поток
+                self.dropped += 1
+                self.unsubscribe(key, queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(CLOSED)
+
+    def close_all(self):
+        for key, queues in list(self._subscribers.items()):
+            for queue in list(queues):
+                self.unsubscribe(key, queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(CLOSED)
+
+    def stats(self):
+        return {
+            "users": len(self._subscribers),
+            "subscribers": sum(len(queues) for queues in self._subscribers.values()),
+            "published_total": self.published,
+            "delivered_total": self.delivered,
+            "dropped_total": self.dropped,
+        }
+
+
+broker = OrderEventBroker(ORDER_STREAM_QUEUE_SIZE, ORDER_STREAM_MAX_PER_USER)
+
+
+def format_event(payload: dict) -> str:
+    return f"event: {payload['event']}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+def dispatch(payload: dict):
+    broker.publish(payload.get("user_id"), payload)
+    for handler in event_handlers:
+        try:
+            handler(payload)
+        except Exception:
+            logger.exception("Order event handler failed: %r", payload)
+
+
+async def stream(
+    key: Hashable,
+    queue: asyncio.Queue,
+    heartbeat: float = ORDER_STREAM_HEARTBEAT_SECONDS,
+    source: OrderEventBroker = broker,
+    initial: Callable[[], List[dict]] = list,
+):
+    # Подписка живёт, пока StreamingResponse читает генератор;
+    # при отключении клиента генератор закрывается и отписывается.
+    # Подписка создаётся до генератора, поэтому initial() не пропускает событий
+    try:
+        yield f"retry: {ORDER_STREAM_RETRY_MS}\n\n"
+        for payload in initial():
+            yield format_event(payload)
+        while True:
+            try:
+                payload = await asyncio.wait_for(queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                # Комментарий SSE не даёт прокси закрыть простаивающее соединение
+                yield ": ping\n\n"
+                continue
+            if payload is CLOSED:
+                return
+            yield format_event(payload)
+    finally:
+        source.unsubscribe(key, queue)
+
+
+class EventStreamResponse(StreamingResponse):
+    # Отписывает и тогда, когда ответ закончился, так и не начав читать генератор
+    def __init__(self, content, on_close: Callable[[], None]):
+        super().__init__(
+            content,
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.on_close()
+
+
+def open_stream(
+    key: Hashable,
+    source: OrderEventBroker = broker,
+    initial: Callable[[], List[dict]] = list,
+) -> EventStreamResponse:
+    # Подписывается сразу, в обработчике; сверх лимита - TooManySubscribers
+    queue = source.subscribe(key)
+    return EventStreamResponse(
+        stream(key, queue, source=source, initial=initial),
+        lambda: source.unsubscribe(key, queue),
+    )
+
+
+# Без Postgres события одного процесса доставляются после commit его сессии
+@event.listens_for(Session, "after_commit")
+def _publish_committed(session):
+    for payload in session.info.pop(order_events.PENDING_EVENTS_KEY, ()):
+        dispatch(payload)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back(session):
+    session.info.pop(order_events.PENDING_EVENTS_KEY, None)
+
+
+async def listen_order_events(database_url: str, on_reconnect: Optional[Callable[[], Awaitable]] = None):
+    # С Postgres события всех воркеров приходят через LISTEN уже после commit.
+    # При обрыве соединения подписчики закрываются: пропущенное они перечитают,
+    # а состояние в памяти восстанавливает on_reconnect после переподключения
+    async def on_connect(reconnected: bool):
+        if reconnected and on_reconnect is not None:
+            await on_reconnect()
+
+    await listen.listen_order_events(database_url, dispatch, on_connect, broker.close_all)
\ No newline at end of file
@@ -0,0 +1,220 @@
+import cProfile
+import contextvars
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import event
+from starlette.datastructures import MutableHeaders
+from pizzeria_db.database import async_engine
+import metrics
+
+# Профилирование запросов включается явно; выключенное ничего не подключает
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() in ("1", "true", "yes")
+# Запись cProfile: доля профилируемых запросов и порог, с которого профиль сохраняется
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0.01"))
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+SERVER_TIMING_HEADER = "Server-Timing"
+
+
+class RequestTiming:
+    __slots__ = ("db_seconds", "db_statements", "hash_seconds", "serialize_seconds")
+
+    def __init__(self):
+        self.db_seconds = 0.0
+        self.db_statements = 0
+        self.hash_seconds = 0.0
+        self.serialize_seconds = 0.0
+
+    def server_timing(self, wall_seconds: float) -> str:
+        return (
+            f"app;dur={wall_seconds * 1000:.1f}, "
+            f'db;dur={self.db_seconds * 1000:.1f};desc="{self.db_statements} queries", '
+            f"hash;dur={self.hash_seconds * 1000:.1f}, "
+            f"serialize;dur={self.serialize_seconds * 1000:.1f}"
+        )
+
+
+# Замеры текущего запроса; None вне запроса и при выключенном профилировании
+current_timing: contextvars.ContextVar[Optional[RequestTiming]] = contextvars.ContextVar(
+    "current_timing", default=None
+)
+
+
+@contextmanager
+def timed(field: str):
+    # Добавляет длительность блока к полю замеров текущего запроса
+    timing = current_timing.get()
+    if timing is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        setattr(timing, field, getattr(timing, field) + time.perf_counter() - started)
+
+
+class RouteStats:
+    # Суммы по маршрутам для /metrics
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.routes = {}
+        self.profiles_saved = 0
+
+    def record(self, method: str, route: str, wall: float, timing: RequestTiming):
+        with self._lock:
+            stats = self.routes.setdefault((method, route), {
+                "requests_total": 0,
+                "wall_seconds_total": 0.0,
+                "wall_seconds_max": 0.0,
+                "db_seconds_total": 0.0,
+                "db_statements_total": 0,
+                "hash_seconds_total": 0.0,
+                "serialize_seconds_total": 0.0,
+            })
+            stats["requests_total"] += 1
+            stats["wall_seconds_total"] += wall
+            stats["wall_seconds_max"] = max(stats["wall_seconds_max"], wall)
+            stats["db_seconds_total"] += timing.db_seconds
+            stats["db_statements_total"] += timing.db_statements
+            stats["hash_seconds_total"] += timing.hash_seconds
+            stats["serialize_seconds_total"] += timing.serialize_seconds
+
+    def stats(self):
+        # Метка маршрута внутри имени: metrics.render выводит его как есть
+        with self._lock:
+            result = {"profiles_saved_total": self.profiles_saved}
+            for (method, route), stats in self.routes.items():
+                labels = f'{{method="{method}",route="{route}"}}'
+                for name, value in stats.items():
+                    result[f"request_{name}{labels}"] = round(value, 6)
+            return result
+
+
+route_stats = RouteStats()
+
+
+class SlowRequestProfiler:
+    # cProfile видит весь поток event loop, поэтому одновременно профилируется
+    # один запрос, а чужие корутины в профиле - ожидаемый шум
+    def __init__(self, sample_rate: float, slow_ms: float, directory: str):
+        self.sample_rate = sample_rate
+        self.slow_seconds = slow_ms / 1000
+        self.directory = directory
+        self.active = False
+
+    def start(self) -> Optional[cProfile.Profile]:
+        if not self.slow_seconds or self.active or random.random() >= self.sample_rate:
+            return None
+        self.active = True
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def finish(self, profile: cProfile.Profile, method: str, route: str, wall: float):
+        profile.disable()
+        self.active = False
+        if wall < self.slow_seconds:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        name = re.sub(r"[^A-Za-z0-9]+", "_", f"{method}_{route}").strip("_")
+        stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+        profile.dump_stats(os.path.join(self.directory, f"{stamp}_{name}_{wall * 1000:.0f}ms.prof"))
+        route_stats.profiles_saved += 1
+
+
+class ProfilingMiddleware:
+    # Чистый ASGI: без BaseHTTPMiddleware и лишней задачи на запрос
+    def __init__(self, app, profiler: SlowRequestProfiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timing = RequestTiming()
+        token = current_timing.set(timing)
+        profile = self.profiler.start()
+        started = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers.append(SERVER_TIMING_HEADER, timing.server_timing(time.perf_counter() - started))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            wall = time.perf_counter() - started
+            current_timing.reset(token)
+            route = scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            route_stats.record(scope["method"], path, wall, timing)
+            if profile is not None:
+                self.profiler.finish(profile, scope["method"], path, wall)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_timing.get() is not None:
+        conn.info.setdefault("profiling_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    timing = current_timing.get()
+    if timing is not None and conn.info.get("profiling_started"):
+        timing.db_seconds += time.perf_counter() - conn.info["profiling_started"].pop()
+        timing.db_statements += 1
+
+
+def _time_serialization():
+    # Проверка response_model и сборка JSON идут в fastapi.routing.serialize_response;
+    # публичного хука нет, поэтому функция оборачивается, если она есть.
+    # Маршруты с ORJSONResponse её не вызывают: их render замеряется в responses.py
+    import fastapi.routing
+    original = getattr(fastapi.routing, "serialize_response", None)
+    if original is None or getattr(original, "profiled", False):
+        return
+
+    async def serialize_response(*args, **kwargs):
+        with timed("serialize_seconds"):
+            return await original(*args, **kwargs)
+
+    serialize_response.profiled = True
+    serialize_response.original = original
+    fastapi.routing.serialize_response = serialize_response
+
+
+def install(app, enabled: bool = PROFILING_ENABLED):
+    if not enabled:
+        return
+    if not event.contains(async_engine.sync_engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(async_engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(async_engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+    _time_serialization()
+    app.add_middleware(
+        ProfilingMiddleware,
+        profiler=SlowRequestProfiler(PROFILE_SAMPLE_RATE, PROFILE_SLOW_MS, PROFILE_DIR),
+    )
+    metrics.register("http", route_stats.stats)
+
+
+def uninstall():
+    # Снимает глобальные обёртки install; middleware остаётся в своём приложении
+    import fastapi.routing
+    wrapped = getattr(fastapi.routing, "serialize_response", None)
+    if getattr(wrapped, "profiled", False):
+        fastapi.routing.serialize_response = wrapped.original
+    if event.contains(async_engine.sync_engine, "before_cursor_execute", _before_cursor_execute):
+        event.remove(async_engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+        event.remove(async_engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+    metrics.unregister("http")
\ No newline at end of file
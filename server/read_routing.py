@@ -0,0 +1,30 @@
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from pizzeria_db.database import RecentWrites
+import order_events
+import order_stream
+
+# Read-your-writes: после изменения своих заказов пользователь какое-то время
+# читает с primary. Записи этого процесса отмечаются сразу после commit,
+# записи других воркеров - по событиям заказов через LISTEN
+recent_writers = RecentWrites()
+
+
+def on_order_event(payload: dict):
+    if payload.get("user_id") is not None:
+        recent_writers.wrote((payload["user_id"],))
+
+
+order_stream.event_handlers.append(on_order_event)
+
+
+@event.listens_for(Session, "after_commit")
+def _mark_writers(session):
+    writers = session.info.pop(order_events.WRITERS_KEY, None)
+    if writers:
+        recent_writers.wrote(writers)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_writers(session):
+    session.info.pop(order_events.WRITERS_KEY, None)
\ No newline at end of file
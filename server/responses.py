@@ -0,0 +1,16 @@
+from typing import Any
+import orjson
+from fastapi.responses import JSONResponse
+import profiling
+
+
+class ORJSONResponse(JSONResponse):
+    # Для ответов, собранных из строк БД: содержимое уже нужной формы,
+    # поэтому проверка через response_model не нужна, а orjson кодирует
+    # списки словарей в разы быстрее json.dumps.
+    # Не ставится default_response_class: тогда остальные маршруты потеряли бы
+    # быстрый путь FastAPI с сериализацией моделей сразу в JSON
+    def render(self, content: Any) -> bytes:
+        # Сериализация мимо serialize_response, поэтому замеряется здесь
+        with profiling.timed("serialize_seconds"):
+            return orjson.dumps(content)
\ No newline at end of file
@@ -0,0 +1,143 @@
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, List, Optional, Tuple
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from pizzeria_db import models
+
+# Отчёты читают почасовые сводки, которые пополняются в тех же транзакциях,
+# что создают заказы и убирают из них позиции. Полного прохода по
+# order_items нет ни при записи, ни при чтении.
+
+REPORT_DEFAULT_DAYS = 7
+REPORT_MAX_DAYS = 366
+
+
+def hour_of(moment: datetime) -> datetime:
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def upsert(db: AsyncSession, model):
+    if db.bind.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model)
+
+
+async def record_sales(
+    db: AsyncSession,
+    created_at: datetime,
+    items: Iterable[Tuple[str, int, int]],
+    orders: int = 0,
+):
+    # items - (пицца, количество, копейки); при удалении позиций значения отрицательные.
+    # Строки часа общие для всех заказов этого часа и блокируются до commit,
+    # поэтому вызывать ближе к концу транзакции. Пиццы сортируются, чтобы
+    # параллельные транзакции брали блокировки в одном порядке
+    hour = hour_of(created_at)
+    by_pizza = defaultdict(lambda: [0, 0])
+    for pizza_name, quantity, kopecks in items:
+        by_pizza[pizza_name][0] += quantity
+        by_pizza[pizza_name][1] += kopecks
+
+    pizza_rows = upsert(db, models.SalesHourlyPizza).values([
+        {"hour": hour, "pizza_name": name, "quantity": quantity, "revenue_kopecks": kopecks}
+        for name, (quantity, kopecks) in sorted(by_pizza.items())
+    ])
+    await db.execute(pizza_rows.on_conflict_do_update(
+        index_elements=["hour", "pizza_name"],
+        set_={
+            "quantity": models.SalesHourlyPizza.quantity + pizza_rows.excluded.quantity,
+            "revenue_kopecks": models.SalesHourlyPizza.revenue_kopecks + pizza_rows.excluded.revenue_kopecks,
+        },
+    ))
+
+    hourly = upsert(db, models.SalesHourly).values(
+        hour=hour,
+        orders=orders,
+        revenue_kopecks=sum(kopecks for _, kopecks in by_pizza.values()),
+    )
+    await db.execute(hourly.on_conflict_do_update(
+        index_elements=["hour"],
+        set_={
+            "orders": models.SalesHourly.orders + hourly.excluded.orders,
+            "revenue_kopecks": models.SalesHourly.revenue_kopecks + hourly.excluded.revenue_kopecks,
+        },
+    ))
+
+
+class ReportRangeError(Exception):
+    pass
+
+
+def as_utc(moment: datetime) -> datetime:
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def report_range(since: Optional[datetime], until: Optional[datetime]) -> Tuple[datetime, datetime]:
+    # Полуинтервал [since, until) по целым часам; по умолчанию последние 7 дней
+    until = hour_of(as_utc(until)) if until else hour_of(datetime.utcnow()) + timedelta(hours=1)
+    since = hour_of(as_utc(since)) if since else until - timedelta(days=REPORT_DEFAULT_DAYS)
+    if since >= until:
+        raise ReportRangeError("since must be earlier than until")
+    if until - since > timedelta(days=REPORT_MAX_DAYS):
+        raise ReportRangeError(f"Report range is limited to {REPORT_MAX_DAYS} days")
+    return since, until
+
+
+async def top_pizzas(db: AsyncSession, since: datetime, until: datetime, limit: int) -> List[dict]:
+    quantity = func.sum(models.SalesHourlyPizza.quantity).label("quantity")
+    revenue = func.sum(models.SalesHourlyPizza.revenue_kopecks).label("revenue_kopecks")
+    rows = await db.execute(
+        select(models.SalesHourlyPizza.pizza_name, quantity, revenue)
+        .where(models.SalesHourlyPizza.hour >= since, models.SalesHourlyPizza.hour < until)
+        .group_by(models.SalesHourlyPizza.pizza_name)
+        .having(quantity > 0)
+        .order_by(quantity.desc(), revenue.desc())
+        .limit(limit)
+    )
+    return [
+        {"pizza_name": row.pizza_name, "quantity": row.quantity, "revenue": models.to_rubles(row.revenue_kopecks)}
+        for row in rows
+    ]
+
+
+async def revenue_by_period(db: AsyncSession, since: datetime, until: datetime, period: str) -> List[dict]:
+    # Дни собираются из часов здесь же: строк не больше 24 * REPORT_MAX_DAYS,
+    # а усечение даты у SQLite и Postgres записывается по-разному
+    rows = await db.execute(
+        select(models.SalesHourly.hour, models.SalesHourly.orders, models.SalesHourly.revenue_kopecks)
+        .where(models.SalesHourly.hour >= since, models.SalesHourly.hour < until)
+        .order_by(models.SalesHourly.hour)
+    )
+    periods = {}
+    for row in rows:
+        start = row.hour if period == "hour" else row.hour.replace(hour=0)
+        totals = periods.setdefault(start, [0, 0])
+        totals[0] += row.orders
+        totals[1] += row.revenue_kopecks
+    return [
+        {"period_start": start, "orders": orders, "revenue": models.to_rubles(kopecks)}
+        for start, (orders, kopecks) in periods.items()
+    ]
+
+
+async def average_basket(db: AsyncSession, since: datetime, until: datetime) -> dict:
+    row = (await db.execute(
+        select(
+            func.coalesce(func.sum(models.SalesHourly.orders), 0).label("orders"),
+            func.coalesce(func.sum(models.SalesHourly.revenue_kopecks), 0).label("revenue_kopecks"),
+        )
+        .where(models.SalesHourly.hour >= since, models.SalesHourly.hour < until)
+    )).one()
+    average = row.revenue_kopecks / row.orders if row.orders else 0
+    return {
+        "since": since,
+        "until": until,
+        "orders": row.orders,
+        "revenue": models.to_rubles(row.revenue_kopecks),
+        "average_basket": round(models.to_rubles(average), 2),
+    }
@@ -1,5 +1,6 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, List
+from datetime import datetime
 
 class UserBase(BaseModel):
     username: str
@@ -13,7 +14,7 @@ class User(UserBase):
     id: int
     
     class Config:
-        orm_mode = True
+        from_attributes = True
 
 class Token(BaseModel):
     access_token: str
@@ -26,17 +27,24 @@ class RefreshTokenRequest(BaseModel):
 class TokenData(BaseModel):
     username: Optional[str] = None
 
-class OrderItemCreate(BaseModel):
+# Больше за раз не заказывают; заодно число не выходит за пределы колонки
+MAX_ITEM_QUANTITY = 1000
+
+class OrderItemBase(BaseModel):
     pizza_name: str
-    quantity: int
-    price: float
+    quantity: int = Field(..., gt=0, le=MAX_ITEM_QUANTITY)
+
+class OrderItemCreate(OrderItemBase):
+    # Цену определяет сервер по меню, присланное клиентом значение игнорируется
+    price: Optional[float] = None
 
-class OrderItemResponse(OrderItemCreate):
+class OrderItemResponse(OrderItemBase):
     id: int
     order_id: int
+    price: float
 
     class Config:
-        orm_mode = True
+        from_attributes = True
 
 class OrderCreate(BaseModel):
     items: List[OrderItemCreate]
@@ -46,7 +54,63 @@ class OrderWithItems(BaseModel):
     user_id: int
     status: str
     order_hash: str
+    total: float
     items: List[OrderItemResponse]
     
     class Config:
-        orm_mode = True
+        from_attributes = True
+
+class OrderItemDecrement(BaseModel):
+    item_id: int = Field(..., ge=1, le=2**31 - 1)
+    quantity: int = Field(1, ge=1, le=MAX_ITEM_QUANTITY)
+
+class OrderItemsDecrement(BaseModel):
+    items: List[OrderItemDecrement] = Field(..., min_length=1, max_length=100)
+
+class OrderItemDecrementResult(BaseModel):
+    item_id: int
+    message: str
+
+class OrderItemsDecrementResult(BaseModel):
+    results: List[OrderItemDecrementResult]
+
+class OrderStatusUpdate(BaseModel):
+    status: str
+
+class OrderStatus(BaseModel):
+    id: int
+    order_hash: str
+    status: str
+
+class PizzaSales(BaseModel):
+    pizza_name: str
+    quantity: int
+    revenue: float
+
+class SalesPeriod(BaseModel):
+    period_start: datetime
+    orders: int
+    revenue: float
+
+class AverageBasket(BaseModel):
+    since: datetime
+    until: datetime
+    orders: int
+    revenue: float
+    average_basket: float
+
+class KitchenStation(BaseModel):
+    station: str = Field(..., min_length=1, max_length=64)
+
+class KitchenItem(BaseModel):
+    pizza_name: str
+    quantity: int
+
+class KitchenTicket(BaseModel):
+    order_id: int
+    order_hash: str
+    created_at: datetime
+    pizzas: int
+    station: Optional[str]
+    claimed_at: Optional[datetime]
+    items: List[KitchenItem]
\ No newline at end of file
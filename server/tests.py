@@ -3,19 +3,40 @@ from hypothesis import given, strategies as st, settings, HealthCheck
 import pytest
 from datetime import datetime, timedelta
 from typing import Dict, Any, List
-from database import SessionLocal, engine
-import models
-from main import app
+from pizzeria_db.database import SessionLocal, engine, async_engine
+from pizzeria_db import models
+from pizzeria_db.migrate import upgrade
+import main
+import profiling
+import admission
+from main import app, hash_refresh_token, MAX_ID
+from maintenance import purge_expired, purge_dispatched_outbox, OUTBOX_RETENTION_SECONDS
+from hashing import hasher
+from passlib.context import CryptContext
 from jose import jwt
 from fastapi.testclient import TestClient
+from sqlalchemy import event
 from sqlalchemy.orm import Session
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+@pytest.fixture(scope="session", autouse=True)
+def schema():
+    # Таблицы создают миграции, как шаг migrate в docker-compose, а не импорт main
+    upgrade()
 
 @pytest.fixture(scope="function")
 def db():
     db = SessionLocal()
     try:
         # Очищаем все таблицы перед тестом
+        db.query(models.OrderStatusOutbox).delete()
+        db.query(models.SalesHourlyPizza).delete()
+        db.query(models.SalesHourly).delete()
+        db.query(models.OrderSubscription).delete()
+        db.query(models.IdempotencyKey).delete()
         db.query(models.OrderItem).delete()
         db.query(models.Order).delete()
         db.query(models.RefreshToken).delete()
@@ -26,6 +47,11 @@ def db():
         db.rollback()
         db.close()
 
+@pytest.fixture(autouse=True)
+def login_limits(monkeypatch):
+    # Все запросы TestClient приходят с одного адреса: вёдра лимитов свои у каждого теста
+    monkeypatch.setattr(admission, "login_limits", admission.default_login_limits())
+
 @pytest.fixture
 def client():
     with TestClient(app) as client:
@@ -74,7 +100,9 @@ def create_test_user(db: Session) -> models.User:
     return test_user
 
 def get_auth_headers(client: TestClient, db: Session) -> Dict[str, str]:
-    user = create_test_user(db)
+    return login_headers(client, create_test_user(db))
+
+def login_headers(client: TestClient, user: models.User) -> Dict[str, str]:
     token_response = client.post("/token", data={
         "username": user.username,
         "password": "secret",
@@ -114,7 +142,7 @@ def test_fuzz_refresh_token(client, token: str, db: Session):
 
     db_refresh_token = models.RefreshToken(
         user_id=test_user.id,
-        token=valid_token,
+        token=hash_refresh_token(valid_token),
         expires_at=datetime.utcnow() + timedelta(days=1)
     )
     db.add(db_refresh_token)
@@ -143,7 +171,7 @@ def test_fuzz_get_orders(client, db: Session):
             order_id=order.id,
             pizza_name="Маргарита",
             quantity=1,
-            price=350
+            price_kopecks=35000
         ))
     db.commit()
     
@@ -151,6 +179,77 @@ def test_fuzz_get_orders(client, db: Session):
     assert response.status_code == 200
     assert isinstance(response.json(), list)
 
+def count_queries(fn) -> int:
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        fn()
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    return len(statements)
+
+def add_orders(db: Session, user_id: int, count: int):
+    for _ in range(count):
+        order = models.Order(user_id=user_id, order_hash=str(uuid.uuid4()))
+        db.add(order)
+        db.flush()
+        for name in ("Маргарита", "Пепперони"):
+            db.add(models.OrderItem(
+                order_id=order.id,
+                pizza_name=name,
+                quantity=1,
+                price_kopecks=35000
+            ))
+    db.commit()
+
+def test_get_orders_query_count_is_constant(client, db: Session):
+    user = create_test_user(db)
+    headers = login_headers(client, user)
+
+    add_orders(db, user.id, 1)
+    few = count_queries(lambda: client.get("/orders/?limit=100", headers=headers))
+
+    add_orders(db, user.id, 20)
+    response = None
+    def fetch():
+        nonlocal response
+        response = client.get("/orders/?limit=100", headers=headers)
+    many = count_queries(fetch)
+
+    assert response.status_code == 200
+    assert len(response.json()) == 21
+    assert all(len(order["items"]) == 2 for order in response.json())
+    assert many == few
+
+def test_get_orders_keyset_pagination(client, db: Session):
+    user = create_test_user(db)
+    headers = login_headers(client, user)
+    add_orders(db, user.id, 5)
+
+    seen = []
+    cursor = None
+    while True:
+        url = "/orders/?limit=2" + (f"&after_id={cursor}" if cursor else "")
+        response = client.get(url, headers=headers)
+        assert response.status_code == 200
+        page = response.json()
+        assert len(page) <= 2
+        seen.extend(order["id"] for order in page)
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+
+    assert len(seen) == 5
+    assert seen == sorted(seen, reverse=True)
+
+    response = client.get("/orders/?status=Доставлен", headers=headers)
+    assert response.status_code == 200
+    assert response.json() == []
+
 @given(item_id=st.integers())
 @settings(max_examples=5, suppress_health_check=[HealthCheck.function_scoped_fixture],
         deadline=500)
@@ -165,7 +264,7 @@ def test_fuzz_delete_order_item(client, item_id: int, db: Session):
         order_id=order.id,
         pizza_name="Маргарита",
         quantity=2,
-        price=350
+        price_kopecks=35000
     )
     db.add(db_item)
     db.commit()
@@ -173,6 +272,40 @@ def test_fuzz_delete_order_item(client, item_id: int, db: Session):
     response = client.delete(f"/order-items/{item_id}", headers=headers)
     assert response.status_code in (200, 404)
 
+def test_login_rehashes_password_when_cost_changes(client, db: Session, monkeypatch):
+    monkeypatch.setattr(hasher, "context", CryptContext(schemes=["bcrypt"], bcrypt__rounds=4))
+    monkeypatch.setattr(hasher, "rehash_on_login", True)
+    user = create_test_user(db)
+
+    login_headers(client, user)
+
+    db.refresh(user)
+    assert user.hashed_password.startswith("$2b$04$")
+    assert hasher.context.verify("secret", user.hashed_password)
+
+def test_metrics_expose_password_hash_queue(client, db: Session):
+    get_auth_headers(client, db)
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert "password_hash_completed_total" in response.text
+    assert "password_hash_queued 0" in response.text
+    assert "db_pool_checked_out" in response.text
+    assert "db_pool_wait_seconds_max" in response.text
+
+def test_current_user_is_cached_and_invalidated(client, db: Session):
+    user = create_test_user(db)
+    headers = login_headers(client, user)
+
+    assert client.get("/users/me/", headers=headers).status_code == 200
+    assert count_queries(lambda: client.get("/users/me/", headers=headers)) == 0
+    assert "user_cache_hit_ratio" in client.get("/metrics").text
+
+    user.full_name = "Renamed User"
+    db.commit()
+
+    response = client.get("/users/me/", headers=headers)
+    assert response.json()["full_name"] == "Renamed User"
+
 def test_fuzz_get_current_user(client, db: Session):
     headers = get_auth_headers(client, db)
     response = client.get("/users/me/", headers=headers)
@@ -184,3 +317,675 @@ def test_fuzz_get_menu(client):
     assert response.status_code == 200
     assert isinstance(response.json(), list)
 
+def test_menu_conditional_get_and_invalidation(client, db: Session):
+    first = client.get("/menu")
+    etag = first.headers["ETag"]
+    assert first.status_code == 200
+    assert "max-age" in first.headers["Cache-Control"]
+
+    not_modified = None
+    def revalidate():
+        nonlocal not_modified
+        not_modified = client.get("/menu", headers={"If-None-Match": etag})
+    assert count_queries(revalidate) == 0
+    assert not_modified.status_code == 304
+
+    pizza = db.query(models.Pizza).filter(models.Pizza.name == "Маргарита").one()
+    old_price = pizza.price_kopecks
+    # Цена меню с копейками: хранится точно и отдаётся в рублях
+    pizza.price_kopecks = old_price + 1050
+    db.commit()
+    try:
+        changed = client.get("/menu", headers={"If-None-Match": etag})
+        assert changed.status_code == 200
+        assert changed.headers["ETag"] != etag
+        prices = {item["name"]: item["price"] for item in changed.json()}
+        assert prices["Маргарита"] == models.to_rubles(old_price) + 10.5
+        ordered = client.post("/orders/", headers=get_auth_headers(client, db), json={"items": [
+            {"pizza_name": "Маргарита", "quantity": 3},
+        ]})
+        assert ordered.json()["total"] == models.to_rubles(3 * (old_price + 1050))
+    finally:
+        pizza.price_kopecks = old_price
+        db.commit()
+
+def test_menu_snapshot_read_across_invalidation_is_not_kept(client):
+    from catalog import Catalog
+
+    menu = Catalog()
+    invalidated = False
+    def invalidate_during_read(*args):
+        # Пицца изменилась, пока снимок читался из БД
+        nonlocal invalidated
+        if not invalidated:
+            invalidated = True
+            menu.invalidate()
+    event.listen(async_engine.sync_engine, "before_cursor_execute", invalidate_during_read)
+    try:
+        client.portal.call(menu.snapshot)
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", invalidate_during_read)
+    assert invalidated and menu._snapshot is None
+    fresh = client.portal.call(menu.snapshot)
+    assert menu._snapshot is fresh
+
+def test_create_order_uses_menu_prices(client, db: Session):
+    headers = get_auth_headers(client, db)
+    menu = {item["name"]: item["price"] for item in client.get("/menu").json()}
+
+    response = client.post("/orders/", headers=headers, json={"items": [
+        {"pizza_name": "Маргарита", "quantity": 2, "price": 1},
+        {"pizza_name": "Пепперони", "quantity": 1},
+    ]})
+    assert response.status_code == 200
+    prices = {item["pizza_name"]: item["price"] for item in response.json()["items"]}
+    assert prices == {"Маргарита": menu["Маргарита"], "Пепперони": menu["Пепперони"]}
+    assert response.json()["total"] == 2 * menu["Маргарита"] + menu["Пепперони"]
+    listed = client.get("/orders/", headers=headers).json()[0]
+    assert listed["total"] == response.json()["total"]
+
+    before = db.query(models.Order).count()
+    response = client.post("/orders/", headers=headers, json={"items": [
+        {"pizza_name": "Маргарита", "quantity": 1},
+        {"pizza_name": "Шаурма", "quantity": 1},
+    ]})
+    assert response.status_code == 400
+    assert "Шаурма" in response.json()["detail"]
+    assert db.query(models.Order).count() == before
+
+@pytest.mark.parametrize("quantity", [0, -1])
+def test_create_order_rejects_non_positive_quantity(client, db: Session, quantity: int):
+    headers = get_auth_headers(client, db)
+    response = client.post("/orders/", headers=headers, json={"items": [
+        {"pizza_name": "Маргарита", "quantity": quantity},
+    ]})
+    assert response.status_code == 422
+
+def test_parallel_idempotent_submissions_create_one_order(client, db: Session):
+    user = create_test_user(db)
+    headers = {**login_headers(client, user), "Idempotency-Key": str(uuid.uuid4())}
+    payload = {"items": [{"pizza_name": "Маргарита", "quantity": 1}]}
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        responses = list(pool.map(
+            lambda _: client.post("/orders/", json=payload, headers=headers), range(8)
+        ))
+
+    assert all(response.status_code == 200 for response in responses)
+    assert len({response.json()["id"] for response in responses}) == 1
+    assert sum("Idempotent-Replayed" in response.headers for response in responses) == 7
+    assert db.query(models.Order).filter(models.Order.user_id == user.id).count() == 1
+
+    other = client.post("/orders/", headers=headers, json={
+        "items": [{"pizza_name": "Пепперони", "quantity": 1}]
+    })
+    assert other.status_code == 409
+
+def test_idempotent_retry_ignores_client_price(client, db: Session):
+    user = create_test_user(db)
+    headers = {**login_headers(client, user), "Idempotency-Key": str(uuid.uuid4())}
+    first = client.post("/orders/", headers=headers, json={
+        "items": [{"pizza_name": "Маргарита", "quantity": 1}]
+    })
+    # Цену клиента сервер не использует: повтор с другой ценой - тот же запрос
+    retry = client.post("/orders/", headers=headers, json={
+        "items": [{"pizza_name": "Маргарита", "quantity": 1, "price": 12.0}]
+    })
+    assert retry.status_code == 200
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert retry.json() == first.json()
+    assert db.query(models.Order).filter(models.Order.user_id == user.id).count() == 1
+
+def test_refresh_token_rotation(client, db: Session):
+    user = create_test_user(db)
+    tokens = client.post("/token", data={
+        "username": user.username,
+        "password": "secret",
+        "grant_type": "password"
+    }).json()
+    stored = db.query(models.RefreshToken).filter(models.RefreshToken.user_id == user.id).one()
+    assert stored.token == hash_refresh_token(tokens["refresh_token"])
+
+    rotated = client.post("/refresh-token", json={"refresh_token": tokens["refresh_token"]})
+    assert rotated.status_code == 200
+    assert rotated.json()["refresh_token"] != tokens["refresh_token"]
+
+    reused = client.post("/refresh-token", json={"refresh_token": tokens["refresh_token"]})
+    assert reused.status_code == 401
+    assert db.query(models.RefreshToken).filter(models.RefreshToken.user_id == user.id).count() == 1
+
+def test_sweeper_purges_expired_tokens_in_chunks(client, db: Session):
+    user = create_test_user(db)
+    db.add_all(
+        models.RefreshToken(
+            user_id=user.id,
+            token=str(uuid.uuid4()),
+            expires_at=datetime.utcnow() - timedelta(minutes=1)
+        )
+        for _ in range(25)
+    )
+    db.add(models.RefreshToken(
+        user_id=user.id,
+        token=str(uuid.uuid4()),
+        expires_at=datetime.utcnow() + timedelta(days=1)
+    ))
+    db.commit()
+
+    purged = client.portal.call(purge_expired, models.RefreshToken, 10)
+
+    assert purged == 25
+    assert db.query(models.RefreshToken).count() == 1
+
+def test_sweeper_purges_old_dispatched_outbox_rows(client, db: Session):
+    long_ago = datetime.utcnow() - timedelta(seconds=OUTBOX_RETENTION_SECONDS + 60)
+    def row(dispatched_at):
+        return models.OrderStatusOutbox(
+            order_id=1, order_hash="hash", status="ready", created_at=long_ago, dispatched_at=dispatched_at
+        )
+    db.add_all(row(long_ago) for _ in range(15))
+    # Свежая разосланная строка и неразосланная остаются
+    db.add_all([row(datetime.utcnow()), row(None)])
+    db.commit()
+
+    assert client.portal.call(purge_dispatched_outbox, 10) == 15
+    assert db.query(models.OrderStatusOutbox).count() == 2
+
+def test_delete_order_item_is_scoped_to_owner(client, db: Session):
+    owner = create_test_user(db)
+    headers = login_headers(client, owner)
+    order = models.Order(user_id=owner.id, order_hash=str(uuid.uuid4()), total_kopecks=70000)
+    order.items = [models.OrderItem(pizza_name="Маргарита", quantity=2, price_kopecks=35000)]
+    db.add(order)
+    db.commit()
+    item_id, order_id = order.items[0].id, order.id
+
+    stranger_headers = get_auth_headers(client, db)
+    assert client.delete(f"/order-items/{item_id}", headers=stranger_headers).status_code == 404
+
+    first = client.delete(f"/order-items/{item_id}", headers=headers)
+    assert first.json() == {"message": "Quantity decreased"}
+    db.expire_all()
+    assert db.get(models.Order, order_id).total_kopecks == 35000
+    second = client.delete(f"/order-items/{item_id}", headers=headers)
+    assert second.json() == {"message": "Item removed and order deleted as it became empty"}
+
+    db.expire_all()
+    assert db.get(models.Order, order_id) is None
+
+def test_bulk_decrement_order_items(client, db: Session):
+    user = create_test_user(db)
+    headers = login_headers(client, user)
+    order = models.Order(user_id=user.id, order_hash=str(uuid.uuid4()), total_kopecks=150000)
+    order.items = [
+        models.OrderItem(pizza_name="Маргарита", quantity=3, price_kopecks=35000),
+        models.OrderItem(pizza_name="Пепперони", quantity=1, price_kopecks=45000),
+    ]
+    db.add(order)
+    db.commit()
+    margherita, pepperoni = (item.id for item in order.items)
+
+    response = client.post("/order-items/decrement", headers=headers, json={"items": [
+        {"item_id": margherita, "quantity": 2},
+        {"item_id": pepperoni},
+        {"item_id": MAX_ID},
+    ]})
+
+    assert response.status_code == 200
+    assert [result["message"] for result in response.json()["results"]] == [
+        "Quantity decreased", "Item removed", "Item not found"
+    ]
+    db.expire_all()
+    assert [(item.id, item.quantity) for item in db.get(models.Order, order.id).items] == [(margherita, 1)]
+    assert db.get(models.Order, order.id).total_kopecks == 35000
+    # Количество ограничено так же, как при создании заказа: 2**63 не доходит до БД
+    assert client.post("/order-items/decrement", headers=headers, json={"items": [
+        {"item_id": margherita, "quantity": 2**63},
+    ]}).status_code == 422
+
+def test_admin_advances_order_status_through_outbox(client, db: Session, monkeypatch):
+    customer = create_test_user(db)
+    order = models.Order(user_id=customer.id, order_hash=str(uuid.uuid4()))
+    order.items = [models.OrderItem(pizza_name="Маргарита", quantity=1, price_kopecks=35000)]
+    db.add(order)
+    db.commit()
+    url = f"/admin/orders/{order.id}/status"
+
+    admin = create_test_user(db)
+    headers = login_headers(client, admin)
+    assert client.post(url, headers=headers, json={"status": "Готов"}).status_code == 403
+
+    monkeypatch.setattr(main, "ADMIN_USERNAMES", {admin.username})
+    response = client.post(url, headers=headers, json={"status": "Готов"})
+    assert response.status_code == 200
+    assert response.json()["status"] == "Готов"
+
+    assert client.post(url, headers=headers, json={"status": "Готовится"}).status_code == 409
+    assert client.post(url, headers=headers, json={"status": "Съеден"}).status_code == 422
+
+    outbox = db.query(models.OrderStatusOutbox).filter(models.OrderStatusOutbox.order_id == order.id).all()
+    assert [(row.order_hash, row.status, row.dispatched_at) for row in outbox] == [
+        (order.order_hash, "Готов", None)
+    ]
+
+    # Готовый заказ клиент уже не меняет
+    customer_headers = login_headers(client, customer)
+    assert client.delete(f"/order-items/{order.items[0].id}", headers=customer_headers).status_code == 404
+
+def test_migrations_match_models():
+    with engine.connect() as connection:
+        diff = compare_metadata(MigrationContext.configure(connection), models.Base.metadata)
+    assert diff == []
+
+def test_default_menu_comes_from_migration(db: Session):
+    from catalog import DEFAULT_MENU
+
+    # Меню уже есть после migrate; старт воркеров его не пишет и не гоняется за вставку
+    menu = [(pizza.name, pizza.price_kopecks) for pizza in db.query(models.Pizza).order_by(models.Pizza.id)]
+    assert menu == [(pizza["name"], pizza["price_kopecks"]) for pizza in DEFAULT_MENU]
+    with TestClient(app), TestClient(app):
+        pass
+    assert db.query(models.Pizza).count() == len(DEFAULT_MENU)
+
+def test_sales_reports_follow_orders_and_removals(client, db: Session, monkeypatch):
+    admin = create_test_user(db)
+    admin_headers = login_headers(client, admin)
+    assert client.get("/admin/reports/top-pizzas", headers=admin_headers).status_code == 403
+    monkeypatch.setattr(main, "ADMIN_USERNAMES", {admin.username})
+
+    headers = get_auth_headers(client, db)
+    menu = {item["name"]: item["price"] for item in client.get("/menu").json()}
+    first = client.post("/orders/", headers=headers, json={"items": [
+        {"pizza_name": "Маргарита", "quantity": 2},
+        {"pizza_name": "Пепперони", "quantity": 1},
+        {"pizza_name": "Маргарита", "quantity": 1},
+    ]}).json()
+    second = client.post("/orders/", headers=headers, json={"items": [
+        {"pizza_name": "Пепперони", "quantity": 1},
+    ]}).json()
+    client.delete(f"/order-items/{first['items'][0]['id']}", headers=headers)
+    client.delete(f"/order-items/{second['items'][0]['id']}", headers=headers)
+
+    top = client.get("/admin/reports/top-pizzas", headers=admin_headers).json()
+    assert top == [
+        {"pizza_name": "Маргарита", "quantity": 2, "revenue": 2 * menu["Маргарита"]},
+        {"pizza_name": "Пепперони", "quantity": 1, "revenue": menu["Пепперони"]},
+    ]
+    basket = client.get("/admin/reports/average-basket", headers=admin_headers).json()
+    assert basket["orders"] == 1
+    assert basket["average_basket"] == 2 * menu["Маргарита"] + menu["Пепперони"]
+    days = client.get("/admin/reports/revenue?period=day", headers=admin_headers).json()
+    assert [(day["orders"], day["revenue"]) for day in days] == [(1, basket["revenue"])]
+    assert client.get(
+        "/admin/reports/revenue?since=2030-01-01T00:00:00&until=2020-01-01T00:00:00", headers=admin_headers
+    ).status_code == 422
+
+@pytest.fixture
+def profiling_installed():
+    # install подменяет fastapi.routing.serialize_response на весь процесс
+    import fastapi.routing
+    original = fastapi.routing.serialize_response
+    yield
+    profiling.uninstall()
+    assert fastapi.routing.serialize_response is original
+
+def test_profiling_middleware_reports_timings(db: Session, profiling_installed):
+    from fastapi import FastAPI
+    from sqlalchemy import text
+    from pizzeria_db.database import AsyncSessionLocal
+    from responses import ORJSONResponse
+
+    profiled = FastAPI()
+
+    @profiled.get("/probe/{value}", response_model=Dict[str, int])
+    async def probe(value: int):
+        async with AsyncSessionLocal() as session:
+            await session.execute(text("SELECT 1"))
+            await session.execute(text("SELECT 2"))
+        with profiling.timed("hash_seconds"):
+            pass
+        return {"value": value}
+
+    @profiled.get("/probe-orjson")
+    async def probe_orjson():
+        return ORJSONResponse([{"value": value} for value in range(100)])
+
+    profiling.install(profiled, enabled=True)
+    with TestClient(profiled) as client:
+        response = client.get("/probe/7")
+        assert client.get("/probe-orjson").status_code == 200
+
+    assert response.json() == {"value": 7}
+    server_timing = response.headers["Server-Timing"]
+    assert 'desc="2 queries"' in server_timing
+    assert "hash;dur=" in server_timing and "serialize;dur=" in server_timing
+    assert 'http_request_db_statements_total{method="GET",route="/probe/{value}"} 2' in main.metrics.render()
+    # ORJSONResponse собирает тело в render, мимо serialize_response
+    assert profiling.route_stats.routes[("GET", "/probe-orjson")]["serialize_seconds_total"] > 0
+
+def test_order_stream_delivers_committed_events(client, db: Session):
+    import asyncio
+    import json
+    import order_stream
+    from starlette.requests import ClientDisconnect
+
+    user = create_test_user(db)
+    headers = login_headers(client, user)
+    queue = order_stream.broker.subscribe(user.id)
+    try:
+        created = client.post("/orders/", headers=headers, json={"items": [{"pizza_name": "Маргарита", "quantity": 2}]})
+        assert created.status_code == 200
+        order = created.json()
+        # Откат не публикует: чужая позиция не найдена
+        assert client.delete(f"/order-items/{MAX_ID}", headers=headers).status_code == 404
+        assert client.delete(f"/order-items/{order['items'][0]['id']}", headers=headers).status_code == 200
+        events = [queue.get_nowait() for _ in range(queue.qsize())]
+    finally:
+        order_stream.broker.unsubscribe(user.id, queue)
+    assert [(event["event"], event["order_id"]) for event in events] == [
+        ("created", order["id"]), ("item_changed", order["id"]),
+    ]
+
+    assert client.get("/orders/events").status_code == 401
+    token = headers["Authorization"].split()[1]
+    queues = [order_stream.broker.subscribe(user.id) for _ in range(order_stream.broker.max_per_user)]
+    try:
+        # Лимит проверяется в той же операции, что и подписка
+        with pytest.raises(order_stream.TooManySubscribers):
+            order_stream.broker.subscribe(user.id)
+        assert client.get(f"/orders/events?token={token}").status_code == 429
+    finally:
+        for queue in queues:
+            order_stream.broker.unsubscribe(user.id, queue)
+
+    # Ответ, который так и не начал поток, всё равно отписывается
+    async def broken_send(message):
+        raise OSError("client gone")
+
+    response = order_stream.open_stream(user.id)
+    assert order_stream.broker.subscribers_of(user.id) == 1
+    with pytest.raises(ClientDisconnect):
+        asyncio.run(response({"type": "http", "asgi": {"spec_version": "2.4"}}, None, broken_send))
+    assert order_stream.broker.subscribers_of(user.id) == 0
+
+    async def read_stream():
+        stream = order_stream.stream(user.id, order_stream.broker.subscribe(user.id), heartbeat=0.01)
+        chunks = [await stream.__anext__(), await stream.__anext__()]
+        order_stream.dispatch({"event": "status_changed", "order_id": order["id"], "user_id": user.id,
+                                     "status": "Готов"})
+        chunks.append(await stream.__anext__())
+        await stream.aclose()
+        return chunks
+
+    retry, ping, status_event = asyncio.run(read_stream())
+    assert retry.startswith("retry:") and ping == ": ping\n\n"
+    name, data = status_event.strip().split("\n")
+    assert name == "event: status_changed"
+    assert json.loads(data[len("data: "):])["status"] == "Готов"
+    assert order_stream.broker.subscribers_of(user.id) == 0
+
+def test_kitchen_queue_claims_by_age_and_size(db: Session, monkeypatch):
+    import kitchen
+
+    customer = create_test_user(db)
+    admin = create_test_user(db)
+    monkeypatch.setattr(main, "ADMIN_USERNAMES", {admin.username})
+    # Старый большой заказ уже лежит в базе: очередь поднимает его при старте
+    old = models.Order(user_id=customer.id, order_hash=str(uuid.uuid4()), total_kopecks=5 * 35000,
+                       created_at=datetime.utcnow() - timedelta(hours=1))
+    old.items = [models.OrderItem(pizza_name="Маргарита", quantity=5, price_kopecks=35000)]
+    db.add(old)
+    db.commit()
+
+    with TestClient(app) as client:
+        customer_headers = login_headers(client, customer)
+        headers = login_headers(client, admin)
+        orders = [
+            client.post("/orders/", headers=customer_headers,
+                        json={"items": [{"pizza_name": "Пепперони", "quantity": quantity}]}).json()
+            for quantity in (3, 1, 1)
+        ]
+        big, small, later_small = (order["id"] for order in orders)
+        assert kitchen.queue.stats()["queued"] == 4
+
+        claimed = []
+        for station in ("oven-1", "oven-1", "oven-2", "oven-2"):
+            response = client.post("/kitchen/claim", headers=headers, json={"station": station})
+            assert response.status_code == 200
+            claimed.append(response.json())
+        assert [ticket["order_id"] for ticket in claimed] == [old.id, small, later_small, big]
+        assert claimed[0]["items"] == [{"pizza_name": "Маргарита", "quantity": 5}]
+        assert client.post("/kitchen/claim", headers=headers, json={"station": "oven-1"}).status_code == 204
+
+        # Взятый кухней заказ клиент уже не меняет
+        item_id = orders[1]["items"][0]["id"]
+        assert client.delete(f"/order-items/{item_id}", headers=customer_headers).status_code == 404
+
+        assert client.post(f"/kitchen/tickets/{small}/complete", headers=headers,
+                           json={"station": "oven-2"}).status_code == 404
+        done = client.post(f"/kitchen/tickets/{small}/complete", headers=headers, json={"station": "oven-1"})
+        assert done.json()["status"] == "Готов"
+        assert client.post(f"/kitchen/tickets/{big}/release", headers=headers,
+                           json={"station": "oven-2"}).status_code == 200
+
+        snapshot = kitchen.board_snapshot()[0]
+        assert [ticket["order_id"] for ticket in snapshot["queued"]] == [big]
+        assert sorted(ticket["order_id"] for ticket in snapshot["in_progress"]) == sorted([old.id, later_small])
+
+        # Заказ, о котором очередь не знает, находится запасным поиском по базе
+        unseen = models.Order(user_id=customer.id, order_hash=str(uuid.uuid4()))
+        db.add(unseen)
+        db.commit()
+        tickets = [client.post("/kitchen/claim", headers=headers, json={"station": "oven-3"}).json()
+                   for _ in range(2)]
+        assert [ticket["order_id"] for ticket in tickets] == [big, unseen.id]
+
+        assert client.get("/kitchen/events").status_code == 401
+        assert client.get("/kitchen/events", headers=customer_headers).status_code == 403
+
+
+def test_kitchen_queue_reorders_on_item_changes(db: Session, monkeypatch):
+    import kitchen
+
+    customer = create_test_user(db)
+    admin = create_test_user(db)
+    monkeypatch.setattr(main, "ADMIN_USERNAMES", {admin.username})
+    with TestClient(app) as client:
+        customer_headers = login_headers(client, customer)
+        headers = login_headers(client, admin)
+        big, small = (
+            client.post("/orders/", headers=customer_headers,
+                        json={"items": [{"pizza_name": "Пепперони", "quantity": quantity}]}).json()
+            for quantity in (3, 1)
+        )
+        assert [ticket["order_id"] for ticket in kitchen.board_snapshot()[0]["queued"]] == [small["id"], big["id"]]
+
+        # Большой заказ стал маленьким: он старше, поэтому теперь идёт первым
+        decremented = client.post("/order-items/decrement", headers=customer_headers,
+                                  json={"items": [{"item_id": big["items"][0]["id"], "quantity": 2}]})
+        assert decremented.status_code == 200
+        queued = kitchen.board_snapshot()[0]["queued"]
+        assert [(ticket["order_id"], ticket["pizzas"]) for ticket in queued] == [(big["id"], 1), (small["id"], 1)]
+
+        # Прежняя запись кучи со старым priority пропускается, билеты не дублируются
+        fallback_claims = kitchen.queue.fallback_claims
+        claimed = [client.post("/kitchen/claim", headers=headers, json={"station": "oven-1"}) for _ in range(3)]
+        assert [response.status_code for response in claimed] == [200, 200, 204]
+        assert [response.json()["order_id"] for response in claimed[:2]] == [big["id"], small["id"]]
+        assert kitchen.queue.fallback_claims == fallback_claims
+
+def test_login_rate_limits_and_password_gate(client, db: Session, monkeypatch):
+    import asyncio
+
+    monkeypatch.setattr(admission, "login_limits", admission.LoginLimits(
+        admission.TokenBucketLimiter(0.001, 4, 100),
+        admission.TokenBucketLimiter(0.001, 2, 100),
+    ))
+    victim, other = create_test_user(db), create_test_user(db)
+    wrong = {"username": victim.username, "password": "wrong", "grant_type": "password"}
+    assert [client.post("/token", data=wrong).status_code for _ in range(2)] == [401, 401]
+    limited = client.post("/token", data=wrong)
+    assert limited.status_code == 429
+    assert int(limited.headers["Retry-After"]) >= 1
+    # Неудачи по одному логину не мешают другому, пока не кончится ведро IP
+    assert login_headers(client, other)["Authorization"].startswith("Bearer ")
+    assert client.post("/token", data={"username": other.username, "password": "secret"}).status_code == 200
+    assert client.post("/token", data={"username": other.username, "password": "secret"}).status_code == 429
+
+    async def crowd():
+        gate = admission.ConcurrencyGate(1, 0.05)
+        gate.service_seconds = 0.01
+        async with gate.slot():
+            # Ожидание в очереди дольше max_delay
+            with pytest.raises(admission.Overloaded):
+                async with gate.slot():
+                    pass
+            # Очередь длиннее допустимой задержки отклоняется сразу, без ожидания
+            gate.service_seconds = 1.0
+            started = asyncio.get_running_loop().time()
+            with pytest.raises(admission.Overloaded) as rejected:
+                async with gate.slot():
+                    pass
+            assert asyncio.get_running_loop().time() - started < 0.05
+            assert rejected.value.status_code == 503
+        async with gate.slot():
+            pass
+        return gate.stats()
+
+    stats = asyncio.run(crowd())
+    assert (stats["active"], stats["waiting"], stats["timed_out_total"], stats["shed_total"]) == (0, 0, 1, 1)
+
+def test_admin_export_streams_orders_and_resumes(client, db: Session, monkeypatch):
+    import asyncio
+    import csv
+    import orjson
+    from starlette.requests import ClientDisconnect
+    import export
+
+    admin = create_test_user(db)
+    admin_headers = login_headers(client, admin)
+    assert client.get("/admin/export/orders", headers=admin_headers).status_code == 403
+    monkeypatch.setattr(main, "ADMIN_USERNAMES", {admin.username})
+    # Пачка меньше заказа: позиции одного заказа приходят в разных пачках курсора
+    monkeypatch.setattr(export, "EXPORT_BATCH_ROWS", 2)
+
+    headers = get_auth_headers(client, db)
+    created = [
+        client.post("/orders/", headers=headers, json={"items": [
+            {"pizza_name": "Маргарита", "quantity": 1 + i},
+            {"pizza_name": "Пепперони", "quantity": 1},
+            {"pizza_name": "Гавайская", "quantity": 2},
+        ]}).json()
+        for i in range(3)
+    ]
+
+    response = client.get("/admin/export/orders", headers=admin_headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    orders = [orjson.loads(line) for line in response.content.splitlines()]
+    assert [order["id"] for order in orders] == [order["id"] for order in created]
+    assert [order["items"] for order in orders] == [order["items"] for order in created]
+    assert [order["total"] for order in orders] == [order["total"] for order in created]
+
+    resumed = client.get(f"/admin/export/orders?after_id={created[0]['id']}", headers=admin_headers)
+    assert [orjson.loads(line)["id"] for line in resumed.content.splitlines()] == [
+        order["id"] for order in created[1:]
+    ]
+
+    response = client.get("/admin/export/orders?format=csv", headers=admin_headers)
+    assert response.headers["content-type"] == "text/csv; charset=utf-8"
+    rows = list(csv.DictReader(response.text.splitlines()))
+    assert len(rows) == 9
+    assert [row["item_id"] for row in rows] == [
+        str(item["id"]) for order in created for item in order["items"]
+    ]
+    assert rows[0]["price"] == f"{created[0]['items'][0]['price']:.2f}"
+    assert client.get(
+        "/admin/export/orders?since=2030-01-01T00:00:00&until=2020-01-01T00:00:00", headers=admin_headers
+    ).status_code == 422
+    assert client.get(
+        "/admin/export/orders?since=2020-01-01T00:00:00&until=2020-01-01T00:00:00", headers=admin_headers
+    ).status_code == 422
+
+    # Границы периода точные, без округления до часа и без ограничения длины отчётов
+    db.query(models.Order).filter(models.Order.id == created[0]["id"]).update(
+        {"created_at": datetime(2001, 1, 1, 12, 15)}
+    )
+    db.commit()
+    def exported_ids(query):
+        response = client.get(f"/admin/export/orders?{query}", headers=admin_headers)
+        assert response.status_code == 200
+        return [orjson.loads(line)["id"] for line in response.content.splitlines()]
+    assert exported_ids("since=2001-01-01T12:00:00&until=2001-01-01T12:30:00") == [created[0]["id"]]
+    assert exported_ids("since=2001-01-01T12:00:00&until=2001-01-01T12:15:00") == []
+    assert exported_ids("since=2001-01-01T12:15:00&until=2001-01-01T12:15:01") == [created[0]["id"]]
+    assert exported_ids("since=1990-01-01T00:00:00") == [order["id"] for order in created]
+
+    # Место занимается в обработчике, до начала потока: вторая выгрузка сверх лимита сразу получает 429
+    monkeypatch.setattr(export, "EXPORT_MAX_CONCURRENT", 1)
+    slot = export.try_acquire()
+    assert export.try_acquire() is None
+    assert client.get("/admin/export/orders", headers=admin_headers).status_code == 429
+    slot.release()
+    slot.release()
+    assert export.exports.active == 0
+
+    # Ответ, который не смог отправить ни байта, тоже возвращает место
+    async def broken_send(message):
+        raise OSError("client gone")
+
+    slot = export.try_acquire()
+    response = export.ExportResponse(export.export_orders(slot, export.NDJSON, datetime.utcnow(), datetime.utcnow()), slot)
+    with pytest.raises(ClientDisconnect):
+        asyncio.run(response({"type": "http", "asgi": {"spec_version": "2.4"}}, None, broken_send))
+    assert export.exports.active == 0
+
+
+def test_reads_go_to_replica_except_after_own_writes(client, db: Session, monkeypatch, tmp_path):
+    import asyncio
+    from sqlalchemy import create_engine, select, func
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from pizzeria_db import database
+    from user_cache import user_cache
+    import read_routing
+
+    # Отстающая реплика - отдельный файл SQLite с той же схемой, но без данных
+    replica_file = tmp_path / "replica.db"
+    models.Base.metadata.create_all(create_engine(f"sqlite:///{replica_file}"))
+    replica = create_async_engine(f"sqlite+aiosqlite:///{replica_file}")
+    monkeypatch.setattr(database, "replica_engines", [replica])
+    monkeypatch.setattr(read_routing, "recent_writers", database.RecentWrites())
+
+    user = create_test_user(db)
+    headers = login_headers(client, user)
+    db.add(models.Order(user_id=user.id, order_hash=str(uuid.uuid4())))
+    db.commit()
+
+    # Пользователя на реплике ещё нет - /users/me/ перечитывает его с primary
+    user_cache.clear()
+    assert client.get("/users/me/", headers=headers).json()["username"] == user.username
+    # Заказ, записанный в обход API, с реплики не виден
+    assert client.get("/orders/", headers=headers).json() == []
+
+    # Свою запись пользователь видит сразу: его чтения переключаются на primary
+    created = client.post("/orders/", headers=headers, json={"items": [
+        {"pizza_name": "Маргарита", "quantity": 1},
+    ]}).json()
+    assert [order["id"] for order in client.get("/orders/", headers=headers).json()][0] == created["id"]
+    assert read_routing.recent_writers.stats()["primary_reads_total"] == 1
+
+    # Окно прошло - снова реплика
+    monkeypatch.setattr(read_routing, "recent_writers", database.RecentWrites(window=0))
+    assert client.get("/orders/", headers=headers).json() == []
+
+    async def write_through_routing_session():
+        # Запись из сессии чтения уходит на primary, SELECT той же сессии - на реплику
+        async with database.ReplicaSessionLocal() as session:
+            session.add(models.User(username=f"routed_{uuid.uuid4().hex[:8]}", hashed_password="-"))
+            await session.commit()
+            on_replica = await session.scalar(select(func.count()).select_from(models.User))
+        await replica.dispose()
+        await async_engine.dispose()
+        return on_replica
+
+    assert asyncio.run(write_through_routing_session()) == 0
+    assert db.query(models.User).count() == 2
\ No newline at end of file
@@ -0,0 +1,234 @@
+from sqlalchemy import create_engine, Select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Асинхронные драйверы для синхронных URL из окружения
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+def make_async_url(url: str):
+    sync_url = make_url(url)
+    drivername = ASYNC_DRIVERS.get(sync_url.get_backend_name(), sync_url.drivername)
+    return sync_url.set(drivername=drivername)
+
+SQLALCHEMY_DATABASE_URL = os.getenv("SQLALCHEMY_DATABASE_URL")
+SQLALCHEMY_ASYNC_DATABASE_URL = os.getenv("SQLALCHEMY_ASYNC_DATABASE_URL") \
+    or make_async_url(SQLALCHEMY_DATABASE_URL)
+# Реплики только для чтения, через запятую, в том же формате, что SQLALCHEMY_DATABASE_URL
+SQLALCHEMY_REPLICA_URLS = [url.strip() for url in os.getenv("SQLALCHEMY_REPLICA_URLS", "").split(",") if url.strip()]
+# Сколько секунд после записи данные читаются с primary - с запасом на отставание реплик
+REPLICA_STICKY_SECONDS = float(os.getenv("REPLICA_STICKY_SECONDS", "5"))
+REPLICA_STICKY_MAX_KEYS = int(os.getenv("REPLICA_STICKY_MAX_KEYS", "100000"))
+
+# Настройки пула соединений (API и бот делят один Postgres)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))
+DB_APPLICATION_NAME = os.getenv("DB_APPLICATION_NAME", "pizzeria")
+
+
+class PoolWaitStats:
+    # Сколько раз брали соединение из пула и сколько ждали свободного
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def record(self, waited: float, timed_out: bool):
+        with self._lock:
+            self.checkouts += 1
+            self.timeouts += timed_out
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+
+def timed_pool_class(base, stats: PoolWaitStats):
+    # Пул пересоздаётся при dispose() через self.__class__, поэтому статистика
+    # живёт в атрибуте класса, а не экземпляра
+    class TimedPool(base):
+        wait_stats = stats
+
+        def _do_get(self):
+            started = time.perf_counter()
+            timed_out = False
+            try:
+                return super()._do_get()
+            except PoolTimeoutError:
+                timed_out = True
+                raise
+            finally:
+                self.wait_stats.record(time.perf_counter() - started, timed_out)
+
+    TimedPool.__name__ = f"Timed{base.__name__}"
+    return TimedPool
+
+
+def connect_args(url) -> dict:
+    # application_name и statement_timeout задаются при подключении, у каждого драйвера по-своему
+    url = make_url(url)
+    if url.get_backend_name() != "postgresql":
+        return {}
+    if url.get_driver_name() == "asyncpg":
+        settings = {"application_name": DB_APPLICATION_NAME}
+        if DB_STATEMENT_TIMEOUT_MS:
+            settings["statement_timeout"] = str(DB_STATEMENT_TIMEOUT_MS)
+        return {"server_settings": settings}
+    args = {"application_name": DB_APPLICATION_NAME}
+    if DB_STATEMENT_TIMEOUT_MS:
+        args["options"] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"
+    return args
+
+
+def engine_options(url, pool_base, stats: PoolWaitStats) -> dict:
+    return {
+        "poolclass": timed_pool_class(pool_base, stats),
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "connect_args": connect_args(url),
+    }
+
+
+def pool_stats(engine) -> dict:
+    pool = engine.pool
+    stats = pool.wait_stats
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+        "checkouts_total": stats.checkouts,
+        "timeouts_total": stats.timeouts,
+        "wait_seconds_total": round(stats.wait_seconds, 6),
+        "wait_seconds_max": round(stats.max_wait_seconds, 6),
+    }
+
+
+# Синхронный движок остаётся для тестов и служебных скриптов
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    **engine_options(SQLALCHEMY_DATABASE_URL, QueuePool, PoolWaitStats()),
+)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Асинхронный движок обслуживает запросы API и обработчики бота, не блокируя event loop
+async_engine = create_async_engine(
+    SQLALCHEMY_ASYNC_DATABASE_URL,
+    **engine_options(SQLALCHEMY_ASYNC_DATABASE_URL, AsyncAdaptedQueuePool, PoolWaitStats()),
+)
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
+# Пулы реплик такого же размера, как у primary; запросы делятся между ними по кругу
+replica_engines = [
+    create_async_engine(make_async_url(url), **engine_options(make_async_url(url), AsyncAdaptedQueuePool, PoolWaitStats()))
+    for url in SQLALCHEMY_REPLICA_URLS
+]
+_replica_turn = itertools.count()
+
+
+class RoutingSession(Session):
+    # Чтения идут на реплику, выбранную при создании сессии: запросы одной
+    # сессии не попадают на реплики с разным отставанием. На primary остаются flush, INSERT,
+    # UPDATE, DELETE, SELECT ... FOR UPDATE и text(). Без реплик это обычная сессия
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.replica = replica_engines[next(_replica_turn) % len(replica_engines)] if replica_engines else None
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if (
+            self.replica is not None
+            and not self._flushing
+            and isinstance(clause, Select)
+            and clause._for_update_arg is None
+        ):
+            return self.replica.sync_engine
+        return super().get_bind(mapper, clause=clause, **kw)
+
+
+# Сессии для чтений, которым допустимо отставание реплики на доли секунды
+ReplicaSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    sync_session_class=RoutingSession,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
+
+def reads_replica(db) -> bool:
+    return getattr(db.sync_session, "replica", None) is not None
+
+
+class RecentWrites:
+    # Ключ (пользователь, заказ) -> момент, до которого его читают с primary.
+    # Вытесняются самые старые отметки: они истекают первыми
+    def __init__(self, window: float = REPLICA_STICKY_SECONDS, max_keys: int = REPLICA_STICKY_MAX_KEYS):
+        self.window = window
+        self.max_keys = max_keys
+        self._until = OrderedDict()
+        self._lock = threading.Lock()
+        self.primary_reads = 0
+        self.replica_reads = 0
+
+    def wrote(self, keys):
+        until = time.monotonic() + self.window
+        with self._lock:
+            for key in keys:
+                self._until[key] = until
+                self._until.move_to_end(key)
+            while len(self._until) > self.max_keys:
+                self._until.popitem(last=False)
+
+    def is_recent(self, key) -> bool:
+        with self._lock:
+            until = self._until.get(key)
+            if until is not None and until < time.monotonic():
+                del self._until[key]
+                until = None
+        return until is not None
+
+    def sessions_for(self, key):
+        # Фабрика сессий для чтения данных ключа
+        if not replica_engines:
+            return AsyncSessionLocal
+        if self.is_recent(key):
+            self.primary_reads += 1
+            return AsyncSessionLocal
+        self.replica_reads += 1
+        return ReplicaSessionLocal
+
+    def stats(self):
+        with self._lock:
+            return {
+                "recent_keys": len(self._until),
+                "replicas": len(replica_engines),
+                "primary_reads_total": self.primary_reads,
+                "replica_reads_total": self.replica_reads,
+            }
+
+
+Base = declarative_base()
\ No newline at end of file
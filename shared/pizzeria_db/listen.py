@@ -0,0 +1,63 @@
+import asyncio
+import json
+import logging
+import os
+from typing import Awaitable, Callable, Optional
+from sqlalchemy.engine import make_url
+
+logger = logging.getLogger(__name__)
+
+# Канал Postgres LISTEN/NOTIFY для событий заказов: в него пишет API (pg_notify),
+# слушают воркеры API и бот. Одна константа на оба сервиса
+ORDER_EVENTS_CHANNEL = os.getenv("ORDER_EVENTS_CHANNEL", "order_events")
+LISTEN_RECONNECT_SECONDS = 5
+
+
+async def listen_order_events(
+    database_url: str,
+    on_event: Callable[[dict], None],
+    on_connect: Optional[Callable[[bool], Awaitable]] = None,
+    on_disconnect: Optional[Callable[[], None]] = None,
+):
+    # Держит LISTEN-соединение к Postgres и переподключается при обрыве.
+    # on_event получает разобранное событие, on_connect(reconnected) вызывается
+    # после каждой подписки, on_disconnect - при каждом обрыве: события за время
+    # без соединения потеряны, и сервис сам решает, что сбросить или перечитать
+    url = make_url(database_url)
+    if url.get_backend_name() != "postgresql":
+        logger.info("Order events listener disabled: %s has no LISTEN/NOTIFY", url.get_backend_name())
+        return
+    import asyncpg
+
+    def on_notification(connection, pid, channel, payload):
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            logger.warning("Malformed order event: %r", payload)
+            return
+        on_event(event)
+
+    dsn = url.set(drivername="postgresql").render_as_string(hide_password=False)
+    connected_before = False
+    while True:
+        connection = None
+        try:
+            connection = await asyncpg.connect(dsn)
+            closed = asyncio.Event()
+            connection.add_termination_listener(lambda conn: closed.set())
+            await connection.add_listener(ORDER_EVENTS_CHANNEL, on_notification)
+            logger.info("Listening for order events on %s", ORDER_EVENTS_CHANNEL)
+            if on_connect is not None:
+                await on_connect(connected_before)
+            connected_before = True
+            await closed.wait()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Order events listener failed")
+        finally:
+            if on_disconnect is not None:
+                on_disconnect()
+            if connection is not None and not connection.is_closed():
+                await connection.close()
+        await asyncio.sleep(LISTEN_RECONNECT_SECONDS)
\ No newline at end of file
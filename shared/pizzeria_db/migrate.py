@@ -0,0 +1,41 @@
+# Применяет миграции схемы. Запускается один раз перед стартом сервисов:
+#   python -m pizzeria_db.migrate            # до последней версии
+#   python -m pizzeria_db.migrate <revision> # до указанной
+import sys
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.pool import NullPool
+
+from pizzeria_db.database import SQLALCHEMY_DATABASE_URL
+
+# Схема, которую раньше создавал create_all при импорте main.py
+BASELINE_REVISION = "0001"
+
+
+def alembic_config() -> Config:
+    config = Config()
+    config.set_main_option("script_location", "pizzeria_db:migrations")
+    return config
+
+
+def is_unversioned_database() -> bool:
+    # База создана старым create_all: таблицы есть, а версии миграций нет
+    engine = create_engine(SQLALCHEMY_DATABASE_URL, poolclass=NullPool)
+    try:
+        inspector = inspect(engine)
+        return inspector.has_table("users") and not inspector.has_table("alembic_version")
+    finally:
+        engine.dispose()
+
+
+def upgrade(revision: str = "head"):
+    config = alembic_config()
+    if is_unversioned_database():
+        command.stamp(config, BASELINE_REVISION)
+    command.upgrade(config, revision)
+
+
+if __name__ == "__main__":
+    upgrade(sys.argv[1] if len(sys.argv) > 1 else "head")
@@ -0,0 +1,45 @@
+from alembic import context
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import NullPool
+
+from pizzeria_db.database import Base, SQLALCHEMY_DATABASE_URL
+from pizzeria_db import models  # noqa: F401 - регистрирует таблицы в Base.metadata
+
+target_metadata = Base.metadata
+
+# Ключ advisory-блокировки: два одновременных запуска миграций не пересекаются
+MIGRATION_LOCK_ID = 7_426_001
+
+
+def run_migrations_offline():
+    context.configure(
+        url=SQLALCHEMY_DATABASE_URL,
+        target_metadata=target_metadata,
+        literal_binds=True,
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    # Отдельный движок без пула и без statement_timeout сервисов:
+    # миграция с переносом данных может идти дольше обычного запроса
+    connectable = create_engine(SQLALCHEMY_DATABASE_URL, poolclass=NullPool)
+    with connectable.connect() as connection:
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            # SQLite не умеет ALTER большинства ограничений, таблица пересоздаётся
+            render_as_batch=connection.dialect.name == "sqlite",
+        )
+        with context.begin_transaction():
+            if connection.dialect.name == "postgresql":
+                connection.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+            context.run_migrations()
+    connectable.dispose()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
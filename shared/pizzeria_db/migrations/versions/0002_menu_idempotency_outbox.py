@@ -0,0 +1,93 @@
+"""menu, idempotency keys, status outbox, subscriptions and paging indexes
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, Sequence[str], None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Базы, поднятые старым create_all при импорте, уже могут содержать часть этих
+# таблиц (create_all добавлял новые таблицы, но не индексы к существующим),
+# поэтому всё создаётся только при отсутствии
+def has_table(name: str) -> bool:
+    return sa.inspect(op.get_bind()).has_table(name)
+
+
+def has_index(table: str, name: str) -> bool:
+    return any(index["name"] == name for index in sa.inspect(op.get_bind()).get_indexes(table))
+
+
+def upgrade() -> None:
+    if not has_index("orders", "ix_orders_user_id_id_desc"):
+        op.create_index("ix_orders_user_id_id_desc", "orders", ["user_id", sa.text("id DESC")])
+    if not has_index("refresh_tokens", "ix_refresh_tokens_expires_at"):
+        op.create_index("ix_refresh_tokens_expires_at", "refresh_tokens", ["expires_at"])
+
+    if not has_table("pizzas"):
+        op.create_table(
+            "pizzas",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("name", sa.String(), nullable=False, unique=True),
+            sa.Column("description", sa.String()),
+            sa.Column("price", sa.Integer(), nullable=False),
+        )
+        op.create_index("ix_pizzas_id", "pizzas", ["id"])
+
+    if not has_table("idempotency_keys"):
+        op.create_table(
+            "idempotency_keys",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+            sa.Column("key", sa.String(), nullable=False),
+            sa.Column("request_hash", sa.String(), nullable=False),
+            sa.Column("response", sa.Text()),
+            sa.Column("expires_at", sa.DateTime(), nullable=False),
+            sa.UniqueConstraint("user_id", "key", name="uq_idempotency_keys_user_id_key"),
+        )
+        op.create_index("ix_idempotency_keys_id", "idempotency_keys", ["id"])
+        op.create_index("ix_idempotency_keys_expires_at", "idempotency_keys", ["expires_at"])
+
+    if not has_table("order_status_outbox"):
+        op.create_table(
+            "order_status_outbox",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("order_id", sa.Integer(), nullable=False),
+            sa.Column("order_hash", sa.String(), nullable=False),
+            sa.Column("status", sa.String(), nullable=False),
+            sa.Column("created_at", sa.DateTime(), nullable=False),
+            sa.Column("dispatched_at", sa.DateTime()),
+        )
+        op.create_index("ix_order_status_outbox_id", "order_status_outbox", ["id"])
+        op.create_index("ix_order_status_outbox_dispatched_at", "order_status_outbox", ["dispatched_at"])
+
+    if not has_table("order_subscriptions"):
+        op.create_table(
+            "order_subscriptions",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("order_hash", sa.String(), nullable=False),
+            sa.Column("chat_id", sa.BigInteger(), nullable=False),
+            sa.UniqueConstraint("order_hash", "chat_id", name="uq_order_subscriptions_order_hash_chat_id"),
+        )
+        op.create_index("ix_order_subscriptions_id", "order_subscriptions", ["id"])
+        op.create_index("ix_order_subscriptions_order_hash", "order_subscriptions", ["order_hash"])
+
+
+def downgrade() -> None:
+    op.drop_table("order_subscriptions")
+    op.drop_table("order_status_outbox")
+    op.drop_table("idempotency_keys")
+    op.drop_table("pizzas")
+    op.drop_index("ix_refresh_tokens_expires_at", table_name="refresh_tokens")
+    op.drop_index("ix_orders_user_id_id_desc", table_name="orders")
@@ -0,0 +1,75 @@
+"""money in integer kopecks, positive quantities and precomputed order totals
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+
+"""
+import json
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0003"
+down_revision: Union[str, Sequence[str], None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def add_total_to_stored_responses(bind):
+    # Сохранённые ответы POST /orders/ повторяются клиенту по Idempotency-Key
+    # и должны содержать поле total, как новые
+    rows = bind.execute(sa.text(
+        "SELECT id, response FROM idempotency_keys WHERE response IS NOT NULL"
+    )).all()
+    for row in rows:
+        response = json.loads(row.response)
+        if "total" in response:
+            continue
+        kopecks = sum(round(item["price"] * 100) * item["quantity"] for item in response["items"])
+        response["total"] = kopecks / 100
+        bind.execute(
+            sa.text("UPDATE idempotency_keys SET response = :response WHERE id = :id"),
+            {"response": json.dumps(response), "id": row.id},
+        )
+
+
+def upgrade() -> None:
+    op.add_column("order_items", sa.Column("price_kopecks", sa.Integer()))
+    op.add_column("orders", sa.Column("total_kopecks", sa.BigInteger(), nullable=False, server_default="0"))
+
+    op.execute("UPDATE order_items SET price_kopecks = CAST(ROUND(COALESCE(price, 0) * 100) AS INTEGER)")
+    # Позиции с нулевым или отрицательным количеством ничего не стоят и не пройдут ограничение
+    op.execute("DELETE FROM order_items WHERE quantity IS NULL OR quantity <= 0")
+    op.execute(
+        "UPDATE orders SET total_kopecks = COALESCE(("
+        "SELECT SUM(CAST(quantity AS BIGINT) * price_kopecks) FROM order_items WHERE order_items.order_id = orders.id"
+        "), 0)"
+    )
+    add_total_to_stored_responses(op.get_bind())
+
+    with op.batch_alter_table("order_items") as batch:
+        batch.alter_column("price_kopecks", existing_type=sa.Integer(), nullable=False)
+        batch.alter_column("quantity", existing_type=sa.Integer(), nullable=False)
+        batch.drop_column("price")
+        batch.create_check_constraint("ck_order_items_quantity_positive", "quantity > 0")
+        batch.create_check_constraint("ck_order_items_price_kopecks_nonnegative", "price_kopecks >= 0")
+    with op.batch_alter_table("orders") as batch:
+        batch.create_check_constraint("ck_orders_total_kopecks_nonnegative", "total_kopecks >= 0")
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("orders") as batch:
+        batch.drop_constraint("ck_orders_total_kopecks_nonnegative", type_="check")
+        batch.drop_column("total_kopecks")
+    with op.batch_alter_table("order_items") as batch:
+        batch.drop_constraint("ck_order_items_price_kopecks_nonnegative", type_="check")
+        batch.drop_constraint("ck_order_items_quantity_positive", type_="check")
+        batch.add_column(sa.Column("price", sa.Float()))
+        batch.alter_column("quantity", existing_type=sa.Integer(), nullable=True)
+    op.execute("UPDATE order_items SET price = price_kopecks / 100.0")
+    with op.batch_alter_table("order_items") as batch:
+        batch.drop_column("price_kopecks")
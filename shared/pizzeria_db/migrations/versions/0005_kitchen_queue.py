@@ -0,0 +1,34 @@
+"""kitchen queue: order claims by kitchen stations
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0005"
+down_revision: Union[str, Sequence[str], None] = "0004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("orders", sa.Column("station", sa.String(length=64)))
+    op.add_column("orders", sa.Column("claimed_at", sa.DateTime()))
+    op.create_index("ix_orders_status_created_at", "orders", ["status", "created_at"])
+    # Позиции читаются по заказу (выдача заказов, билет кухни); внешний ключ индекса не создаёт
+    op.create_index("ix_order_items_order_id", "order_items", ["order_id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_order_items_order_id", table_name="order_items")
+    op.drop_index("ix_orders_status_created_at", table_name="orders")
+    with op.batch_alter_table("orders") as batch:
+        batch.drop_column("claimed_at")
+        batch.drop_column("station")
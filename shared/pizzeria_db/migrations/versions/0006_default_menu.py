@@ -0,0 +1,47 @@
+"""default menu: seed pizzas in the migrate step instead of at API startup
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0006"
+down_revision: Union[str, Sequence[str], None] = "0005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Копия меню на момент миграции: последующие правки catalog.DEFAULT_MENU её не меняют
+DEFAULT_MENU = [
+    {"name": "Маргарита", "price": 350, "description": "Томатный соус, моцарелла, базилик"},
+    {"name": "Пепперони", "price": 450, "description": "Томатный соус, моцарелла, пепперони"},
+    {"name": "Гавайская", "price": 400, "description": "Томатный соус, моцарелла, курица, ананас"},
+    {"name": "Четыре сыра", "price": 500, "description": "Сливочный соус, моцарелла, пармезан, дор блю, чеддер"},
+]
+
+pizzas = sa.table(
+    "pizzas",
+    sa.column("name", sa.String),
+    sa.column("description", sa.String),
+    sa.column("price", sa.Integer),
+)
+
+
+def upgrade() -> None:
+    # Меню кладётся только в пустую таблицу: базы, засеянные прежним стартом API,
+    # и меню, отредактированное вручную, не трогаем. Миграции выполняет один
+    # процесс migrate, поэтому воркеры API не гоняются за вставку при старте
+    if op.get_bind().scalar(sa.select(sa.func.count()).select_from(pizzas)):
+        return
+    op.bulk_insert(pizzas, DEFAULT_MENU)
+
+
+def downgrade() -> None:
+    # Меню - данные, а не схема: при откате остаётся как есть
+    pass
\ No newline at end of file
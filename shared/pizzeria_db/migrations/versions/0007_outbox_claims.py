@@ -0,0 +1,27 @@
+"""outbox claims: bot claims a batch, sends outside the transaction
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0007"
+down_revision: Union[str, Sequence[str], None] = "0006"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("order_status_outbox", sa.Column("claimed_at", sa.DateTime()))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("order_status_outbox") as batch:
+        batch.drop_column("claimed_at")
\ No newline at end of file
@@ -0,0 +1,38 @@
+"""menu prices in integer kopecks, like order items
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0008"
+down_revision: Union[str, Sequence[str], None] = "0007"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("pizzas", sa.Column("price_kopecks", sa.Integer()))
+    op.execute("UPDATE pizzas SET price_kopecks = price * 100")
+    with op.batch_alter_table("pizzas") as batch:
+        batch.alter_column("price_kopecks", existing_type=sa.Integer(), nullable=False)
+        batch.drop_column("price")
+        batch.create_check_constraint("ck_pizzas_price_kopecks_nonnegative", "price_kopecks >= 0")
+
+
+def downgrade() -> None:
+    # Прежняя колонка - целые рубли: копейки цены при откате отбрасываются
+    with op.batch_alter_table("pizzas") as batch:
+        batch.drop_constraint("ck_pizzas_price_kopecks_nonnegative", type_="check")
+        batch.add_column(sa.Column("price", sa.Integer()))
+    op.execute("UPDATE pizzas SET price = price_kopecks / 100")
+    with op.batch_alter_table("pizzas") as batch:
+        batch.alter_column("price", existing_type=sa.Integer(), nullable=False)
+        batch.drop_column("price_kopecks")
\ No newline at end of file
@@ -0,0 +1,144 @@
+from sqlalchemy import Column, Integer, BigInteger, String, ForeignKey, DateTime, Index, Text, UniqueConstraint, CheckConstraint
+from sqlalchemy.orm import relationship
+from datetime import datetime
+from .database import Base
+
+# Деньги хранятся целыми копейками: суммы по тысячам строк не накапливают ошибку
+KOPECKS_PER_RUBLE = 100
+
+def to_rubles(kopecks: int) -> float:
+    return kopecks / KOPECKS_PER_RUBLE
+
+class User(Base):
+    __tablename__ = "users"
+
+    id = Column(Integer, primary_key=True, index=True)
+    username = Column(String, unique=True, index=True)
+    email = Column(String, unique=True, index=True)
+    full_name = Column(String)
+    hashed_password = Column(String)
+
+class Pizza(Base):
+    __tablename__ = "pizzas"
+    __table_args__ = (CheckConstraint("price_kopecks >= 0", name="ck_pizzas_price_kopecks_nonnegative"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, unique=True, nullable=False)
+    description = Column(String)
+    price_kopecks = Column(Integer, nullable=False)
+
+    @property
+    def price(self) -> float:
+        return to_rubles(self.price_kopecks)
+
+class Order(Base):
+    __tablename__ = "orders"
+    __table_args__ = (CheckConstraint("total_kopecks >= 0", name="ck_orders_total_kopecks_nonnegative"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    status = Column(String, default="Готовится")
+    order_hash = Column(String, unique=True, index=True)
+    # Сумма позиций, обновляется теми же запросами, что меняют позиции
+    total_kopecks = Column(BigInteger, nullable=False, default=0, server_default="0")
+    # UTC; по часу создания заказ попадает в сводки продаж
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    # Кухонная станция, взявшая заказ в работу; NULL - заказ ждёт в очереди
+    station = Column(String(64))
+    claimed_at = Column(DateTime)
+
+    items = relationship(
+        "OrderItem",
+        back_populates="order",
+        cascade="all, delete-orphan",
+        order_by="OrderItem.id",
+    )
+
+    @property
+    def total(self) -> float:
+        return to_rubles(self.total_kopecks)
+
+class OrderItem(Base):
+    __tablename__ = "order_items"
+    __table_args__ = (
+        CheckConstraint("quantity > 0", name="ck_order_items_quantity_positive"),
+        CheckConstraint("price_kopecks >= 0", name="ck_order_items_price_kopecks_nonnegative"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    order_id = Column(Integer, ForeignKey("orders.id"), index=True)
+    pizza_name = Column(String)
+    quantity = Column(Integer, nullable=False)
+    price_kopecks = Column(Integer, nullable=False)
+
+    order = relationship("Order", back_populates="items")
+
+    @property
+    def price(self) -> float:
+        return to_rubles(self.price_kopecks)
+
+# Постраничная выдача истории заказов: WHERE user_id = ? AND id < ? ORDER BY id DESC
+Index("ix_orders_user_id_id_desc", Order.user_id, Order.id.desc())
+# Очередь кухни при старте и запасной захват: WHERE status = 'Готовится' ORDER BY created_at
+Index("ix_orders_status_created_at", Order.status, Order.created_at)
+
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    # sha256 от выданного клиенту токена
+    token = Column(String, unique=True, index=True)
+    expires_at = Column(DateTime, index=True)
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (UniqueConstraint("user_id", "key", name="uq_idempotency_keys_user_id_key"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    key = Column(String, nullable=False)
+    request_hash = Column(String, nullable=False)
+    response = Column(Text)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+class OrderStatusOutbox(Base):
+    # Смены статуса, которые бот ещё должен разослать подписчикам.
+    # Без внешнего ключа: запись переживает удаление заказа
+    __tablename__ = "order_status_outbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+    order_id = Column(Integer, nullable=False)
+    order_hash = Column(String, nullable=False)
+    status = Column(String, nullable=False)
+    created_at = Column(DateTime, nullable=False)
+    dispatched_at = Column(DateTime, index=True)
+    # Когда бот забрал строку на рассылку; просроченная отметка - бот упал, строку можно забрать снова
+    claimed_at = Column(DateTime)
+
+class OrderSubscription(Base):
+    # Чаты Telegram, которые спрашивали о заказе и получают смены его статуса
+    __tablename__ = "order_subscriptions"
+    __table_args__ = (UniqueConstraint("order_hash", "chat_id", name="uq_order_subscriptions_order_hash_chat_id"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    order_hash = Column(String, nullable=False, index=True)
+    chat_id = Column(BigInteger, nullable=False)
+
+class SalesHourlyPizza(Base):
+    # Продажи по часам (UTC) и пиццам. Обновляются вместе с заказами,
+    # отчёты читают эти строки вместо order_items
+    __tablename__ = "sales_hourly_pizza"
+
+    hour = Column(DateTime, primary_key=True)
+    pizza_name = Column(String, primary_key=True)
+    quantity = Column(BigInteger, nullable=False)
+    revenue_kopecks = Column(BigInteger, nullable=False)
+
+class SalesHourly(Base):
+    # Число заказов и выручка по часам - для среднего чека
+    __tablename__ = "sales_hourly"
+
+    hour = Column(DateTime, primary_key=True)
+    orders = Column(BigInteger, nullable=False)
+    revenue_kopecks = Column(BigInteger, nullable=False)
\ No newline at end of file